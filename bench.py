@@ -0,0 +1,426 @@
+# Benchmarks hors ligne (aucun acces reseau, base et fichiers dans un dossier temporaire)
+#   python bench.py memoire [--membres 100000] [--actifs 0.01] [--staff 0.002]
+#   python bench.py raid [--scenario salons|bans|roles|liens|flood|webhooks|invitations] [--attaquants 5] [--actions 5] [--un-par-un]
+#     Attaquants simultanes (defaut) : salons, bans, roles et flood sanctionnent en general 1 attaquant
+#     sur 5 et finissent sur le timeout de 30s. Les handlers attribuent par audit_logs(limit=1), et
+#     sous des attaques concurrentes la derniere entree est souvent celle d'un autre attaquant. Ce
+#     n'est pas une regression. --un-par-un lance les attaquants l'un apres l'autre : chacun doit
+#     etre sanctionne. invitations compte les arrivees par invitation (limite 10/10s) : il faut
+#     --actions 10 ou plus, sinon 0 sanction est le resultat attendu.
+#   python bench.py nettoyage [--salons 200] [--latence 0.1] [--sequentiel]
+#   python bench.py voix [--membres 200] [--departs 5] [--decos 6]
+#   python bench.py seuils [--fichier logs/incidents.jsonl ...] [--attaquants id,id]   (RECORD_ACTIONS=1)
+#   python bench.py seuils --synthetique [--jours 3]
+import os
+import sys
+import gc
+import time
+import asyncio
+import glob
+import gzip
+import json
+import random
+import argparse
+import tempfile
+import tracemalloc
+from collections import Counter
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+CWD = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="bench_"))
+
+import discord
+import main
+from fakediscord import FakeDiscord
+
+GUILD_ID = 1
+
+def fake_guild(state, n_roles=3):
+    roles = [{'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0,
+              'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}]
+    roles.append({'id': '2', 'name': 'staff', 'permissions': str(main.STAFF_PERMS), 'position': 1,
+                  'color': 0, 'hoist': False, 'managed': False, 'mentionable': False})
+    for r in range(n_roles):
+        roles.append({'id': str(10 + r), 'name': f'role{r}', 'permissions': '0', 'position': 2 + r,
+                      'color': 0, 'hoist': False, 'managed': False, 'mentionable': False})
+    g = discord.Guild(data={'id': str(GUILD_ID), 'name': 'bench', 'roles': roles, 'owner_id': '1',
+                            'member_count': 0}, state=state)
+    state._add_guild(g)
+    return g
+
+def fake_member(g, state, uid, staff):
+    data = {'user': {'id': str(uid), 'username': f'user{uid}', 'discriminator': '0', 'avatar': None,
+                     'global_name': f'User {uid}'},
+            'roles': ['2'] if staff else [str(10 + uid % 3)], 'joined_at': '2024-01-01T00:00:00+00:00',
+            'deaf': False, 'mute': False, 'nick': None, 'flags': 0}
+    return discord.Member(data=data, guild=g, state=state)
+
+def mesure():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+async def bench_memoire(n, actifs, staff):
+    state = main.bot._connection
+    tracemalloc.start()
+    base = mesure()
+    g = fake_guild(state)
+    membres = []
+    for uid in range(100, 100 + n):
+        m = fake_member(g, state, uid, uid % int(1 / staff) == 0 if staff else False)
+        g._add_member(m)
+        membres.append(m)
+    cache = main.MemberCache(main.bot, 'lean')
+    t0 = time.monotonic()
+    for m in membres[::int(1 / actifs)] if actifs else []:
+        cache.actifs[(g.id, m.id)] = t0
+    del membres, m
+    full = mesure() - base
+    n_full = len(g.members)
+    t = time.perf_counter()
+    cache.purger()
+    purge = time.perf_counter() - t
+    lean = mesure() - base
+    tracemalloc.stop()
+    print(f"membres synthetiques : {n} (actifs {actifs:.1%}, staff {staff:.1%})")
+    print(f"full : {n_full:>8} en cache  {full / 2**20:8.1f} Mo")
+    print(f"lean : {len(g.members):>8} en cache  {lean / 2**20:8.1f} Mo  (purge {purge*1000:.0f} ms)")
+    print(f"gain : {100 * (1 - lean / full):.1f}%")
+
+# Scenarios : (modules actives, punitions forcees, une attaque par attaquant)
+async def raid_salons(fd, gid, a, n, pause):
+    for k in range(n):
+        await fd.creer_salon(gid, a, f"raid-{a % 1000}-{k}")
+        await asyncio.sleep(pause)
+
+async def raid_bans(fd, gid, a, n, pause):
+    g = fd.guilds[gid]
+    victimes = [u for u in list(g['membres']) if u not in fd.attaquants and u != g['owner_id']
+                and u != int(fd.bot['id'])][a % 7::7][:n]
+    for v in victimes:
+        await fd.bannir(gid, a, v)
+        await asyncio.sleep(pause)
+
+async def raid_roles(fd, gid, a, n, pause):
+    for k in range(n):
+        await fd.creer_role(gid, a, f"raid-{a % 1000}-{k}", permissions=8)
+        await asyncio.sleep(pause)
+
+async def raid_webhooks(fd, gid, a, n, pause):
+    g = fd.guilds[gid]
+    cid = list(g['salons'])[a % len(g['salons'])]
+    for k in range(n):
+        await fd.creer_webhook(gid, a, cid, f"raid-{a % 1000}-{k}")
+        await asyncio.sleep(pause)
+
+async def raid_liens(fd, gid, a, n, pause):
+    cid = next(iter(fd.guilds[gid]['salons']))
+    for k in range(n):
+        if a not in fd.guilds[gid]['membres']: return
+        await fd.message(gid, cid, a, f"rejoignez discord.gg/raid{k}")
+        await asyncio.sleep(pause)
+
+async def raid_flood(fd, gid, a, n, pause, spammeurs=20, messages=200):
+    # Suppression de salons noyee dans un flot de messages (liens) d'autres comptes
+    g = fd.guilds[gid]
+    cid = next(iter(g['salons']))
+    rang = sorted(fd.attaquants).index(a)
+    # Par nom : les salons deja supprimes par les attaquants precedents ne decalent pas la tranche
+    noms = {f"cible-{k}" for k in range(rang * n, (rang + 1) * n)}
+    salons = [c for c in g['salons'] if g['salons'][c]['name'] in noms]
+    ids = [fd.snowflake() for _ in range(spammeurs)]
+    for u in ids: fd.membre(g, u)
+    async def spam(u):
+        for k in range(messages):
+            if u not in g['membres']: return
+            await fd.message(gid, cid, u, f"spam {k} discord.gg/flood{k}")
+            if k % 20 == 0: await asyncio.sleep(0)
+    async def nuke():
+        await asyncio.sleep(0.05)
+        for c in salons:
+            await fd.supprimer_salon(gid, a, c)
+            await asyncio.sleep(pause)
+    await asyncio.gather(nuke(), *(spam(u) for u in ids))
+
+async def raid_invitations(fd, gid, a, n, pause, legitimes=3):
+    # L'attaquant cree une invitation et y fait entrer une vague de comptes, pendant que des
+    # arrivees normales passent par l'invitation du proprietaire
+    g = fd.guilds[gid]
+    cid = next(iter(g['salons']))
+    fd.attaque(a)
+    code = (await fd.creer_invitation(gid, a, cid))['code']
+    normale = next((c for c,i in g['invites'].items() if int(i['inviter']['id']) == g['owner_id']), None)
+    if normale is None: normale = (await fd.creer_invitation(gid, g['owner_id'], cid))['code']
+    for k in range(n):
+        if code not in g['invites']: break
+        await fd.rejoindre(gid, fd.snowflake(), code)
+        # Attaquants l'un apres l'autre : les arrivees normales cumulees peuvent aussi depasser la limite
+        if k < legitimes and normale in g['invites']: await fd.rejoindre(gid, fd.snowflake(), normale)
+        await asyncio.sleep(pause)
+
+SCENARIOS = {
+    'salons': (['antichannel'], {}, raid_salons),
+    'bans': (['antiban'], {}, raid_bans),
+    'roles': (['antirank'], {}, raid_roles),
+    'liens': (['antilink'], {'antilink': 'kick'}, raid_liens),
+    'webhooks': (['antiwebhook'], {}, raid_webhooks),
+    'invitations': (['antiraid'], {'antiraid': 'kick'}, raid_invitations),
+    'flood': (['antichannel', 'antilink'], {}, raid_flood),
+}
+
+def centile(xs, p):
+    return xs[min(len(xs) - 1, int(p * len(xs)))]
+
+async def demarrer(mods, puns, attaquants, actions, limite, fenetre, victimes, latence=0.0):
+    # Faux Discord peuple (attaquants moderateurs, victimes, salons cibles) et bot connecte
+    fd = await FakeDiscord(limite=limite, fenetre=fenetre, latence=latence).start()
+    owner = fd.snowflake()
+    gid = fd.creer_guild(owner)
+    g = fd.guilds[gid]
+    modo = fd.snowflake()
+    g['roles'][modo] = fd.role(modo, "moderateur", 2, permissions=int(main.STAFF_PERMS))
+    ids = [fd.snowflake() for _ in range(attaquants)]
+    fd.attaquants.update(ids)
+    for a in ids: fd.membre(g, a, [modo])
+    for _ in range(victimes): fd.membre(g, fd.snowflake())
+    for k in range(attaquants * actions): fd.salon(g, f"cible-{k}")
+
+    b = main.bot
+    for P in main.PROTECTIONS: b.db.set_module_status(P.key, int(P.key in mods))
+    for k, s in puns.items(): b.db.c.execute('UPDATE punishments SET sanction=? WHERE action=?', (s, k))
+    b.db.conn.commit()
+    b._connection._intents = main.intents_requis(b.db.get_modules())
+    b._connection.guild_ready_timeout = 0.1
+    asyncio.create_task(b.start("fake-token"))
+    await asyncio.wait_for(b.wait_until_ready(), 30)
+    return fd, gid, ids, b
+
+async def arreter(fd, b):
+    await b.close()
+    await fd.stop()
+    # Taches du bot encore en attente (purges differees, avertissements...)
+    for t in asyncio.all_tasks() - {asyncio.current_task()}: t.cancel()
+
+async def bench_raid(scenario, attaquants, actions, pause, limite, fenetre, victimes, sans_file=False, latence=0.0,
+                     un_par_un=False):
+    mods, puns, attaque = SCENARIOS[scenario]
+    if sans_file: main.PRIORITES.clear()
+    fd, gid, ids, b = await demarrer(mods, puns, attaquants, actions, limite, fenetre, victimes, latence)
+    t0 = time.perf_counter()
+    if un_par_un:
+        # Un attaquant a la fois, le suivant quand le precedent est sanctionne (10s max)
+        for a in ids:
+            await attaque(fd, gid, a, actions, pause)
+            fin = time.monotonic() + 10
+            while a not in fd.sanctions and time.monotonic() < fin: await asyncio.sleep(0.05)
+    else:
+        await asyncio.gather(*(attaque(fd, gid, a, actions, pause) for a in ids))
+    await fd.attendre()
+    duree = time.perf_counter() - t0
+    lat = fd.latences()
+    print(f"scenario {scenario} : {attaquants} attaquants x {actions} actions, limite {limite}/{fenetre:g}s"
+          + (" (un par un)" if un_par_un else ""))
+    print(f"sanctionnes : {len(lat)}/{attaquants} en {duree:.2f}s")
+    if len(lat) < attaquants and not un_par_un:
+        print("  attendu en simultane : audit_logs(limit=1) attribue souvent l'action a un autre attaquant "
+              "(voir --un-par-un)")
+    if lat:
+        print(f"attaque -> sanction : p50 {centile(lat, .5)*1000:.0f} ms  p95 {centile(lat, .95)*1000:.0f} ms  max {lat[-1]*1000:.0f} ms")
+    sc = b.scheduler
+    print(f"file d'evenements : max {sc.max}, jetes {sum(sc.jetes.values())} {dict(sc.jetes)}")
+    print(f"requetes REST : {sum(fd.requetes.values())}  (429 : {fd.refus}, annulations : {len(fd.reverts)}, auto-sanctions refusees : {fd.auto})")
+    for (m, r), n in fd.requetes.most_common(6):
+        print(f"  {n:>5}  {m} {r}")
+    await arreter(fd, b)
+
+async def bench_nettoyage(salons, limite, fenetre, latence, sequentiel):
+    # Un attaquant cree `salons` salons (antichannel desactive, rien n'est supprime au fil
+    # de l'eau), puis bannit un membre : l'antiban le sanctionne et le nettoyage supprime
+    # tout ce qu'il a cree. Mesure : sanction -> dernier salon supprime.
+    fd, gid, (a,), b = await demarrer(['antiban'], {}, 1, 0, limite, fenetre, 5, latence)
+    g = fd.guilds[gid]
+    if sequentiel:
+        async def nettoyer(guild, uid):
+            for typ, oid in b.creations.prendre(guild.id, uid):
+                c = guild.get_channel(oid)
+                if c: await c.delete()
+        b.nettoyer = nettoyer
+    crees = [int((await fd.creer_salon(gid, a, f"spam-{k}"))['id']) for k in range(salons)]
+    await asyncio.sleep(0.5)
+    victime = next(u for u in g['membres'] if u not in (a, g['owner_id'], int(fd.bot['id'])))
+    await fd.bannir(gid, a, victime)
+    await fd.attendre()
+    limite_t = time.perf_counter() + 120
+    while any(c in g['salons'] for c in crees) and time.perf_counter() < limite_t:
+        await asyncio.sleep(0.01)
+    fin = time.perf_counter()
+    t, typ = fd.sanctions[a]
+    restants = sum(c in g['salons'] for c in crees)
+    if restants: print(f"{restants} salons non supprimes apres 120s")
+    print(f"nettoyage {'sequentiel' if sequentiel else 'parallele'} : {salons} salons, latence REST {latence*1000:.0f} ms, "
+          f"limite {limite}/{fenetre:g}s par bucket")
+    print(f"sanction ({typ}) -> dernier salon supprime : {fin - t:.2f}s  ({salons / (fin - t):.0f} suppressions/s, 429 : {fd.refus})")
+    await arreter(fd, b)
+
+async def bench_voix(membres, departs, decos, limite, fenetre):
+    # Va-et-vient vocal spontane de `membres` membres, avec un moderateur qui deconnecte
+    # `decos` d'entre eux au milieu : lectures du journal d'audit et detection du moderateur
+    fd, gid, (modo,), b = await demarrer(['antideco'], {'antideco': 'derank'}, 1, 0, limite, fenetre, membres)
+    g = fd.guilds[gid]
+    salons = []
+    for k in range(2):
+        c = fd.salon(g, f"vocal-{k}", type=2, bitrate=64000, user_limit=0)
+        await fd.dispatch('CHANNEL_CREATE', c)
+        salons.append(int(c['id']))
+    ids = [u for u in g['membres'] if u not in (modo, g['owner_id'], int(fd.bot['id']))]
+    for u in ids: await fd.rejoindre_vocal(gid, u, salons[0])
+    await asyncio.sleep(0.5)
+    route = ('GET', r'/guilds/(\d+)/audit-logs$')
+    avant = fd.requetes[route]
+    evts = 0
+    t0 = time.perf_counter()
+    for tour in range(departs):
+        for k, u in enumerate(ids):
+            if u not in g['voix']:
+                await fd.rejoindre_vocal(gid, u, salons[tour % 2])
+                continue
+            if tour == departs // 2 and k < decos:
+                await fd.deconnecter(gid, modo, u)
+            elif k % 2: await fd.quitter_vocal(gid, u)
+            else: await fd.rejoindre_vocal(gid, u, salons[(tour + 1) % 2])
+            evts += 1
+            if k % 20 == 0: await asyncio.sleep(0)
+    await fd.attendre(10)
+    await asyncio.sleep(0.5)
+    lectures = fd.requetes[route] - avant
+    print(f"voix : {len(ids)} membres x {departs} tours, {evts} departs/changements dont {decos} deconnexions par un moderateur")
+    print(f"lectures du journal d'audit : {lectures}  (avant : 1 a 2 par depart, soit >= {evts})")
+    print(f"moderateur sanctionne : {'oui' if modo in fd.sanctions else 'non'}  en {time.perf_counter() - t0:.2f}s")
+    await arreter(fd, b)
+
+# Evaluation hors ligne des seuils : rejoue des actions enregistrees (ou synthetiques)
+# dans les detecteurs fixe / adaptatif / mixte, comme Protection.compter
+def lire_actions(fichiers):
+    evts = []
+    for f in fichiers:
+        op = gzip.open if f.endswith(".gz") else open
+        with op(f, "rt", encoding="utf-8") as fh:
+            for ligne in fh:
+                r = json.loads(ligne)
+                if r.get('niveau') == 'action':
+                    evts.append((r['ts'], r['guild'], r['user'], r['handler'], r['limite'], r['duree'], None))
+    return evts
+
+def synthetique(jours, seed=1):
+    # Deux profils de serveur sur 'channel_create' (limite 2/10s) : un petit serveur calme,
+    # un grand serveur dont les moderateurs creent souvent plusieurs salons d'affilee.
+    # Un attaquant par serveur enchaine 10 creations (0.2-1s) au milieu de la periode.
+    rnd = random.Random(seed)
+    evts = []
+    profils = {1: ('petit', 3, 4 * 3600, 1.2), 2: ('grand', 30, 1800, 3.5)}
+    for gid, (_, mods, intervalle, rafale) in profils.items():
+        for mod in range(mods):
+            uid = gid * 1000 + mod
+            t = rnd.uniform(0, intervalle)
+            while t < jours * 86400:
+                k = 1 + int(rnd.expovariate(1 / (rafale - 1))) if rafale > 1 else 1
+                for _ in range(k):
+                    evts.append((t, gid, uid, 'channel_create', 2, '10s', False))
+                    t += rnd.uniform(1, 4)
+                t += rnd.expovariate(1 / intervalle)
+        t = jours * 86400 / 2
+        for _ in range(10):
+            evts.append((t, gid, gid * 1000 + 999, 'channel_create', 2, '10s', True))
+            t += rnd.uniform(0.2, 1)
+    return evts, {g: p[0] for g, p in profils.items()}
+
+def evaluer(evts, attaquants):
+    evts.sort(key=lambda e: e[0])
+    res = {}
+    for mode in ('fixe', 'adaptatif', 'mixte'):
+        tracker, base = main.ActionTracker(), main.Baseline()
+        flags, premiers, rangs = Counter(), {}, {}
+        for ts, gid, uid, track, n, d, label in evts:
+            tracker.add_action(uid, track, ts)
+            rangs[(gid, uid)] = rangs.get((gid, uid), 0) + 1
+            cnt = tracker.get_recent_actions(uid, track, main.parse_duration(d).total_seconds(), ts)
+            fixe = bool(n) and cnt >= n
+            appris = base.pret((gid, track))
+            anormal = base.observer((gid, track), cnt)
+            hit = fixe or anormal if mode == 'mixte' else anormal if mode == 'adaptatif' and appris else fixe
+            if hit:
+                flags[(gid, uid)] += 1
+                premiers.setdefault((gid, uid), rangs[(gid, uid)])
+        res[mode] = (flags, premiers, base)
+    return res
+
+def bench_seuils(fichiers, attaquants, synth, jours):
+    if synth:
+        evts, noms = synthetique(jours)
+        attaquants = {(e[1], e[2]) for e in evts if e[6]}
+    else:
+        evts, noms = lire_actions(fichiers), {}
+        attaquants = {(e[1], e[2]) for e in evts if e[2] in attaquants}
+    print(f"{len(evts)} actions, {len({e[1] for e in evts})} serveur(s), {len(attaquants)} attaquant(s) etiquete(s)")
+    res = evaluer(evts, attaquants)
+    for gid in sorted({e[1] for e in evts}):
+        acteurs = {e[2] for e in evts if e[1] == gid}
+        print(f"\nserveur {noms.get(gid, gid)} : {sum(1 for e in evts if e[1] == gid)} actions, {len(acteurs)} acteurs")
+        for mode, (flags, premiers, base) in res.items():
+            fp = [k for k in flags if k[0] == gid and k not in attaquants]
+            vp = [k for k in flags if k[0] == gid and k in attaquants]
+            att = [k for k in attaquants if k[0] == gid]
+            delai = ", ".join(f"{premiers[k]}e action" for k in vp) or "-"
+            print(f"  {mode:<10} faux positifs : {len(fp):>3} acteurs / {sum(flags[k] for k in fp):>4} actions"
+                  f"   attaquants detectes : {len(vp)}/{len(att)} ({delai})")
+        for (g, track), (m, v, n) in res['adaptatif'][2].stats.items():
+            if g == gid: print(f"  niveau appris {track} : moyenne {m:.2f}, ecart-type {v ** .5:.2f} sur {n} actions")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("memoire", help="memoire du cache de membres, full vs lean")
+    m.add_argument("--membres", type=int, default=100000)
+    m.add_argument("--actifs", type=float, default=0.01)
+    m.add_argument("--staff", type=float, default=0.002)
+    r = sub.add_parser("raid", help="raid scripte contre un faux Discord local, attaque -> sanction")
+    r.add_argument("--scenario", choices=sorted(SCENARIOS), default="salons")
+    r.add_argument("--attaquants", type=int, default=5)
+    r.add_argument("--actions", type=int, default=5)
+    r.add_argument("--pause", type=float, default=0.05, help="secondes entre deux actions d'un attaquant")
+    r.add_argument("--limite", type=int, default=5, help="requetes par bucket et par fenetre")
+    r.add_argument("--fenetre", type=float, default=5.0)
+    r.add_argument("--victimes", type=int, default=50)
+    r.add_argument("--sans-file", action="store_true", help="une tache par handler, comme discord.py")
+    r.add_argument("--latence", type=float, default=0.0, help="latence simulee de chaque requete REST (s)")
+    r.add_argument("--un-par-un", action="store_true", help="attaquants l'un apres l'autre (mesure des sanctions)")
+    e = sub.add_parser("seuils", help="evaluation hors ligne des seuils fixes / adaptatifs / mixtes")
+    e.add_argument("--fichier", nargs="*", default=None, help="journaux (jsonl, jsonl.gz) enregistres avec RECORD_ACTIONS=1")
+    e.add_argument("--attaquants", default="", help="ids des attaquants connus, separes par des virgules")
+    e.add_argument("--synthetique", action="store_true")
+    e.add_argument("--jours", type=float, default=3)
+    n = sub.add_parser("nettoyage", help="suppression des salons crees par un attaquant sanctionne")
+    n.add_argument("--salons", type=int, default=200)
+    n.add_argument("--latence", type=float, default=0.1, help="latence simulee de chaque requete REST (s)")
+    n.add_argument("--limite", type=int, default=5)
+    n.add_argument("--fenetre", type=float, default=5.0)
+    n.add_argument("--sequentiel", action="store_true", help="reference : une suppression apres l'autre")
+    v = sub.add_parser("voix", help="va-et-vient vocal spontane et deconnexions par un moderateur")
+    v.add_argument("--membres", type=int, default=200)
+    v.add_argument("--departs", type=int, default=5, help="tours de va-et-vient par membre")
+    v.add_argument("--decos", type=int, default=6, help="membres deconnectes par le moderateur")
+    v.add_argument("--limite", type=int, default=5)
+    v.add_argument("--fenetre", type=float, default=5.0)
+    a = ap.parse_args()
+    if a.cmd == "memoire":
+        asyncio.run(bench_memoire(a.membres, a.actifs, a.staff))
+    elif a.cmd == "seuils":
+        fichiers = [os.path.join(CWD, f) for f in a.fichier] if a.fichier else sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "incidents.jsonl*")))
+        bench_seuils(fichiers, {int(x) for x in a.attaquants.split(",") if x}, a.synthetique, a.jours)
+    elif a.cmd == "raid":
+        asyncio.run(bench_raid(a.scenario, a.attaquants, a.actions, a.pause, a.limite, a.fenetre, a.victimes, a.sans_file, a.latence,
+                               a.un_par_un))
+    elif a.cmd == "nettoyage":
+        asyncio.run(bench_nettoyage(a.salons, a.limite, a.fenetre, a.latence, a.sequentiel))
+    elif a.cmd == "voix":
+        asyncio.run(bench_voix(a.membres, a.departs, a.decos, a.limite, a.fenetre))
@@ -3,6 +3,10 @@ import os
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")  # Récupère la variable Railway
 OWNER_IDS = [497126437258788864]
+MEMBER_CACHE = os.getenv("MEMBER_CACHE", "full")  # full = tous les membres en cache, lean = actifs/staff/wl seulement
+RECORD_ACTIONS = os.getenv("RECORD_ACTIONS") == "1"  # enregistre chaque action comptee dans le journal (evaluation des seuils)
+INCIDENTS_RETENTION = int(os.getenv("INCIDENTS_RETENTION", "90"))  # jours d'incidents detailles, resumes par jour au-dela
+BACKUP_INTERVAL = int(os.getenv("BACKUP_INTERVAL", "21600"))  # secondes entre deux verifications de la sauvegarde d'un serveur
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN non défini - Vérifie les variables Railway")
\ No newline at end of file
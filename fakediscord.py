@@ -0,0 +1,647 @@
+# Faux Discord local : gateway WebSocket + API REST, juste assez pour que SecurityBot
+# se connecte, recoive les evenements d'un serveur et sanctionne, sans acces reseau.
+#   fd = FakeDiscord(); await fd.start()     # redirige discord.py vers le serveur local
+#   g = fd.creer_guild(owner_id)             # puis ajouter_membre / creer_salon / bannir ...
+# Chaque action (script ou requete REST du bot) suit le meme chemin : etat, entree
+# d'audit, evenement gateway. Les limites de debit renvoient les vrais en-tetes.
+import re
+import json
+import time
+import asyncio
+import hashlib
+import itertools
+from collections import Counter
+from datetime import datetime, timezone
+
+import yarl
+import discord
+from aiohttp import web
+
+EPOCH = 1420070400000
+A = discord.AuditLogAction
+
+# Intents requis par evenement (un client ne recoit que ceux qu'il a demandes)
+I = discord.Intents.VALID_FLAGS
+INTENTS = {
+    'GUILD_UPDATE': I['guilds'], 'CHANNEL_CREATE': I['guilds'], 'CHANNEL_UPDATE': I['guilds'],
+    'CHANNEL_DELETE': I['guilds'], 'GUILD_ROLE_CREATE': I['guilds'], 'GUILD_ROLE_UPDATE': I['guilds'],
+    'GUILD_ROLE_DELETE': I['guilds'], 'GUILD_MEMBER_ADD': I['members'], 'GUILD_MEMBER_UPDATE': I['members'],
+    'GUILD_MEMBER_REMOVE': I['members'], 'GUILD_BAN_ADD': I['moderation'], 'GUILD_BAN_REMOVE': I['moderation'],
+    'GUILD_AUDIT_LOG_ENTRY_CREATE': I['moderation'], 'MESSAGE_CREATE': I['guild_messages'],
+    'VOICE_STATE_UPDATE': I['voice_states'], 'WEBHOOKS_UPDATE': I['webhooks'],
+    'INVITE_CREATE': I['invites'], 'INVITE_DELETE': I['invites'],
+}
+
+def maintenant():
+    return datetime.now(timezone.utc).isoformat()
+
+def reponse(data, status=200, headers=None):
+    # discord.py compare le Content-Type exactement (sans charset)
+    h = {'Content-Type': 'application/json', **(headers or {})}
+    return web.Response(body=json.dumps(data).encode(), status=status, headers=h)
+
+class Fenetre:
+    # Limite a fenetre fixe, comme un bucket Discord : `limite` requetes par `duree` secondes
+    def __init__(self, limite, duree):
+        self.limite, self.duree = limite, duree
+        self.n, self.reset = 0, 0.0
+
+    def prendre(self, now):
+        if now >= self.reset:
+            self.n, self.reset = 0, now + self.duree
+        if self.n >= self.limite: return False
+        self.n += 1
+        return True
+
+class Refus(Exception):
+    def __init__(self, status, message, code=0):
+        self.status, self.message, self.code = status, message, code
+
+class FakeDiscord:
+    def __init__(self, host="127.0.0.1", port=0, limite=5, fenetre=5.0, limite_globale=50, latence=0.0):
+        self.host, self.port = host, port
+        self.latence = latence             # delai ajoute a chaque requete REST (aller-retour reel)
+        self.limite, self.fenetre = limite, fenetre
+        self.globale = Fenetre(limite_globale, 1.0)
+        self.buckets = {}
+        self.ids = itertools.count()
+        self.users = {}
+        self.guilds = {}
+        self.sockets = {}                  # ws -> intents
+        self.seq = 0
+        self.bot = self.user(self.snowflake(), "SecurityBot", bot=True)
+        self.requetes = Counter()          # (methode, route) -> nombre
+        self.refus = 0                     # reponses 429
+        self.debut = {}                    # attaquant -> premier evenement d'attaque (perf_counter)
+        self.sanctions = {}                # attaquant -> (instant, sanction)
+        self.reverts = []                  # instants des annulations faites par le bot
+        self.auto = 0                      # sanctions que le bot a tente de s'appliquer
+        self.attaquants = set()
+        self.routes = [(m, re.compile(p + "$"), f) for m,p,f in (
+            ('GET', r'/users/@me', self.r_moi),
+            ('GET', r'/oauth2/applications/@me', self.r_application),
+            ('GET', r'/gateway/bot', self.r_gateway),
+            ('GET', r'/applications/(\d+)/commands', lambda *a: []),
+            ('PUT', r'/applications/(\d+)/commands', self.r_commandes),
+            ('GET', r'/users/(\d+)', self.r_user),
+            ('POST', r'/users/@me/channels', self.r_dm),
+            ('GET', r'/guilds/(\d+)/audit-logs', self.r_audit),
+            ('PUT', r'/guilds/(\d+)/bans/(\d+)', self.r_ban),
+            ('DELETE', r'/guilds/(\d+)/bans/(\d+)', self.r_unban),
+            ('GET', r'/guilds/(\d+)/members/(\d+)', self.r_membre),
+            ('PATCH', r'/guilds/(\d+)/members/(\d+)', self.r_edit_membre),
+            ('DELETE', r'/guilds/(\d+)/members/(\d+)', self.r_kick),
+            ('PUT', r'/guilds/(\d+)/members/(\d+)/roles/(\d+)', self.r_ajout_role),
+            ('DELETE', r'/guilds/(\d+)/members/(\d+)/roles/(\d+)', self.r_retrait_role),
+            ('PATCH', r'/guilds/(\d+)/roles/(\d+)', self.r_edit_role),
+            ('DELETE', r'/guilds/(\d+)/roles/(\d+)', self.r_suppr_role),
+            ('PATCH', r'/guilds/(\d+)', self.r_edit_guild),
+            ('PATCH', r'/channels/(\d+)', self.r_edit_salon),
+            ('DELETE', r'/channels/(\d+)', self.r_suppr_salon),
+            ('POST', r'/channels/(\d+)/messages', self.r_message),
+            ('PATCH', r'/channels/(\d+)/messages/(\d+)', self.r_edit_message),
+            ('DELETE', r'/channels/(\d+)/messages/(\d+)', lambda *a: None),
+            ('POST', r'/channels/(\d+)/messages/bulk-delete', lambda *a: None),
+            ('POST', r'/channels/(\d+)/invites', self.r_invite),
+            ('GET', r'/guilds/(\d+)/invites', lambda req, body, gid: list(self.guilds[gid]['invites'].values())),
+            ('DELETE', r'/invites/(\w+)', self.r_suppr_invite),
+            ('GET', r'/channels/(\d+)/webhooks', self.r_webhooks_salon),
+            ('GET', r'/guilds/(\d+)/webhooks', lambda req, body, gid: list(self.guilds[gid]['webhooks'].values())),
+            ('DELETE', r'/webhooks/(\d+)', self.r_suppr_webhook),
+        )]
+
+    # --- Serveur
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/', self.gateway)
+        app.router.add_route('*', '/api/v10/{route:.*}', self.rest)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        discord.http.Route.BASE = f"http://{self.host}:{self.port}/api/v10"
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(f"ws://{self.host}:{self.port}/")
+        return self
+
+    async def stop(self):
+        for ws in list(self.sockets): await ws.close()
+        await self.runner.cleanup()
+
+    # --- Modele
+
+    def snowflake(self):
+        return ((int(time.time() * 1000) - EPOCH) << 22) | (next(self.ids) & 0x3FFFFF)
+
+    def user(self, uid, nom, bot=False):
+        u = {'id': str(uid), 'username': nom, 'discriminator': '0', 'global_name': nom,
+             'avatar': None, 'bot': bot, 'public_flags': 0}
+        self.users[uid] = u
+        return u
+
+    def creer_guild(self, owner_id, nom="raid-test"):
+        gid = self.snowflake()
+        g = {'id': gid, 'nom': nom, 'owner_id': owner_id, 'roles': {}, 'salons': {}, 'membres': {},
+             'bans': set(), 'audit': [], 'webhooks': {}, 'invites': {}, 'voix': {}, 'verification_level': 0}
+        self.guilds[gid] = g
+        g['roles'][gid] = self.role(gid, "@everyone", 0)
+        admin = self.snowflake()
+        g['roles'][admin] = self.role(admin, "SecurityBot", 1, permissions=8, managed=True)
+        self.salon(g, "general")
+        self.membre(g, owner_id)
+        self.membre(g, int(self.bot['id']), [admin])
+        return gid
+
+    def role(self, rid, nom, position, permissions=0, managed=False):
+        return {'id': str(rid), 'name': nom, 'permissions': str(permissions), 'position': position,
+                'color': 0, 'hoist': False, 'managed': managed, 'mentionable': False, 'flags': 0}
+
+    def salon(self, g, nom, **champs):
+        cid = self.snowflake()
+        c = {'id': str(cid), 'type': 0, 'name': nom, 'position': len(g['salons']), 'guild_id': str(g['id']),
+             'permission_overwrites': [], 'parent_id': None, 'topic': None, 'nsfw': False,
+             'last_message_id': None, 'rate_limit_per_user': 0, **champs}
+        g['salons'][cid] = c
+        return c
+
+    def webhook(self, g, cid, createur, nom):
+        wid = self.snowflake()
+        w = {'id': str(wid), 'type': 1, 'guild_id': str(g['id']), 'channel_id': str(cid), 'name': nom,
+             'avatar': None, 'token': hashlib.md5(str(wid).encode()).hexdigest(), 'application_id': None,
+             'user': self.users[createur]}
+        g['webhooks'][wid] = w
+        return w
+
+    def invitation(self, g, cid, createur, max_uses=0, max_age=0):
+        code = "i" + hashlib.md5(str(self.snowflake()).encode()).hexdigest()[:7]
+        inv = {'code': code, 'type': 0, 'guild': {'id': str(g['id']), 'name': g['nom'], 'features': []},
+               'channel': g['salons'][cid], 'inviter': self.users[createur], 'max_age': max_age,
+               'max_uses': max_uses, 'uses': 0, 'temporary': False, 'created_at': maintenant()}
+        g['invites'][code] = inv
+        return inv
+
+    def membre(self, g, uid, roles=()):
+        if uid not in self.users: self.user(uid, f"user{uid}")
+        m = {'user': self.users[uid], 'roles': [str(r) for r in roles], 'joined_at': maintenant(),
+             'deaf': False, 'mute': False, 'flags': 0, 'nick': None, 'pending': False,
+             'communication_disabled_until': None, 'premium_since': None, 'avatar': None}
+        g['membres'][uid] = m
+        return m
+
+    def base_guild(self, g):
+        return {'id': str(g['id']), 'name': g['nom'], 'icon': None, 'banner': None, 'splash': None,
+                'discovery_splash': None, 'owner_id': str(g['owner_id']), 'afk_channel_id': None,
+                'afk_timeout': 300, 'verification_level': g['verification_level'],
+                'default_message_notifications': 0, 'explicit_content_filter': 0, 'mfa_level': 0,
+                'system_channel_id': None, 'system_channel_flags': 0, 'rules_channel_id': None,
+                'public_updates_channel_id': None, 'vanity_url_code': None, 'description': None,
+                'premium_tier': 0, 'preferred_locale': 'fr', 'nsfw_level': 0, 'features': [],
+                'premium_progress_bar_enabled': False, 'emojis': [], 'stickers': [],
+                'roles': list(g['roles'].values())}
+
+    def guild_create(self, g):
+        return {**self.base_guild(g), 'channels': list(g['salons'].values()),
+                'members': list(g['membres'].values()), 'member_count': len(g['membres']),
+                'large': False, 'unavailable': False, 'joined_at': maintenant(), 'voice_states': [],
+                'presences': [], 'threads': [], 'stage_instances': [], 'guild_scheduled_events': [],
+                'soundboard_sounds': []}
+
+    # --- Gateway
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': 41250}})
+        async for msg in ws:
+            data = json.loads(msg.data)
+            op, d = data.get('op'), data.get('d')
+            if op == 1:
+                await ws.send_json({'op': 11})
+            elif op == 2:
+                self.sockets[ws] = d.get('intents', 0)
+                await self.envoyer(ws, 'READY', {
+                    'v': 10, 'user': self.bot, 'session_id': hashlib.md5(str(id(ws)).encode()).hexdigest(),
+                    'resume_gateway_url': f"ws://{self.host}:{self.port}/", 'shard': [0, 1],
+                    'guilds': [{'id': str(gid), 'unavailable': True} for gid in self.guilds],
+                    'application': {'id': self.bot['id'], 'flags': 0}})
+                for g in self.guilds.values():
+                    await self.envoyer(ws, 'GUILD_CREATE', self.guild_create(g))
+            elif op == 6:
+                await ws.send_json({'op': 9, 'd': False})
+            elif op == 8:
+                g = self.guilds.get(int(d['guild_id']))
+                ids = {int(u) for u in d.get('user_ids') or ()}
+                ms = [m for uid,m in g['membres'].items() if not ids or uid in ids] if g else []
+                await self.envoyer(ws, 'GUILD_MEMBERS_CHUNK', {'guild_id': d['guild_id'], 'members': ms,
+                                   'chunk_index': 0, 'chunk_count': 1, 'nonce': d.get('nonce')})
+        self.sockets.pop(ws, None)
+        return ws
+
+    async def envoyer(self, ws, t, d):
+        self.seq += 1
+        await ws.send_str(json.dumps({'op': 0, 't': t, 's': self.seq, 'd': d}))
+
+    async def dispatch(self, t, d):
+        intent = INTENTS.get(t, 0)
+        for ws, intents in list(self.sockets.items()):
+            if intent and not intents & intent: continue
+            e = d
+            if t == 'MESSAGE_CREATE' and not intents & I['message_content']:
+                e = {**d, 'content': '', 'embeds': [], 'attachments': []}
+            try: await self.envoyer(ws, t, e)
+            except ConnectionError: self.sockets.pop(ws, None)
+
+    # --- Actions (scripts d'attaque et requetes du bot)
+
+    def attaque(self, acteur):
+        if acteur in self.attaquants: self.debut.setdefault(acteur, time.perf_counter())
+
+    async def audit(self, g, acteur, action, cible, changes=(), raison=None, options=None):
+        e = {'id': str(self.snowflake()), 'user_id': str(acteur), 'target_id': str(cible) if cible else None,
+             'action_type': action.value, 'changes': list(changes), 'reason': raison}
+        if options: e['options'] = options
+        g['audit'].append(e)
+        await self.dispatch('GUILD_AUDIT_LOG_ENTRY_CREATE', {**e, 'guild_id': str(g['id'])})
+
+    async def audit_groupe(self, g, acteur, action, options=None, fenetre=300):
+        # Comme Discord pour les deconnexions/deplacements : une action repetee par le meme
+        # moderateur incremente le count de son entree recente, sans nouvel evenement
+        for e in reversed(g['audit']):
+            age = time.time() - (((int(e['id']) >> 22) + EPOCH) / 1000)
+            if age > fenetre: break
+            if e['action_type'] == action.value and e['user_id'] == str(acteur):
+                e['options']['count'] = str(int(e['options']['count']) + 1)
+                return
+        await self.audit(g, acteur, action, None, options={**(options or {}), 'count': '1'})
+
+    async def creer_salon(self, gid, acteur, nom):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        c = self.salon(g, nom)
+        await self.audit(g, acteur, A.channel_create, c['id'])
+        await self.dispatch('CHANNEL_CREATE', c)
+        return c
+
+    async def supprimer_salon(self, gid, acteur, cid):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        c = g['salons'].pop(cid)
+        await self.audit(g, acteur, A.channel_delete, cid)
+        await self.dispatch('CHANNEL_DELETE', c)
+        return c
+
+    async def modifier_salon(self, gid, acteur, cid, **champs):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        c = g['salons'][cid]
+        c.update(champs)
+        await self.audit(g, acteur, A.channel_update, cid)
+        await self.dispatch('CHANNEL_UPDATE', c)
+        return c
+
+    async def creer_role(self, gid, acteur, nom, permissions=0):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        rid = self.snowflake()
+        r = g['roles'][rid] = self.role(rid, nom, len(g['roles']), permissions)
+        await self.audit(g, acteur, A.role_create, rid)
+        await self.dispatch('GUILD_ROLE_CREATE', {'guild_id': str(gid), 'role': r})
+        return r
+
+    async def supprimer_role(self, gid, acteur, rid):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        g['roles'].pop(rid)
+        for m in g['membres'].values():
+            if str(rid) in m['roles']: m['roles'].remove(str(rid))
+        await self.audit(g, acteur, A.role_delete, rid)
+        await self.dispatch('GUILD_ROLE_DELETE', {'guild_id': str(gid), 'role_id': str(rid)})
+
+    async def modifier_role(self, gid, acteur, rid, **champs):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        r = g['roles'][rid]
+        changes = [{'key': k, 'old_value': r.get(k), 'new_value': v} for k, v in champs.items() if r.get(k) != v]
+        r.update(champs)
+        await self.audit(g, acteur, A.role_update, rid, changes)
+        await self.dispatch('GUILD_ROLE_UPDATE', {'guild_id': str(gid), 'role': r})
+        return r
+
+    async def creer_webhook(self, gid, acteur, cid, nom):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        w = self.webhook(g, cid, acteur, nom)
+        await self.audit(g, acteur, A.webhook_create, w['id'])
+        await self.dispatch('WEBHOOKS_UPDATE', {'guild_id': str(gid), 'channel_id': str(cid)})
+        return w
+
+    async def supprimer_webhook(self, gid, acteur, wid):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        w = g['webhooks'].pop(wid)
+        await self.audit(g, acteur, A.webhook_delete, wid)
+        await self.dispatch('WEBHOOKS_UPDATE', {'guild_id': str(gid), 'channel_id': w['channel_id']})
+
+    async def creer_invitation(self, gid, acteur, cid, max_uses=0):
+        g = self.guilds[gid]
+        inv = self.invitation(g, cid, acteur, max_uses)
+        await self.audit(g, acteur, A.invite_create, None)
+        d = {k: v for k,v in inv.items() if k not in ('guild', 'channel')}
+        await self.dispatch('INVITE_CREATE', {**d, 'guild_id': str(gid), 'channel_id': str(cid)})
+        return inv
+
+    async def supprimer_invitation(self, gid, acteur, code):
+        g = self.guilds[gid]
+        inv = g['invites'].pop(code)
+        await self.audit(g, acteur, A.invite_delete, None)
+        await self.dispatch('INVITE_DELETE', {'guild_id': str(gid), 'channel_id': inv['channel']['id'], 'code': code})
+
+    async def rejoindre(self, gid, uid, code):
+        # Arrivee par une invitation : ses utilisations avancent, comme chez Discord
+        g = self.guilds[gid]
+        if uid in g['bans']: return None
+        self.attaque(uid)
+        inv = g['invites'][code]
+        inv['uses'] += 1
+        m = self.membre(g, uid)
+        await self.dispatch('GUILD_MEMBER_ADD', {**m, 'guild_id': str(gid)})
+        if inv['max_uses'] and inv['uses'] >= inv['max_uses']: g['invites'].pop(code)
+        return m
+
+    async def bannir(self, gid, acteur, uid):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        g['bans'].add(uid)
+        g['membres'].pop(uid, None)
+        await self.audit(g, acteur, A.ban, uid)
+        await self.dispatch('GUILD_BAN_ADD', {'guild_id': str(gid), 'user': self.users[uid]})
+        await self.dispatch('GUILD_MEMBER_REMOVE', {'guild_id': str(gid), 'user': self.users[uid]})
+
+    async def expulser(self, gid, acteur, uid):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        g['membres'].pop(uid)
+        await self.audit(g, acteur, A.kick, uid)
+        await self.dispatch('GUILD_MEMBER_REMOVE', {'guild_id': str(gid), 'user': self.users[uid]})
+
+    async def modifier_membre(self, gid, acteur, uid, **champs):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        m = g['membres'][uid]
+        if 'roles' in champs:
+            champs['roles'] = [str(r) for r in champs['roles']]
+            # Comme Discord : roles ajoutes/retires dans les changements de l'entree
+            av, ap = set(m.get('roles', [])), set(champs['roles'])
+            diff = lambda ids: [{'id': r, 'name': g['roles'][int(r)]['name']} for r in ids if int(r) in g['roles']]
+            changes = [{'key': k, 'new_value': diff(ids)} for k, ids in (('$add', ap - av), ('$remove', av - ap)) if ids]
+            await self.audit(g, acteur, A.member_role_update, uid, changes)
+        m.update(champs)
+        await self.dispatch('GUILD_MEMBER_UPDATE', {'guild_id': str(gid), **m})
+        return m
+
+    async def vocal(self, g, uid, cid):
+        if cid: g['voix'][uid] = cid
+        else: g['voix'].pop(uid, None)
+        await self.dispatch('VOICE_STATE_UPDATE', {
+            'guild_id': str(g['id']), 'channel_id': str(cid) if cid else None, 'user_id': str(uid),
+            'member': g['membres'][uid], 'session_id': 'x', 'deaf': False, 'mute': False, 'self_deaf': False,
+            'self_mute': False, 'self_video': False, 'self_stream': False, 'suppress': False,
+            'request_to_speak_timestamp': None})
+
+    async def rejoindre_vocal(self, gid, uid, cid):
+        await self.vocal(self.guilds[gid], uid, cid)
+
+    async def quitter_vocal(self, gid, uid):
+        await self.vocal(self.guilds[gid], uid, None)
+
+    async def deconnecter(self, gid, acteur, uid):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        await self.audit_groupe(g, acteur, A.member_disconnect)
+        await self.vocal(g, uid, None)
+
+    async def deplacer(self, gid, acteur, uid, cid):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        await self.audit_groupe(g, acteur, A.member_move, {'channel_id': str(cid)})
+        await self.vocal(g, uid, cid)
+
+    async def modifier_serveur(self, gid, acteur, **champs):
+        g = self.guilds[gid]
+        self.attaque(acteur)
+        if 'name' in champs: g['nom'] = champs['name']
+        if 'verification_level' in champs: g['verification_level'] = champs['verification_level']
+        await self.audit(g, acteur, A.guild_update, gid)
+        await self.dispatch('GUILD_UPDATE', self.base_guild(g))
+
+    async def message(self, gid, cid, auteur, contenu, everyone=False, roles=()):
+        g = self.guilds[gid]
+        self.attaque(auteur)
+        m = g['membres'][auteur]
+        d = {'id': str(self.snowflake()), 'channel_id': str(cid), 'guild_id': str(gid), 'author': m['user'],
+             'member': {k: v for k,v in m.items() if k != 'user'}, 'content': contenu, 'timestamp': maintenant(),
+             'edited_timestamp': None, 'tts': False, 'mention_everyone': everyone, 'mentions': [],
+             'mention_roles': [str(r) for r in roles], 'attachments': [], 'embeds': [], 'pinned': False,
+             'type': 0, 'flags': 0, 'components': []}
+        await self.dispatch('MESSAGE_CREATE', d)
+        return d
+
+    # --- REST
+
+    def sanction(self, uid, typ):
+        # Premiere requete du bot qui sanctionne un attaquant : fin de la mesure
+        if uid in self.debut and uid not in self.sanctions:
+            self.sanctions[uid] = (time.perf_counter(), typ)
+
+    def protege(self, g, uid):
+        if uid == int(self.bot['id']):
+            self.auto += 1
+            raise Refus(403, "Missing Permissions", 50013)
+        if uid == g['owner_id']: raise Refus(403, "Missing Permissions", 50013)
+
+    def bucket(self, methode, motif, major):
+        now = time.monotonic()
+        if not self.globale.prendre(now):
+            return None, {'X-RateLimit-Global': 'true', 'X-RateLimit-Scope': 'global'}, self.globale.reset - now
+        cle = (methode, motif, major)
+        b = self.buckets.get(cle)
+        if b is None: b = self.buckets[cle] = Fenetre(self.limite, self.fenetre)
+        ok = b.prendre(now)
+        h = {'X-RateLimit-Limit': str(b.limite), 'X-RateLimit-Remaining': str(max(0, b.limite - b.n)),
+             'X-RateLimit-Reset': f"{time.time() + b.reset - now:.3f}", 'X-RateLimit-Reset-After': f"{b.reset - now:.3f}",
+             'X-RateLimit-Bucket': hashlib.sha1(f"{methode}{motif}".encode()).hexdigest()[:16]}
+        if not ok: h['X-RateLimit-Scope'] = 'user'
+        return ok, h, b.reset - now
+
+    async def rest(self, request):
+        chemin = "/" + request.match_info['route']
+        for methode, motif, f in self.routes:
+            if methode != request.method: continue
+            m = motif.match(chemin)
+            if m: break
+        else:
+            return reponse({'message': '404: Not Found', 'code': 0}, status=404)
+        self.requetes[(methode, motif.pattern)] += 1
+        ok, h, attente = self.bucket(methode, motif.pattern, m.group(1) if m.groups() else None)
+        if not ok:
+            self.refus += 1
+            h['Retry-After'] = str(max(1, round(attente)))
+            h['Via'] = '1.1 google'    # sans Via, discord.py prend un 429 pour un ban Cloudflare
+            return reponse({'message': 'You are being rate limited.', 'retry_after': round(attente, 3),
+                                      'global': ok is None}, status=429, headers=h)
+        body = await request.json() if request.can_read_body else None
+        if self.latence: await asyncio.sleep(self.latence)
+        try:
+            r = f(request, body, *(int(x) if x.isdigit() else x for x in m.groups()))
+            if asyncio.iscoroutine(r): r = await r
+        except Refus as ex:
+            return reponse({'message': ex.message, 'code': ex.code}, status=ex.status, headers=h)
+        except KeyError:
+            return reponse({'message': 'Unknown', 'code': 10000}, status=404, headers=h)
+        if r is None: return web.Response(status=204, headers=h)
+        return reponse(r, headers=h)
+
+    def r_moi(self, req, body):
+        return self.bot
+
+    def r_application(self, req, body):
+        return {'id': self.bot['id'], 'name': self.bot['username'], 'icon': None, 'description': '',
+                'rpc_origins': [], 'bot_public': True, 'bot_require_code_grant': False, 'owner': self.bot,
+                'summary': '', 'verify_key': '0' * 64, 'flags': 0, 'interactions_endpoint_url': None,
+                'team': None, 'tags': [], 'redirect_uris': []}
+
+    def r_gateway(self, req, body):
+        return {'url': f"ws://{self.host}:{self.port}/", 'shards': 1,
+                'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1}}
+
+    def r_commandes(self, req, body, app):
+        return [{**c, 'id': str(self.snowflake()), 'application_id': str(app), 'version': '1'} for c in body or []]
+
+    def r_user(self, req, body, uid):
+        return self.users.get(uid) or self.user(uid, f"user{uid}")
+
+    def r_dm(self, req, body):
+        return {'id': str(self.snowflake()), 'type': 1, 'last_message_id': None,
+                'recipients': [self.r_user(req, None, int(body['recipient_id']))]}
+
+    def r_audit(self, req, body, gid):
+        q = req.query
+        es = self.guilds[gid]['audit']
+        if 'action_type' in q: es = [e for e in es if e['action_type'] == int(q['action_type'])]
+        if 'user_id' in q: es = [e for e in es if e['user_id'] == q['user_id']]
+        if 'before' in q: es = [e for e in es if int(e['id']) < int(q['before'])]
+        if 'after' in q: es = [e for e in es if int(e['id']) > int(q['after'])]
+        n = int(q.get('limit', 50))
+        es = es[:n] if 'after' in q and 'before' not in q else es[::-1][:n]
+        ids = {int(e['user_id']) for e in es} | {int(e['target_id']) for e in es if e['target_id'] and int(e['target_id']) in self.users}
+        return {'audit_log_entries': es, 'users': [self.users[u] for u in ids if u in self.users],
+                'integrations': [], 'webhooks': [], 'threads': [], 'application_commands': [],
+                'auto_moderation_rules': [], 'guild_scheduled_events': []}
+
+    async def r_ban(self, req, body, gid, uid):
+        self.protege(self.guilds[gid], uid)
+        self.sanction(uid, 'ban')
+        await self.bannir(gid, int(self.bot['id']), uid)
+
+    async def r_unban(self, req, body, gid, uid):
+        g = self.guilds[gid]
+        g['bans'].remove(uid)
+        await self.audit(g, int(self.bot['id']), A.unban, uid)
+        await self.dispatch('GUILD_BAN_REMOVE', {'guild_id': str(gid), 'user': self.users[uid]})
+
+    def r_membre(self, req, body, gid, uid):
+        return self.guilds[gid]['membres'][uid]
+
+    async def r_edit_membre(self, req, body, gid, uid):
+        g = self.guilds[gid]
+        self.protege(g, uid)
+        if body.get('roles') == [] or body.get('communication_disabled_until'):
+            self.sanction(uid, 'derank' if 'roles' in body else 'timeout')
+        champs = {k: body[k] for k in ('roles', 'nick', 'communication_disabled_until', 'mute', 'deaf') if k in body}
+        return await self.modifier_membre(gid, int(self.bot['id']), uid, **champs)
+
+    async def r_kick(self, req, body, gid, uid):
+        self.protege(self.guilds[gid], uid)
+        self.sanction(uid, 'kick')
+        await self.expulser(gid, int(self.bot['id']), uid)
+
+    async def r_ajout_role(self, req, body, gid, uid, rid):
+        m = self.guilds[gid]['membres'][uid]
+        await self.modifier_membre(gid, int(self.bot['id']), uid, roles=m['roles'] + [str(rid)])
+
+    async def r_retrait_role(self, req, body, gid, uid, rid):
+        m = self.guilds[gid]['membres'][uid]
+        await self.modifier_membre(gid, int(self.bot['id']), uid, roles=[r for r in m['roles'] if r != str(rid)])
+
+    async def r_edit_role(self, req, body, gid, rid):
+        self.reverts.append(time.perf_counter())
+        return await self.modifier_role(gid, int(self.bot['id']), rid, **body)
+
+    async def r_suppr_role(self, req, body, gid, rid):
+        self.reverts.append(time.perf_counter())
+        await self.supprimer_role(gid, int(self.bot['id']), rid)
+
+    async def r_edit_guild(self, req, body, gid):
+        self.reverts.append(time.perf_counter())
+        await self.modifier_serveur(gid, int(self.bot['id']), **body)
+        return self.base_guild(self.guilds[gid])
+
+    def guild_salon(self, cid):
+        for g in self.guilds.values():
+            if cid in g['salons']: return g
+        raise KeyError(cid)
+
+    async def r_edit_salon(self, req, body, cid):
+        self.reverts.append(time.perf_counter())
+        return await self.modifier_salon(self.guild_salon(cid)['id'], int(self.bot['id']), cid, **body)
+
+    async def r_suppr_salon(self, req, body, cid):
+        self.reverts.append(time.perf_counter())
+        return await self.supprimer_salon(self.guild_salon(cid)['id'], int(self.bot['id']), cid)
+
+    def r_message(self, req, body, cid):
+        return {'id': str(self.snowflake()), 'channel_id': str(cid), 'author': self.bot,
+                'content': body.get('content') or '', 'timestamp': maintenant(), 'edited_timestamp': None,
+                'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+                'attachments': [], 'embeds': body.get('embeds') or [], 'pinned': False, 'type': 0,
+                'flags': 0, 'components': []}
+
+    def r_edit_message(self, req, body, cid, mid):
+        return {**self.r_message(req, body, cid), 'id': str(mid), 'edited_timestamp': maintenant()}
+
+    def r_invite(self, req, body, cid):
+        g = self.guild_salon(cid)
+        return {'code': hashlib.md5(str(self.snowflake()).encode()).hexdigest()[:8], 'type': 0,
+                'guild': {'id': str(g['id']), 'name': g['nom'], 'features': []}, 'channel': g['salons'][cid],
+                'max_age': body.get('max_age', 0), 'max_uses': body.get('max_uses', 0), 'uses': 0,
+                'temporary': False, 'created_at': maintenant()}
+
+    async def r_suppr_invite(self, req, body, code):
+        self.reverts.append(time.perf_counter())
+        g = next((g for g in self.guilds.values() if str(code) in g['invites']), None)
+        if g is None: raise KeyError(code)
+        inv = g['invites'][str(code)]
+        self.sanction(int(inv['inviter']['id']), 'revocation')
+        await self.supprimer_invitation(g['id'], int(self.bot['id']), str(code))
+        return inv
+
+    def r_webhooks_salon(self, req, body, cid):
+        return [w for w in self.guild_salon(cid)['webhooks'].values() if w['channel_id'] == str(cid)]
+
+    async def r_suppr_webhook(self, req, body, wid):
+        self.reverts.append(time.perf_counter())
+        g = next((g for g in self.guilds.values() if wid in g['webhooks']), None)
+        if g is None: raise KeyError(wid)
+        await self.supprimer_webhook(g['id'], int(self.bot['id']), wid)
+
+    # --- Mesures
+
+    async def attendre(self, timeout=30.0):
+        # Jusqu'a ce que chaque attaquant soit sanctionne (ou timeout)
+        fin = time.monotonic() + timeout
+        while time.monotonic() < fin and len(self.sanctions) < len(self.debut):
+            await asyncio.sleep(0.05)
+
+    def latences(self):
+        return sorted(self.sanctions[u][0] - self.debut[u] for u in self.sanctions)
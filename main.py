@@ -6,14 +6,25 @@ import asyncio
 from typing import Optional, Dict
 import re
 import os
+import sys
+import threading
+import gzip
+import shutil
+import traceback
 import io
 import json
 import time
 import aiohttp
 import aiofiles
-from collections import defaultdict, deque
+import hashlib
+import csv
+import random
+import heapq
+import contextvars
+from collections import defaultdict, deque, OrderedDict, Counter
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from config import BOT_TOKEN, OWNER_IDS
+from config import BOT_TOKEN, OWNER_IDS, MEMBER_CACHE, RECORD_ACTIONS, INCIDENTS_RETENTION, BACKUP_INTERVAL
 
 DISCORD_INVITE_REGEX = r'(?:https?://)?(?:www\.)?(?:discord\.(?:gg|io|me|com)|discordapp\.com/invite)/[a-zA-Z0-9]+'
 
@@ -21,19 +32,789 @@ class ActionTracker:
     def __init__(self):
         self.user_actions = defaultdict(lambda: deque(maxlen=100))
     
-    def add_action(self, user_id: int, action_type: str):
+    def add_action(self, user_id: int, action_type: str, ts: float = None):
         self.user_actions[user_id].append({
             'type': action_type,
-            'timestamp': time.time()
+            'timestamp': ts or time.time()
         })
     
-    def get_recent_actions(self, user_id: int, action_type: str, seconds: int) -> int:
-        cutoff = time.time() - seconds
-        return sum(1 for a in self.user_actions[user_id] 
-                  if a['type'] == action_type and a['timestamp'] > cutoff)
+    def get_recent_actions(self, user_id: int, action_type: str, seconds: int, at: float = None) -> int:
+        # at : instant de reference (rattrapage d'actions passees), maintenant par defaut
+        at = at or time.time()
+        cutoff = at - seconds
+        return sum(1 for a in self.user_actions[user_id]
+                  if a['type'] == action_type and cutoff < a['timestamp'] <= at)
+
+class Baseline:
+    # Niveau habituel d'une action dans un serveur : moyenne et variance exponentielles
+    # (EWMA) du nombre d'actions d'un acteur sur la fenetre, en memoire constante par
+    # (serveur, action). Une valeur anormale n'entre pas dans la reference.
+    def __init__(self, stats=None, alpha=0.02, k=3.0, ecart_min=0.35, plancher=2, chauffe=20):
+        self.alpha, self.k, self.ecart_min, self.plancher, self.chauffe = alpha, k, ecart_min, plancher, chauffe
+        self.stats = stats or {}    # (guild, action) -> [moyenne, variance, n]
+        self.modifie = False
+    
+    def pret(self, cle):
+        s = self.stats.get(cle)
+        return s is not None and s[2] >= self.chauffe
+    
+    def seuil(self, cle):
+        m, v, _ = self.stats[cle]
+        return m + self.k * max(v ** 0.5, self.ecart_min)
+    
+    def observer(self, cle, x):
+        # True si x depasse le niveau habituel (apres la periode d'apprentissage)
+        if self.pret(cle) and x >= self.plancher and x > self.seuil(cle): return True
+        s = self.stats.get(cle)
+        if s is None:
+            self.stats[cle] = [float(x), 0.0, 1]
+        else:
+            d = x - s[0]
+            s[0] += self.alpha * d
+            s[1] = (1 - self.alpha) * (s[1] + self.alpha * d * d)
+            s[2] += 1
+        self.modifie = True
+        return False
+
+class IncidentLogger:
+    # Journal structure non bloquant : les handlers deposent des enregistrements dans
+    # une file, une tache de fond les ecrit par lots en JSONL avec rotation compressee
+    def __init__(self, path="logs/incidents.jsonl", max_bytes=5_000_000, keep=10, batch=500, size=10000):
+        self.path, self.max_bytes, self.keep, self.batch = path, max_bytes, keep, batch
+        self.queue = asyncio.Queue(maxsize=size)
+        self.echecs = Counter()    # handler -> nombre d'echecs
+        self.perdus = 0            # enregistrements jetes (file pleine, ecriture impossible)
+        self.en_panne = False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    def log(self, niveau, handler, **champs):
+        rec = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'niveau': niveau, 'handler': handler}
+        rec.update({k:v for k,v in champs.items() if v is not None})
+        try: self.queue.put_nowait(rec)
+        except asyncio.QueueFull: self.perdus += 1
+    
+    def erreur(self, handler, ex, guild=None, latence=None, **champs):
+        self.echecs[handler] += 1
+        self.log('error', handler, guild=guild, erreur=type(ex).__name__, message=str(ex)[:500],
+                 latence_ms=round(latence*1000, 1) if latence is not None else None,
+                 trace=''.join(traceback.format_exception(type(ex), ex, ex.__traceback__))[-2000:], **champs)
+    
+    async def run(self):
+        while True:
+            recs = [await self.queue.get()]
+            while len(recs) < self.batch and not self.queue.empty():
+                recs.append(self.queue.get_nowait())
+            lignes = "".join(json.dumps(r, default=str, ensure_ascii=False) + "\n" for r in recs)
+            try:
+                await asyncio.to_thread(self._ecrire, lignes)
+                self.en_panne = False
+            except Exception as ex:
+                # Une seule erreur par panne (elle repasse par la file), sinon chaque echec en produirait un autre
+                self.perdus += len(recs)
+                if not self.en_panne: self.erreur('journal', ex, lignes=len(recs))
+                self.en_panne = True
+    
+    def _ecrire(self, lignes):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lignes)
+        if os.path.getsize(self.path) < self.max_bytes: return
+        # Rotation : le fichier plein est compresse, les plus anciens sont supprimes
+        dest = f"{self.path}.{datetime.now():%Y%m%d-%H%M%S-%f}.gz"
+        with open(self.path, 'rb') as src, gzip.open(dest, 'wb') as gz:
+            shutil.copyfileobj(src, gz)
+        os.remove(self.path)
+        d, base = os.path.split(self.path)
+        vieux = sorted(f for f in os.listdir(d or '.') if f.startswith(base + '.') and f.endswith('.gz'))
+        for f in vieux[:-self.keep]:
+            os.remove(os.path.join(d, f))
+
+class IncidentStore:
+    # Historique des incidents en base : les handlers ajoutent en memoire, une tache de
+    # fond ecrit par lots (une transaction) et compacte une fois par jour selon la retention
+    def __init__(self, db, logs, retention=90, intervalle=2.0, lot=500):
+        self.db, self.logs, self.retention, self.intervalle, self.lot = db, logs, retention, intervalle, lot
+        self.tampon = []
+        self.plein = asyncio.Event()
+        self.dernier = 0.0
+        self.compacte = 0.0
+    
+    def ajouter(self, gid, uid, module, action, nb, sanction, succes):
+        # ts strictement croissant : sert de curseur de pagination
+        self.dernier = ts = max(time.time(), self.dernier + 1e-6)
+        self.tampon.append((gid, uid, module, action, nb, sanction, int(bool(succes)), ts))
+        if len(self.tampon) >= self.lot: self.plein.set()
+    
+    def vider(self):
+        rows, self.tampon = self.tampon, []
+        if rows: self.db.add_incidents(rows)
+    
+    async def run(self):
+        while True:
+            try: await asyncio.wait_for(self.plein.wait(), self.intervalle)
+            except asyncio.TimeoutError: pass
+            self.plein.clear()
+            try:
+                self.vider()
+                if time.time() - self.compacte > 86400:
+                    self.compacte = time.time()
+                    self.db.compacter_incidents(self.compacte - self.retention * 86400)
+            except Exception as ex: self.logs.erreur('incidents', ex)
+
+def guild_id(args):
+    # Serveur concerne par les arguments d'un evenement
+    for a in args:
+        if isinstance(a, discord.Guild): return a.id
+        g = getattr(a, 'guild', None)
+        if g: return g.id
+    return None
+
+# Permissions qui font d'un membre du staff (toujours garde en cache en mode lean)
+STAFF_PERMS = discord.Permissions(administrator=True, manage_guild=True, manage_roles=True, manage_channels=True,
+                                  ban_members=True, kick_members=True, moderate_members=True).value
+
+# Permissions dont l'ajout a un role ou a un membre est une escalade (antirole)
+DANGER_PERMS = STAFF_PERMS | discord.Permissions(manage_webhooks=True, mention_everyone=True,
+                                                 manage_expressions=True, manage_nicknames=True).value
+
+def escalade(avant, apres):
+    # Bits dangereux gagnes et perdus entre deux valeurs de permissions : un XOR, deux ET
+    d = (avant ^ apres) & DANGER_PERMS
+    return d & apres, d & avant
+
+def noms_permissions(v):
+    return ", ".join(n for n, ok in discord.Permissions(v) if ok)
+
+class MemberCache:
+    # Politique de cache des membres. 'full' : discord.py garde tout le monde (chunk au demarrage).
+    # 'lean' : seuls les membres actifs recemment, le staff et les wl/sys restent en cache,
+    # les autres sont recuperes a la demande.
+    def __init__(self, bot, mode, ttl=1800):
+        self.bot, self.mode, self.ttl = bot, mode, ttl
+        self.actifs = {}   # (guild_id, user_id) -> derniere activite
+    
+    @staticmethod
+    def options(mode, intents):
+        # Arguments du constructeur du client selon le mode
+        if mode != 'lean': return {}
+        flags = discord.MemberCacheFlags.none()
+        flags.joined = True
+        flags.voice = intents.voice_states
+        return {'member_cache_flags': flags, 'chunk_guilds_at_startup': False}
+    
+    def touch(self, m):
+        if self.mode != 'lean' or not isinstance(m, discord.Member): return
+        self.actifs[(m.guild.id, m.id)] = time.monotonic()
+        if m.guild.get_member(m.id) is None:
+            m.guild._add_member(m)
+    
+    async def resolve(self, guild, user):
+        # Membre du serveur, depuis le cache ou par l'API ; l'utilisateur tel quel s'il est parti
+        m = guild.get_member(user.id)
+        if m is None:
+            try: m = await guild.fetch_member(user.id)
+            except discord.HTTPException: return user
+        self.touch(m)
+        return m
+    
+    def garder(self, m, now, ids=None):
+        if self.bot.user and m.id == self.bot.user.id: return True
+        if now - self.actifs.get((m.guild.id, m.id), -self.ttl) < self.ttl: return True
+        if m.guild_permissions.value & STAFF_PERMS: return True
+        if ids is not None:
+            return m.id in ids or self.bot.db.is_role_whitelisted(m.guild.id, m.roles)
+        return self.bot.db.is_exempt(m.guild.id, m)
+    
+    def purger(self):
+        now = time.monotonic()
+        for g in self.bot.guilds:
+            # wl/sys lus une fois par serveur plutot qu'une requete par membre
+            ids = {uid for uid, _ in self.bot.db.get_whitelist(g.id)} | {uid for uid, in self.bot.db.get_sys(g.id)}
+            for m in list(g.members):
+                if not self.garder(m, now, ids): g._remove_member(m)
+        self.actifs = {k:t for k,t in self.actifs.items() if now - t < self.ttl}
+    
+    async def precharger(self, g):
+        # Les wl/sys sont connus par id : une requete gateway par paquet de 100
+        ids = {uid for uid, _ in self.bot.db.get_whitelist(g.id)} | {uid for uid, in self.bot.db.get_sys(g.id)}
+        ids = list(ids)
+        for n in range(0, len(ids), 100):
+            try: await g.query_members(user_ids=ids[n:n+100], cache=True)
+            except Exception as ex: self.bot.logs.erreur('precharger', ex, guild=g.id)
+    
+    async def run(self, periode=300):
+        await self.bot.wait_until_ready()
+        for g in self.bot.guilds:
+            await self.precharger(g)
+        while not self.bot.is_closed():
+            await asyncio.sleep(periode)
+            self.purger()
+    
+    def membre_hors_cache(self, parser):
+        # GUILD_MEMBER_UPDATE d'un membre absent du cache : discord.py l'ajoute sans
+        # dispatcher on_member_update, on previent donc la verification des roles
+        def parse(data):
+            g = self.bot.get_guild(int(data['guild_id']))
+            absent = g is not None and g.get_member(int(data['user']['id'])) is None
+            parser(data)
+            if absent:
+                m = g.get_member(int(data['user']['id']))
+                if m:
+                    self.touch(m)
+                    self.bot.dispatch('member_hors_cache', m)
+        return parse
+
+class ViolationBatcher:
+    # Regroupe les messages fautifs par salon : une suppression groupee par fenetre
+    # et un seul avertissement par membre, edite avec un compteur
+    def __init__(self, logs, window=1.0, warn_ttl=10.0):
+        self.logs = logs
+        self.window = window
+        self.warn_ttl = warn_ttl
+        self.pending = defaultdict(dict)   # channel_id -> {message_id: message}
+        self.channels = {}
+        self.warnings = {}                 # (channel_id, user_id) -> etat de l'avertissement
+        self.tasks = {}
+
+    def queue(self, msg, texte):
+        cid = msg.channel.id
+        self.pending[cid][msg.id] = msg
+        self.channels[cid] = msg.channel
+        key = (cid, msg.author.id)
+        now = time.time()
+        w = self.warnings.get(key)
+        if not w or w['expire'] < now:
+            w = self.warnings[key] = {'msg': None, 'count': 0, 'shown': 0, 'mention': msg.author.mention}
+        w['texte'] = texte
+        w['count'] += 1
+        w['expire'] = now + self.warn_ttl
+        if cid not in self.tasks:
+            self.tasks[cid] = asyncio.create_task(self._flush_later(cid))
+
+    async def _flush_later(self, cid):
+        try:
+            await asyncio.sleep(self.window)
+            await self.flush(cid)
+        finally:
+            self.tasks.pop(cid, None)
+            if self.pending.get(cid):
+                self.tasks[cid] = asyncio.create_task(self._flush_later(cid))
+
+    async def flush(self, cid):
+        chan = self.channels.get(cid)
+        msgs = list(self.pending.pop(cid, {}).values())
+        if not chan: return
+        for n in range(0, len(msgs), 100):
+            try: await chan.delete_messages(msgs[n:n+100], reason="Protection")
+            except Exception as ex: self.logs.erreur('purge', ex, guild=chan.guild.id, messages=len(msgs))
+        now = time.time()
+        # Avertissements expires de tous les salons, y compris ceux qui ne seront plus purges
+        for key in [k for k, w in self.warnings.items() if w['expire'] < now]: del self.warnings[key]
+        actifs = {k[0] for k in self.warnings} | set(self.pending)
+        for c in [c for c in self.channels if c not in actifs]: del self.channels[c]
+        for key, w in list(self.warnings.items()):
+            if key[0] != cid or w['count'] == w['shown']: continue
+            txt = f"{w['mention']} {w['texte']}" + (f" (x{w['count']})" if w['count'] > 1 else "")
+            try:
+                if w['msg']: await w['msg'].edit(content=txt)
+                else: w['msg'] = await chan.send(txt)
+                w['shown'] = w['count']
+            except Exception as ex:
+                w['msg'] = None
+                self.logs.erreur('avertissement', ex, guild=chan.guild.id)
+
+class EventCoalescer:
+    # Regroupe les evenements d'un meme type par serveur sur une courte fenetre :
+    # le handler recoit le lot entier une seule fois
+    def __init__(self, logs, window=1.5):
+        self.logs = logs
+        self.window = window
+        self.batches = {}   # (guild_id, type) -> [evenements]
+        self.tasks = set()
+    
+    def add(self, guild_id, typ, item, handler):
+        key = (guild_id, typ)
+        if key in self.batches:
+            self.batches[key].append(item)
+            return
+        self.batches[key] = [item]
+        t = asyncio.create_task(self._flush(key, handler))
+        self.tasks.add(t)
+        t.add_done_callback(self.tasks.discard)
+    
+    async def _flush(self, key, handler):
+        await asyncio.sleep(self.window)
+        lot = self.batches.pop(key)
+        try: await handler(lot)
+        except Exception as ex: self.logs.erreur('coalescer', ex, guild=key[0], type=key[1], lot=len(lot))
+
+# Comptage d'un lot regroupe : 'lot' = une action par auteur et par lot, 'unite' = une par evenement
+COALESCE_POLICY = {'channel_update': 'lot'}
+
+class RateBudget:
+    # Budget d'appels REST pour un serveur (seau a jetons) : les actions en masse
+    # attendent un jeton au lieu de taper dans les rate limits de Discord
+    def __init__(self, rate=5, per=5.0):
+        self.rate, self.per = rate, per
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def take(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate / self.per)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+# Creations indexees par createur, nettoyees en bloc quand il est sanctionne
+CREATIONS = {
+    discord.AuditLogAction.channel_create: 'salon',
+    discord.AuditLogAction.role_create: 'role',
+    discord.AuditLogAction.webhook_create: 'webhook',
+}
+
+class CreationIndex:
+    # Salons, roles et webhooks crees recemment, par (serveur, createur), d'apres
+    # l'attribution du journal d'audit ; les entrees plus vieilles que la fenetre tombent
+    def __init__(self, fenetre=600):
+        self.fenetre = fenetre
+        self.par = defaultdict(deque)      # (guild, user) -> deque[(ts, type, id)]
+    
+    def ajouter(self, gid, uid, typ, oid, ts=None):
+        d = self.par[(gid, uid)]
+        d.append((ts or time.time(), typ, oid))
+        self.expirer(d)
+        if len(self.par) > 10000:
+            for k in [k for k,d in self.par.items() if not self.expirer(d)]: del self.par[k]
+    
+    def expirer(self, d):
+        limite = time.time() - self.fenetre
+        while d and d[0][0] < limite: d.popleft()
+        return d
+    
+    def prendre(self, gid, uid):
+        d = self.par.pop((gid, uid), None)
+        return [(typ, oid) for _,typ,oid in self.expirer(d)] if d else []
+
+class SelfActionLedger:
+    # Ecritures du bot en cours (revert, restauration, ban) par (serveur, objet, action) :
+    # l'evenement gateway qu'elles provoquent revient dans les memes handlers et y est
+    # ecarte avant toute lecture d'audit ou de la base. Une entree non consommee expire.
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        self.attendus = OrderedDict()   # cle -> [echos attendus, echeance]
+        self.ignores = 0
+    
+    @contextmanager
+    def ecriture(self, gid, oid, action):
+        # Note avant l'appel REST (l'evenement peut arriver avant la reponse), retire si l'appel echoue
+        now = time.monotonic()
+        while self.attendus and next(iter(self.attendus.values()))[1] < now:
+            self.attendus.popitem(last=False)
+        k = (gid, oid, action)
+        e = self.attendus.setdefault(k, [0, 0])
+        e[0] += 1
+        e[1] = now + self.ttl
+        self.attendus.move_to_end(k)
+        try: yield
+        except BaseException:
+            self.retirer(k)
+            raise
+    
+    def retirer(self, k):
+        e = self.attendus.get(k)
+        if not e: return
+        e[0] -= 1
+        if e[0] <= 0: del self.attendus[k]
+    
+    def echo(self, gid, oid, action):
+        k = (gid, oid, action)
+        e = self.attendus.get(k)
+        if not e or e[1] < time.monotonic(): return False
+        self.retirer(k)
+        self.ignores += 1
+        return True
+
+class WebhookInventory:
+    # Webhooks connus par serveur et par salon. WEBHOOKS_UPDATE ne dit que le salon
+    # touche : on ne relit que ce salon et on compare a l'inventaire pour trouver les nouveaux
+    def __init__(self, recent=60):
+        self.recent = recent
+        self.salons = {}                   # guild id -> {salon id -> set(webhook ids)}
+        self.depuis = {}                   # guild id -> date de l'inventaire complet
+        self.verrous = defaultdict(asyncio.Lock)
+        self.attente = set()               # salons avec une relecture deja en attente
+    
+    async def charger(self, g):
+        hooks = await g.webhooks()
+        salons = defaultdict(set)
+        for w in hooks: salons[w.channel_id].add(w.id)
+        self.salons[g.id] = dict(salons)
+        self.depuis[g.id] = time.time()
+    
+    async def diff(self, c):
+        # Webhooks apparus dans le salon depuis la derniere lecture. Si une relecture du
+        # salon attend deja son tour, elle verra aussi ce changement : rien a faire ici.
+        if c.id in self.attente: return []
+        self.attente.add(c.id)
+        async with self.verrous[c.id]:
+            self.attente.discard(c.id)
+            hooks = await c.webhooks()
+            salons = self.salons.setdefault(c.guild.id, {})
+            connus = salons.get(c.id)
+            if connus is None:
+                # Salon jamais lu : nouveau = cree apres l'inventaire (ou tout recemment)
+                t = self.depuis.get(c.guild.id, time.time() - self.recent)
+                nouveaux = [w for w in hooks if w.created_at.timestamp() > t]
+            else:
+                nouveaux = [w for w in hooks if w.id not in connus]
+            salons[c.id] = {w.id for w in hooks}
+            return nouveaux
+    
+    def oublier(self, gid):
+        self.salons.pop(gid, None)
+        self.depuis.pop(gid, None)
+
+class InviteCache:
+    # Utilisations de chaque invitation par serveur, chargees une fois puis tenues a jour par
+    # INVITE_CREATE/DELETE. Discord ne dit pas quelle invitation a servi : a une arrivee on
+    # relit les invitations et on compare les compteurs. Les arrivees qui attendent la meme
+    # relecture sont attribuees ensemble, et deux relectures d'un serveur sont espacees
+    # d'au moins `intervalle` (bucket de 5/5s) : pendant un raid, une requete par seconde.
+    def __init__(self, intervalle=1.0):
+        self.intervalle = intervalle
+        self.derniere = {}                 # guild id -> instant de la derniere relecture
+        self.invites = {}                  # guild id -> {code: (utilisations, createur id)}
+        self.verrous = defaultdict(asyncio.Lock)
+        self.arrivees = defaultdict(list)  # guild id -> membres en attente d'attribution
+        self.attente = set()               # serveurs avec une relecture deja en attente
+    
+    @staticmethod
+    def etat(invs):
+        return {i.code: (i.uses or 0, i.inviter.id if i.inviter else None) for i in invs}
+    
+    async def charger(self, g):
+        self.invites[g.id] = self.etat(await g.invites())
+    
+    def creer(self, inv):
+        if inv.guild and inv.guild.id in self.invites:
+            self.invites[inv.guild.id][inv.code] = (inv.uses or 0, inv.inviter.id if inv.inviter else None)
+    
+    def supprimer(self, gid, code):
+        self.invites.get(gid, {}).pop(code, None)
+    
+    def oublier(self, gid):
+        self.invites.pop(gid, None)
+        self.arrivees.pop(gid, None)
+        self.derniere.pop(gid, None)
+        self.attente.discard(gid)
+    
+    async def attribuer(self, m):
+        # (membres du lot, {code: nouvelles utilisations}), ou None si une relecture deja
+        # en attente prendra ce membre dans son lot (le handler rend la main tout de suite)
+        g = m.guild
+        self.arrivees[g.id].append(m)
+        if g.id in self.attente: return None
+        self.attente.add(g.id)
+        async with self.verrous[g.id]:
+            attente = self.derniere.get(g.id, 0) + self.intervalle - time.monotonic()
+            if attente > 0: await asyncio.sleep(attente)
+            self.attente.discard(g.id)
+            lot = self.arrivees.pop(g.id, None)
+            if not lot: return None
+            self.derniere[g.id] = time.monotonic()
+            avant = self.invites.get(g.id)
+            apres = self.etat(await g.invites())
+            self.invites[g.id] = apres
+            if avant is None: return lot, {}   # pas de reference : rien d'attribuable
+            deltas = {c: u - avant.get(c, (0,))[0] for c,(u,_) in apres.items() if u > avant.get(c, (0,))[0]}
+            # Disparue sans INVITE_DELETE : derniere utilisation d'une invitation limitee
+            for c in avant.keys() - apres.keys(): deltas[c] = 1
+            return lot, deltas
+
+class VoiceAudit:
+    # Compteurs cumules des entrees d'audit deconnexion/deplacement, par serveur. Discord
+    # regroupe les actions repetees d'un moderateur dans une meme entree (champ count) ; un
+    # membre qui part de lui-meme ne fait rien avancer. Sans entree recente dans le serveur,
+    # un changement vocal est donc spontane et ne coute aucune lecture du journal d'audit.
+    def __init__(self, fenetre=600, delai=3.0):
+        self.fenetre = fenetre             # duree pendant laquelle une entree peut encore avancer
+        self.delai = delai                 # l'evenement vocal peut preceder l'entree d'audit
+        self.pris = defaultdict(dict)      # guild id -> {entree id: occurrences deja attribuees}
+        self.derniere = {}                 # guild id -> derniere entree vue (time.time)
+        self.attente = defaultdict(deque)  # guild id -> (ts, membre, typ) pas encore attribues
+    
+    def actif(self, gid):
+        return time.time() - self.derniere.get(gid, 0) < self.fenetre
+    
+    def avance(self, gid, e):
+        # Occurrences de l'entree pas encore attribuees a un changement vocal
+        n = getattr(e.extra, 'count', None) or 1
+        return n - self.pris[gid].get(e.id, 0)
+    
+    def prendre(self, gid, e, k=1):
+        self.pris[gid][e.id] = self.pris[gid].get(e.id, 0) + k
+        self.derniere[gid] = time.time()
+        if len(self.pris[gid]) > 100:
+            for eid in sorted(self.pris[gid])[:50]: del self.pris[gid][eid]
+    
+    def attendre(self, gid, m, typ):
+        d = self.attente[gid]
+        d.append((time.time(), m, typ))
+        while d and (len(d) > 500 or d[0][0] < time.time() - self.delai): d.popleft()
+    
+    def membres(self, gid, typ, n):
+        # Changements vocaux du type donne arrives juste avant l'entree, du plus recent au plus ancien
+        d = self.attente.get(gid)
+        if not d: return []
+        limite = time.time() - self.delai
+        pris = [x for x in reversed(d) if x[2] == typ and x[0] >= limite][:n]
+        for x in pris: d.remove(x)
+        return [m for _,m,_ in pris]
+
+# Timeout natif de Discord : 28 jours au plus, un mute plus long est prolonge par tranches
+TIMEOUT_MAX = timedelta(days=27)
+# Punitions qui passent par l'API ; les autres (warn) n'ont rien qui puisse echouer
+SANCTIONS_REST = ('kick', 'ban', 'tempban', 'derank', 'tempderank', 'tempmute')
+
+class TimedSanctions:
+    # Fins des sanctions temporaires (tempban, tempderank, mute de plus de 28 jours). La table
+    # minuteurs fait foi ; en memoire, un tas de (echeance, id) et une seule tache, quel que
+    # soit le nombre de minuteurs. Les echeances passees partent par lots concurrents.
+    def __init__(self, bot, lot=100, relance=600):
+        self.bot, self.lot, self.relance = bot, lot, relance
+        self.tas = []
+        self.reveil = asyncio.Event()
+        self.executes = 0
+    
+    def charger(self):
+        self.tas = self.bot.db.get_echeances()
+        heapq.heapify(self.tas)
+    
+    def planifier(self, gid, uid, sid, action, echeance, fin=None):
+        tid = self.bot.db.add_minuteur(gid, uid, sid, action, echeance, fin)
+        heapq.heappush(self.tas, (echeance, tid))
+        if self.tas[0][1] == tid: self.reveil.set()
+    
+    async def run(self):
+        self.charger()
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            now = time.time()
+            dus = []
+            while self.tas and self.tas[0][0] <= now and len(dus) < self.lot:
+                dus.append(heapq.heappop(self.tas)[1])
+            if dus:
+                # Lignes lues au moment de l'echeance : un id supprime (/undo) n'a plus de ligne
+                rows = self.bot.db.get_minuteurs(dus)
+                res = await asyncio.gather(*(self.executer(*r) for r in rows), return_exceptions=True)
+                self.bot.db.del_minuteurs(dus)
+                for (tid, gid, uid, sid, action, fin), r in zip(rows, res):
+                    # Erreur hors du try d'executer (base, budget) : journalisee, minuteur replanifie
+                    if isinstance(r, Exception):
+                        self.bot.logs.erreur('minuteurs', r, guild=gid, sanction=sid, action=action)
+                        if time.time() < fin + 86400:
+                            self.planifier(gid, uid, sid, action, time.time() + self.relance, fin)
+                continue
+            self.reveil.clear()
+            attente = min(3600, self.tas[0][0] - now) if self.tas else 3600
+            try: await asyncio.wait_for(self.reveil.wait(), attente)
+            except asyncio.TimeoutError: pass
+    
+    async def executer(self, tid, gid, uid, sid, action, fin):
+        g = self.bot.get_guild(gid)
+        row = self.bot.db.get_sanction(gid, sid)
+        if not g or not row: return
+        if action == 'annuler':
+            ok = await annuler(g, row, "expiration", typ='expiration')
+        else:
+            # Mute long : nouvelle tranche de timeout, et le minuteur de la suivante
+            reste = fin - time.time()
+            if reste <= 0: return
+            ok = True
+            try:
+                await self.bot.budgets[g.id].take()
+                m = g.get_member(uid) or await g.fetch_member(uid)
+                await m.timeout(min(timedelta(seconds=reste), TIMEOUT_MAX), reason=f"Sanction #{sid}: prolongation du mute")
+                if reste > TIMEOUT_MAX.total_seconds():
+                    self.planifier(gid, uid, sid, 'prolonger', time.time() + TIMEOUT_MAX.total_seconds() - 3600, fin)
+            except discord.NotFound: pass
+            except Exception as ex:
+                ok = False
+                self.bot.logs.erreur('minuteurs', ex, guild=gid, sanction=sid)
+        self.executes += 1
+        if not ok and time.time() < fin + 86400:
+            # Echec (API indisponible, permissions) : nouvel essai plus tard, pendant un jour
+            self.planifier(gid, uid, sid, action, time.time() + self.relance, fin)
+
+class SamplingProfiler:
+    # Profileur a echantillonnage : un thread lit la pile du thread de la boucle a
+    # intervalle fixe. Arrete, il n'a aucun cout (pas de thread, pas de hook).
+    def __init__(self, bot, interval=0.005, out_dir="profiles"):
+        self.bot = bot
+        self.interval = interval
+        self.out_dir = out_dir
+        self.actif = False
+    
+    def _pile(self, f):
+        noms = []
+        while f and len(noms) < 64:
+            c = f.f_code
+            noms.append(f"{c.co_name} ({os.path.basename(c.co_filename)}:{c.co_firstlineno})")
+            f = f.f_back
+        noms.reverse()
+        # Tag = handler d'evenement present dans la pile (on_message, on_guild_role_update...)
+        tag = next((n.split(' ')[0] for n in noms if n.startswith('on_')), 'boucle')
+        return tag + ';' + ';'.join(noms)
+    
+    def _echantillonner(self, tid, fin, piles):
+        while time.monotonic() < fin:
+            f = sys._current_frames().get(tid)
+            if f: piles[self._pile(f)] += 1
+            del f
+            time.sleep(self.interval)
+    
+    async def run(self, duree):
+        # Renvoie (chemin du fichier folded, resume texte)
+        self.actif = True
+        piles = defaultdict(int)
+        rest = defaultdict(list)
+        http = self.bot.http
+        orig = http.request
+        async def request(route, **kw):
+            t0 = time.perf_counter()
+            try: return await orig(route, **kw)
+            finally:
+                tag = EVENEMENT.get()
+                if tag is None:
+                    t = asyncio.current_task()
+                    tag = t.get_name().replace('discord.py: ', '') if t else '?'
+                rest[(tag, f"{route.method} {route.path}")].append(time.perf_counter() - t0)
+        http.request = request
+        try:
+            await asyncio.to_thread(self._echantillonner, threading.get_ident(), time.monotonic() + duree, piles)
+        finally:
+            http.request = orig
+            self.actif = False
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = f"{self.out_dir}/profile_{int(time.time())}.folded"
+        with open(path, 'w') as f:
+            for pile, n in sorted(piles.items()):
+                f.write(f"{pile} {n}\n")
+        total = sum(piles.values()) or 1
+        tags = defaultdict(int)
+        feuilles = defaultdict(int)
+        for pile, n in piles.items():
+            tags[pile.split(';', 1)[0]] += n
+            feuilles[pile.rsplit(';', 1)[-1]] += n
+        lignes = [f"{total} echantillons en {duree}s"]
+        lignes += [f"{t}: {100*n/total:.1f}%" for t,n in sorted(tags.items(), key=lambda x: -x[1])[:8]]
+        lignes.append("-- fonctions --")
+        lignes += [f"{100*n/total:.1f}% {f}" for f,n in sorted(feuilles.items(), key=lambda x: -x[1])[:8]]
+        if rest:
+            lignes.append("-- REST (moy/max ms) --")
+            for (tag, r), d in sorted(rest.items(), key=lambda x: -sum(x[1]))[:8]:
+                lignes.append(f"{tag} {r} x{len(d)} {1000*sum(d)/len(d):.0f}/{1000*max(d):.0f}")
+        return path, "\n".join(lignes)
+
+# Evenement (et module) du handler en cours, pour les mesures REST du profileur : les
+# handlers en file tournent dans des workers generiques, le nom de tache ne dit plus rien
+EVENEMENT = contextvars.ContextVar('evenement', default=None)
+
+# Priorite des evenements (0 = destructeur, lance immediatement, sans file d'attente) ;
+# un evenement absent garde le comportement de discord.py (une tache par handler)
+PRIORITES = {
+    'on_member_ban': 0, 'on_guild_channel_create': 0, 'on_guild_channel_delete': 0,
+    'on_guild_role_create': 0, 'on_guild_role_delete': 0, 'on_guild_role_update': 0,
+    'on_guild_update': 0, 'on_audit_log_entry_create': 0, 'on_webhooks_update': 0,
+    'on_guild_channel_update': 1, 'on_member_join': 1, 'on_member_update': 1,
+    'on_member_hors_cache': 1, 'on_voice_state_update': 1,
+    'on_message': 3,
+    'log_embed': 4,
+}
+
+class EventScheduler:
+    # File bornee et prioritaire devant les handlers non destructeurs : des workers la
+    # vident par priorite, donc un flot de messages ne retarde jamais une suppression de
+    # salon. Quand la file est profonde, le travail de faible valeur est jete ; au plafond
+    # (taille), toutes priorites confondues, le moins prioritaire en file cede sa place.
+    def __init__(self, bot, workers=8, taille=5000, profonde=500):
+        self.bot, self.workers, self.taille, self.profonde = bot, workers, taille, profonde
+        self.files = defaultdict(deque)   # priorite -> deque[(fn, nom, args, kwargs)], FIFO
+        self.n = 0                        # evenements en file
+        self.pret = asyncio.Event()
+        self.en_cours = 0
+        self.jetes = Counter()     # evenement -> nombre jete
+        self.max = 0               # profondeur maximale atteinte
+    
+    def faible(self, prio, nom, args):
+        # Messages d'un membre deja sanctionne, embeds de log
+        if nom == 'on_message':
+            m = args[0]
+            return m.guild is not None and (m.guild.id, m.author.id) in self.bot.sanctionnes
+        return prio >= 4
+    
+    def soumettre(self, prio, fn, nom, *args, **kwargs):
+        if self.n >= self.profonde and self.faible(prio, nom, args):
+            self.jetes[nom] += 1
+            return False
+        if self.n >= self.taille:
+            # Plafond dur : on retire le plus recent de la priorite la plus basse en file,
+            # sauf si le nouveau ne vaut pas mieux, auquel cas c'est lui qui est jete
+            pire = max(p for p, f in self.files.items() if f)
+            if pire <= prio:
+                self.jetes[nom] += 1
+                return False
+            self.jetes[self.files[pire].pop()[1]] += 1
+            self.n -= 1
+        self.files[prio].append((fn, nom, args, kwargs))
+        self.n += 1
+        self.max = max(self.max, self.n)
+        self.pret.set()
+        return True
+    
+    def prendre(self):
+        p = min(p for p, f in self.files.items() if f)
+        self.n -= 1
+        return self.files[p].popleft()
+    
+    async def worker(self):
+        while True:
+            while not self.n:
+                self.pret.clear()
+                await self.pret.wait()
+            fn, nom, args, kwargs = self.prendre()
+            self.en_cours += 1
+            try: await self.bot._run_event(fn, nom, *args, **kwargs)
+            finally: self.en_cours -= 1
+    
+    async def run(self):
+        await asyncio.gather(*(self.worker() for _ in range(self.workers)))
+
+class PageCache:
+    # Pages de liste deja rendues ; la cle contient la version de la table source,
+    # une ecriture invalide donc toutes ses pages
+    def __init__(self, size=256):
+        self.size = size
+        self.pages = OrderedDict()
+    
+    def get(self, key, build):
+        if key in self.pages:
+            self.pages.move_to_end(key)
+            return self.pages[key]
+        v = self.pages[key] = build()
+        if len(self.pages) > self.size:
+            self.pages.popitem(last=False)
+        return v
 
 class GuildAssetManager:
-    def __init__(self):
+    def __init__(self, logs, echos):
+        self.logs = logs
+        self.echos = echos
         self.backup_dir = "guild_assets"
         os.makedirs(self.backup_dir, exist_ok=True)
     
@@ -53,16 +834,21 @@ class GuildAssetManager:
                         async with aiofiles.open(path, 'wb') as f:
                             await f.write(await r.read())
                             return True
-        except: return False
+        except Exception as ex:
+            self.logs.erreur('backup_asset', ex, url=url)
+            return False
     
     async def restore_guild_icon(self, guild):
         p = f"{self.backup_dir}/{guild.id}/icon.png"
         if os.path.exists(p):
             try:
                 async with aiofiles.open(p, 'rb') as f:
-                    await guild.edit(icon=await f.read())
+                    with self.echos.ecriture(guild.id, guild.id, 'guild_update'):
+                        await guild.edit(icon=await f.read())
                     return True
-            except: return False
+            except Exception as ex:
+                self.logs.erreur('restore_guild_icon', ex, guild=guild.id)
+                return False
         return False
     
     async def restore_guild_banner(self, guild):
@@ -70,15 +856,82 @@ class GuildAssetManager:
         if os.path.exists(p):
             try:
                 async with aiofiles.open(p, 'rb') as f:
-                    await guild.edit(banner=await f.read())
+                    with self.echos.ecriture(guild.id, guild.id, 'guild_update'):
+                        await guild.edit(banner=await f.read())
                     return True
-            except: return False
+            except Exception as ex:
+                self.logs.erreur('restore_guild_banner', ex, guild=guild.id)
+                return False
         return False
 
+class BackupScheduler:
+    # Rafraichit la sauvegarde de chaque serveur (guild_backup + icone/banniere) toutes les
+    # `intervalle` secondes, avec une phase aleatoire par serveur pour etaler la charge.
+    # L'empreinte vient du cache gateway : un serveur inchange ne coute ni I/O ni REST.
+    def __init__(self, bot, intervalle=21600, confirmation=600):
+        self.bot, self.intervalle, self.confirmation = bot, intervalle, confirmation
+        self.empreintes = {}   # guild id -> empreinte de la sauvegarde en base
+        self.vues = {}         # guild id -> nouvelle empreinte vue, en attente de confirmation
+        self.prochains = {}    # guild id -> prochaine verification (time.time)
+        self.ecrites = self.inchangees = 0
+    
+    @staticmethod
+    def empreinte(g):
+        # Memes champs que guild_backup (nom, icone, banniere, url, verification)
+        return (g.name, str(g.icon.url) if g.icon else None, str(g.banner.url) if g.banner else None,
+                g.vanity_url_code, g.verification_level.value)
+    
+    async def verifier(self, g):
+        # Renvoie le delai avant la prochaine verification de ce serveur
+        e = self.empreinte(g)
+        if e != self.empreintes.get(g.id):
+            # Relue seulement quand elle differe (d'autres chemins sauvegardent aussi)
+            row = self.bot.db.get_guild_backup(g.id)
+            self.empreintes[g.id] = tuple(row[1:6]) if row else None
+        anc = self.empreintes[g.id]
+        if e == anc:
+            self.vues.pop(g.id, None)
+            self.inchangees += 1
+            return self.intervalle
+        if self.vues.get(g.id) != e:
+            # Changement pas encore confirme : une modification malveillante en cours doit
+            # d'abord etre annulee par antimodif, on ne la sauvegarde que si elle tient
+            self.vues[g.id] = e
+            return self.confirmation
+        self.bot.db.save_guild_backup(g)
+        if not anc or anc[1:3] != e[1:3]:
+            await self.bot.asset_manager.backup_guild_assets(g)
+        self.empreintes[g.id] = e
+        del self.vues[g.id]
+        self.ecrites += 1
+        return self.intervalle
+    
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while not self.bot.is_closed():
+            now = time.time()
+            presents = {g.id for g in self.bot.guilds}
+            for gid in [gid for gid in self.prochains if gid not in presents]:
+                del self.prochains[gid]
+                self.empreintes.pop(gid, None)
+                self.vues.pop(gid, None)
+            for g in self.bot.guilds:
+                if g.id not in self.prochains:
+                    self.prochains[g.id] = now + random.uniform(0, self.intervalle)
+                elif self.prochains[g.id] <= now:
+                    try: d = await self.verifier(g)
+                    except Exception as ex:
+                        self.bot.logs.erreur('sauvegarde', ex, guild=g.id)
+                        d = self.intervalle
+                    self.prochains[g.id] = time.time() + d * random.uniform(0.9, 1.1)
+            suivant = min(self.prochains.values(), default=now + 60)
+            await asyncio.sleep(min(60, max(1, suivant - time.time())))
+
 class Database:
     def __init__(self):
         self.conn = sqlite3.connect('security.db')
         self.c = self.conn.cursor()
+        self.versions = defaultdict(int)   # compteur d'ecritures par table (cache des listes)
         self.init_db()
     
     def init_db(self):
@@ -87,6 +940,10 @@ class Database:
                          (guild_id INTEGER, user_id INTEGER, actions TEXT,
                           PRIMARY KEY (guild_id, user_id))''')
         
+        self.c.execute('''CREATE TABLE IF NOT EXISTS role_whitelist
+                         (guild_id INTEGER, role_id INTEGER, actions TEXT,
+                          PRIMARY KEY (guild_id, role_id))''')
+        
         self.c.execute('''CREATE TABLE IF NOT EXISTS sys_users
                          (guild_id INTEGER, user_id INTEGER,
                           PRIMARY KEY (guild_id, user_id))''')
@@ -108,31 +965,52 @@ class Database:
         self.c.execute('''CREATE TABLE IF NOT EXISTS log_channels
                          (guild_id INTEGER, log_type TEXT, channel_id INTEGER,
                           PRIMARY KEY (guild_id, log_type))''')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS federation
+                         (guild_id INTEGER PRIMARY KEY, mode TEXT)''')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS threats
+                         (user_id INTEGER PRIMARY KEY, guild_id INTEGER, reason TEXT,
+                          ts TIMESTAMP)''')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS audit_checkpoint
+                         (guild_id INTEGER PRIMARY KEY, entry_id INTEGER)''')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS meta
+                         (key TEXT PRIMARY KEY, value TEXT)''')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS baselines
+                         (guild_id INTEGER, action TEXT, moyenne REAL, variance REAL, n INTEGER,
+                          PRIMARY KEY (guild_id, action))''')
+        # Journal des sanctions, en ajout seul : une annulation est une ligne 'undo' (ref = id annule)
+        self.c.execute('''CREATE TABLE IF NOT EXISTS sanctions
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, user_id INTEGER,
+                          module TEXT, sanction TEXT, roles TEXT, reason TEXT, preuve TEXT,
+                          ts TIMESTAMP, ref INTEGER)''')
+        self.c.execute('CREATE INDEX IF NOT EXISTS sanctions_module ON sanctions(guild_id, module, ts)')
+        self.c.execute('CREATE INDEX IF NOT EXISTS sanctions_ref ON sanctions(ref)')
+        # Historique des incidents (chaque declenchement, reussi ou non), en ajout seul ; au-dela
+        # de la retention les lignes sont resumees par jour dans incidents_jours
+        self.c.execute('''CREATE TABLE IF NOT EXISTS incidents
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, user_id INTEGER,
+                          module TEXT, action TEXT, nb INTEGER, sanction TEXT, succes INTEGER, ts REAL)''')
+        self.c.execute('CREATE INDEX IF NOT EXISTS incidents_guild ON incidents(guild_id, ts)')
+        self.c.execute('CREATE INDEX IF NOT EXISTS incidents_user ON incidents(user_id, ts)')
+        # Fins de sanctions temporaires en attente (une ligne par minuteur, supprimee une fois executee)
+        self.c.execute('''CREATE TABLE IF NOT EXISTS minuteurs
+                         (id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, user_id INTEGER,
+                          sanction_id INTEGER, action TEXT, echeance REAL, fin REAL)''')
+        self.c.execute('CREATE INDEX IF NOT EXISTS minuteurs_sanction ON minuteurs(sanction_id)')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS incidents_jours
+                         (guild_id INTEGER, jour TEXT, module TEXT, n INTEGER, echecs INTEGER,
+                          PRIMARY KEY (guild_id, jour, module))''')
         
-        default_punishments = [
-            ('antibot', 'kick', '0'), ('antilink', 'warn', '0'),
-            ('antiping', 'warn', '0'), ('antideco', 'warn', '0'),
-            ('antichannel', 'derank', '0'), ('antirank', 'derank', '0'),
-            ('antiban', 'ban', '0'), ('antimodif', 'derank', '0')
-        ]
-        for a,s,d in default_punishments:
-            self.c.execute('INSERT OR IGNORE INTO punishments VALUES (?,?,?)', (a,s,d))
-        
-        default_modules = [
-            ('antibot',0), ('antilink',0), ('antiping',0), ('antideco',0),
-            ('antichannel',0), ('antirank',0), ('antiban',0), ('antimodif',0)
-        ]
-        for m,s in default_modules:
-            self.c.execute('INSERT OR IGNORE INTO modules VALUES (?,?)', (m,s))
-        
-        default_limits = [
-            ('antideco',3,'10s'), ('antiban',1,'10s'), ('antirole',2,'10s'),
-            ('antichannel',2,'10s'), ('antiping',5,'10s'), ('antimodif',2,'10s')
-        ]
-        for a,n,d in default_limits:
-            self.c.execute('INSERT OR IGNORE INTO action_limits VALUES (?,?,?)', (a,n,d))
+        # Valeurs par defaut declarees dans le registre des protections
+        for P in PROTECTIONS:
+            self.c.execute('INSERT OR IGNORE INTO punishments VALUES (?,?,?)', (P.key, P.defaut_punition, '0'))
+            self.c.execute('INSERT OR IGNORE INTO modules VALUES (?,?)', (P.key, 0))
+            if P.limite:
+                n,d = P.defaut_limite
+                self.c.execute('INSERT OR IGNORE INTO action_limits VALUES (?,?,?)', (P.limite, n, d))
         
         self.conn.commit()
+        self.load_role_bits()
+        self.load_federation()
     
     def export_db(self):
         data = {}
@@ -140,6 +1018,9 @@ class Database:
         self.c.execute('SELECT guild_id, user_id, actions FROM whitelist')
         data['whitelist'] = [{'guild_id': row[0], 'user_id': row[1], 'actions': row[2]} for row in self.c.fetchall()]
         
+        self.c.execute('SELECT guild_id, role_id, actions FROM role_whitelist')
+        data['role_whitelist'] = [{'guild_id': row[0], 'role_id': row[1], 'actions': row[2]} for row in self.c.fetchall()]
+        
         self.c.execute('SELECT guild_id, user_id FROM sys_users')
         data['sys_users'] = [{'guild_id': row[0], 'user_id': row[1]} for row in self.c.fetchall()]
         
@@ -165,6 +1046,7 @@ class Database:
 
     def import_db(self, data):
         self.c.execute('DELETE FROM whitelist')
+        self.c.execute('DELETE FROM role_whitelist')
         self.c.execute('DELETE FROM sys_users')
         self.c.execute('DELETE FROM punishments')
         self.c.execute('DELETE FROM modules')
@@ -177,6 +1059,10 @@ class Database:
             self.c.execute('INSERT INTO whitelist VALUES (?,?,?)', 
                           (item['guild_id'], item['user_id'], item['actions']))
         
+        for item in data.get('role_whitelist', []):
+            self.c.execute('INSERT INTO role_whitelist VALUES (?,?,?)', 
+                          (item['guild_id'], item['role_id'], item['actions']))
+        
         for item in data.get('sys_users', []):
             self.c.execute('INSERT INTO sys_users VALUES (?,?)', 
                           (item['guild_id'], item['user_id']))
@@ -201,20 +1087,36 @@ class Database:
             self.c.execute('INSERT INTO log_channels VALUES (?,?,?)', (item['guild_id'], item['log_type'], item['channel_id']))
         
         self.conn.commit()
+        self.load_role_bits()
+        self.touch('whitelist', 'role_whitelist', 'sys_users', 'limit_roles', 'limit_ping_roles')
+    
+    def touch(self, *tables):
+        for t in tables: self.versions[t] += 1
     
     # Whitelist par serveur
     def add_whitelist(self, guild_id, user_id, actions):
         self.c.execute('INSERT OR REPLACE INTO whitelist VALUES (?,?,?)', (guild_id, user_id, actions))
         self.conn.commit()
+        self.touch('whitelist')
     
     def remove_whitelist(self, guild_id, user_id):
         self.c.execute('DELETE FROM whitelist WHERE guild_id=? AND user_id=?', (guild_id, user_id))
         self.conn.commit()
+        self.touch('whitelist')
     
     def get_whitelist(self, guild_id):
         self.c.execute('SELECT user_id, actions FROM whitelist WHERE guild_id=?', (guild_id,))
         return self.c.fetchall()
     
+    def get_whitelist_page(self, guild_id, after, n):
+        self.c.execute('SELECT user_id, actions FROM whitelist WHERE guild_id=? AND user_id>? ORDER BY user_id LIMIT ?',
+                      (guild_id, after or 0, n))
+        return self.c.fetchall()
+    
+    def count_whitelist(self, guild_id):
+        self.c.execute('SELECT COUNT(*) FROM whitelist WHERE guild_id=?', (guild_id,))
+        return self.c.fetchone()[0]
+    
     def is_whitelisted(self, guild_id, user_id, act=None):
         self.c.execute('SELECT actions FROM whitelist WHERE guild_id=? AND user_id=?', (guild_id, user_id))
         r = self.c.fetchone()
@@ -222,19 +1124,86 @@ class Database:
         if not act: return True
         return act in r[0].split(',')
     
+    # Whitelist par role : role -> bits d'actions garde en memoire
+    def load_role_bits(self):
+        self.role_bits = defaultdict(dict)
+        self.c.execute('SELECT guild_id, role_id, actions FROM role_whitelist')
+        for gid, rid, actions in self.c.fetchall():
+            self.role_bits[gid][rid] = wl_bits(actions)
+    
+    def add_role_whitelist(self, guild_id, role_id, actions):
+        self.c.execute('INSERT OR REPLACE INTO role_whitelist VALUES (?,?,?)', (guild_id, role_id, actions))
+        self.conn.commit()
+        self.role_bits[guild_id][role_id] = wl_bits(actions)
+        self.touch('role_whitelist')
+    
+    def remove_role_whitelist(self, guild_id, role_id):
+        self.c.execute('DELETE FROM role_whitelist WHERE guild_id=? AND role_id=?', (guild_id, role_id))
+        self.conn.commit()
+        self.role_bits[guild_id].pop(role_id, None)
+        self.touch('role_whitelist')
+    
+    def get_role_whitelist_page(self, guild_id, after, n):
+        self.c.execute('SELECT role_id, actions FROM role_whitelist WHERE guild_id=? AND role_id>? ORDER BY role_id LIMIT ?',
+                      (guild_id, after or 0, n))
+        return self.c.fetchall()
+    
+    def count_role_whitelist(self, guild_id):
+        self.c.execute('SELECT COUNT(*) FROM role_whitelist WHERE guild_id=?', (guild_id,))
+        return self.c.fetchone()[0]
+    
+    def is_role_whitelisted(self, guild_id, roles, act=None):
+        m = self.role_bits.get(guild_id)
+        if not m: return False
+        want = WL_BITS.get(act, 0) if act else -1
+        return any(m.get(r.id, 0) & want for r in roles)
+    
+    def is_exempt(self, guild_id, user, act=None):
+        # sys, whitelist du membre ou whitelist d'un de ses roles (roles en cache)
+        return (self.is_sys(guild_id, user.id) or self.is_whitelisted(guild_id, user.id, act)
+                or self.is_role_whitelisted(guild_id, getattr(user, 'roles', ()), act))
+    
+    def export_whitelist(self, guild_id):
+        self.c.execute('''SELECT 'user', user_id, actions FROM whitelist WHERE guild_id=?
+                          UNION ALL SELECT 'role', role_id, actions FROM role_whitelist WHERE guild_id=?''', (guild_id, guild_id))
+        return self.c.fetchall()
+    
+    def import_whitelist(self, guild_id, rows):
+        # rows : (type, id, actions) ; actions vide = suppression. Une seule transaction.
+        with self.conn:
+            for typ, i, actions in rows:
+                table, col = ('whitelist', 'user_id') if typ == 'user' else ('role_whitelist', 'role_id')
+                if actions:
+                    self.conn.execute(f'INSERT OR REPLACE INTO {table} VALUES (?,?,?)', (guild_id, i, actions))
+                else:
+                    self.conn.execute(f'DELETE FROM {table} WHERE guild_id=? AND {col}=?', (guild_id, i))
+        self.load_role_bits()
+        self.touch('whitelist', 'role_whitelist')
+    
     # Sys par serveur
     def add_sys(self, guild_id, user_id):
         self.c.execute('INSERT OR IGNORE INTO sys_users VALUES (?,?)', (guild_id, user_id))
         self.conn.commit()
+        self.touch('sys_users')
     
     def remove_sys(self, guild_id, user_id):
         self.c.execute('DELETE FROM sys_users WHERE guild_id=? AND user_id=?', (guild_id, user_id))
         self.conn.commit()
+        self.touch('sys_users')
     
     def get_sys(self, guild_id):
         self.c.execute('SELECT user_id FROM sys_users WHERE guild_id=?', (guild_id,))
         return self.c.fetchall()
     
+    def get_sys_page(self, guild_id, after, n):
+        self.c.execute('SELECT user_id FROM sys_users WHERE guild_id=? AND user_id>? ORDER BY user_id LIMIT ?',
+                      (guild_id, after or 0, n))
+        return self.c.fetchall()
+    
+    def count_sys(self, guild_id):
+        self.c.execute('SELECT COUNT(*) FROM sys_users WHERE guild_id=?', (guild_id,))
+        return self.c.fetchone()[0]
+    
     def is_sys(self, guild_id, user_id):
         self.c.execute('SELECT 1 FROM sys_users WHERE guild_id=? AND user_id=?', (guild_id, user_id))
         return self.c.fetchone() is not None
@@ -258,19 +1227,42 @@ class Database:
         r = self.c.fetchone()
         return r[0] if r else 0
     
+    def get_modules(self):
+        self.c.execute('SELECT module,status FROM modules')
+        return dict(self.c.fetchall())
+    
+    def get_security_overview(self):
+        # Statuts, limites et punitions en une seule lecture
+        mods = self.get_modules()
+        self.c.execute('SELECT action,nombre,duree FROM action_limits')
+        lims = {a:(n,d) for a,n,d in self.c.fetchall()}
+        self.c.execute('SELECT action,sanction,duree FROM punishments')
+        puns = {a:(s,d) for a,s,d in self.c.fetchall()}
+        return mods, lims, puns
+    
     # Limit roles (globaux)
     def add_limit_role(self, rid, name):
         self.c.execute('INSERT OR IGNORE INTO limit_roles VALUES (?,?)', (rid,name))
         self.conn.commit()
+        self.touch('limit_roles')
     
     def remove_limit_role(self, rid):
         self.c.execute('DELETE FROM limit_roles WHERE role_id=?', (rid,))
         self.conn.commit()
+        self.touch('limit_roles')
     
     def get_limit_roles(self):
         self.c.execute('SELECT role_id,role_name FROM limit_roles')
         return self.c.fetchall()
     
+    def get_limit_roles_page(self, after, n):
+        self.c.execute('SELECT role_id,role_name FROM limit_roles WHERE role_id>? ORDER BY role_id LIMIT ?', (after or 0, n))
+        return self.c.fetchall()
+    
+    def count_limit_roles(self):
+        self.c.execute('SELECT COUNT(*) FROM limit_roles')
+        return self.c.fetchone()[0]
+    
     def is_limit_role(self, rid):
         self.c.execute('SELECT 1 FROM limit_roles WHERE role_id=?', (rid,))
         return self.c.fetchone() is not None
@@ -279,15 +1271,25 @@ class Database:
     def add_limit_ping_role(self, rid, name):
         self.c.execute('INSERT OR IGNORE INTO limit_ping_roles VALUES (?,?)', (rid,name))
         self.conn.commit()
+        self.touch('limit_ping_roles')
     
     def remove_limit_ping_role(self, rid):
         self.c.execute('DELETE FROM limit_ping_roles WHERE role_id=?', (rid,))
         self.conn.commit()
+        self.touch('limit_ping_roles')
     
     def get_limit_ping_roles(self):
         self.c.execute('SELECT role_id,role_name FROM limit_ping_roles')
         return self.c.fetchall()
     
+    def get_limit_ping_roles_page(self, after, n):
+        self.c.execute('SELECT role_id,role_name FROM limit_ping_roles WHERE role_id>? ORDER BY role_id LIMIT ?', (after or '', n))
+        return self.c.fetchall()
+    
+    def count_limit_ping_roles(self):
+        self.c.execute('SELECT COUNT(*) FROM limit_ping_roles')
+        return self.c.fetchone()[0]
+    
     def is_limit_ping_role(self, rid):
         self.c.execute('SELECT 1 FROM limit_ping_roles WHERE role_id=?', (rid,))
         return self.c.fetchone() is not None
@@ -326,33 +1328,1114 @@ class Database:
     def remove_log_channel(self, gid, typ):
         self.c.execute('DELETE FROM log_channels WHERE guild_id=? AND log_type=?', (gid, typ))
         self.conn.commit()
+    
+    # Federation (globale) : serveurs participants et liste de menaces en memoire
+    def load_federation(self):
+        self.c.execute('SELECT guild_id, mode FROM federation')
+        self.federation = dict(self.c.fetchall())
+        self.c.execute('SELECT user_id FROM threats')
+        self.threats = {r[0] for r in self.c.fetchall()}
+    
+    def set_federation(self, gid, mode):
+        if mode:
+            self.c.execute('INSERT OR REPLACE INTO federation VALUES (?,?)', (gid, mode))
+            self.federation[gid] = mode
+        else:
+            self.c.execute('DELETE FROM federation WHERE guild_id=?', (gid,))
+            self.federation.pop(gid, None)
+        self.conn.commit()
+    
+    def add_threat(self, uid, gid, reason):
+        self.c.execute('INSERT OR REPLACE INTO threats VALUES (?,?,?,?)', (uid, gid, reason, datetime.now()))
+        self.conn.commit()
+        self.threats.add(uid)
+        self.touch('threats')
+    
+    def remove_threat(self, uid):
+        self.c.execute('DELETE FROM threats WHERE user_id=?', (uid,))
+        self.conn.commit()
+        self.threats.discard(uid)
+        self.touch('threats')
+    
+    # Journal des sanctions
+    def add_sanction(self, gid, uid, module, sanction, roles, reason, preuve, ref=None):
+        self.c.execute('''INSERT INTO sanctions (guild_id, user_id, module, sanction, roles, reason, preuve, ts, ref)
+                          VALUES (?,?,?,?,?,?,?,?,?)''',
+                       (gid, uid, module, sanction, ",".join(map(str, roles)), reason,
+                        json.dumps(preuve, default=str), datetime.now(), ref))
+        self.conn.commit()
+        self.touch('sanctions')
+        return self.c.lastrowid
+    
+    def get_sanction(self, gid, sid):
+        # Sanction encore active (non annulee) : (id, user_id, module, sanction, roles)
+        self.c.execute('''SELECT id, user_id, module, sanction, roles FROM sanctions s
+                          WHERE guild_id=? AND id=? AND ref IS NULL
+                          AND NOT EXISTS (SELECT 1 FROM sanctions u WHERE u.ref=s.id)''', (gid, sid))
+        return self.c.fetchone()
+    
+    def get_sanctions_since(self, gid, module, ts):
+        self.c.execute('''SELECT id, user_id, module, sanction, roles FROM sanctions s
+                          WHERE guild_id=? AND module=? AND ts>=? AND ref IS NULL
+                          AND NOT EXISTS (SELECT 1 FROM sanctions u WHERE u.ref=s.id)''', (gid, module, ts))
+        return self.c.fetchall()
+    
+    def get_sanctions_page(self, gid, before, n):
+        # Plus recentes d'abord
+        self.c.execute('''SELECT id, user_id, module, sanction, reason, ref FROM sanctions
+                          WHERE guild_id=? AND id<? ORDER BY id DESC LIMIT ?''', (gid, before or 2**62, n))
+        return self.c.fetchall()
+    
+    def count_sanctions(self, gid):
+        self.c.execute('SELECT COUNT(*) FROM sanctions WHERE guild_id=? AND ref IS NULL', (gid,))
+        return self.c.fetchone()[0]
+    
+    # Minuteurs des sanctions temporaires
+    def add_minuteur(self, gid, uid, sid, action, echeance, fin=None):
+        self.c.execute('INSERT INTO minuteurs (guild_id, user_id, sanction_id, action, echeance, fin) VALUES (?,?,?,?,?,?)',
+                       (gid, uid, sid, action, echeance, fin))
+        self.conn.commit()
+        return self.c.lastrowid
+    
+    def get_echeances(self):
+        self.c.execute('SELECT echeance, id FROM minuteurs')
+        return self.c.fetchall()
+    
+    def get_minuteurs(self, ids):
+        q = ",".join("?" * len(ids))
+        self.c.execute(f'SELECT id, guild_id, user_id, sanction_id, action, fin FROM minuteurs WHERE id IN ({q})', ids)
+        return self.c.fetchall()
+    
+    def del_minuteurs(self, ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM minuteurs WHERE id=?', [(i,) for i in ids])
+    
+    def del_minuteurs_sanction(self, sid):
+        # Les ids restent dans le tas en memoire : ignores quand ils arrivent a echeance
+        self.c.execute('DELETE FROM minuteurs WHERE sanction_id=?', (sid,))
+        self.conn.commit()
+    
+    # Historique des incidents
+    def add_incidents(self, rows):
+        # Un lot (guild, user, module, action, nb, sanction, succes, ts) en une transaction
+        with self.conn:
+            self.conn.executemany('''INSERT INTO incidents (guild_id, user_id, module, action, nb, sanction, succes, ts)
+                                     VALUES (?,?,?,?,?,?,?,?)''', rows)
+        self.touch('incidents')
+    
+    def filtre_incidents(self, gid, user, module, depuis):
+        sql, args = 'guild_id=?', [gid]
+        if user: sql, args = sql + ' AND user_id=?', args + [user]
+        if module: sql, args = sql + ' AND module=?', args + [module]
+        if depuis: sql, args = sql + ' AND ts>=?', args + [depuis]
+        return sql, args
+    
+    def get_incidents_page(self, gid, before, n, user=None, module=None, depuis=None):
+        # Plus recents d'abord ; curseur = ts (strictement croissant, voir IncidentStore)
+        sql, args = self.filtre_incidents(gid, user, module, depuis)
+        self.c.execute(f'''SELECT ts, user_id, module, action, nb, sanction, succes FROM incidents
+                           WHERE {sql} AND ts<? ORDER BY ts DESC LIMIT ?''', args + [before or float('inf'), n])
+        return self.c.fetchall()
+    
+    def count_incidents(self, gid, user=None, module=None, depuis=None):
+        sql, args = self.filtre_incidents(gid, user, module, depuis)
+        self.c.execute(f'SELECT COUNT(*) FROM incidents WHERE {sql}', args)
+        return self.c.fetchone()[0]
+    
+    def compacter_incidents(self, avant):
+        # Lignes plus vieilles que `avant` : cumulees par (serveur, jour, module) puis supprimees
+        with self.conn:
+            self.conn.execute('''INSERT INTO incidents_jours
+                                 SELECT guild_id, date(ts, 'unixepoch') j, module, COUNT(*), SUM(succes=0)
+                                 FROM incidents WHERE ts<? GROUP BY guild_id, j, module
+                                 ON CONFLICT (guild_id, jour, module)
+                                 DO UPDATE SET n=n+excluded.n, echecs=echecs+excluded.echecs''', (avant,))
+            n = self.conn.execute('DELETE FROM incidents WHERE ts<?', (avant,)).rowcount
+        if n: self.touch('incidents')
+        return n
+    
+    def get_threats_page(self, after, n):
+        self.c.execute('SELECT user_id, guild_id, reason FROM threats WHERE user_id>? ORDER BY user_id LIMIT ?', (after or 0, n))
+        return self.c.fetchall()
+    
+    def count_threats(self):
+        self.c.execute('SELECT COUNT(*) FROM threats')
+        return self.c.fetchone()[0]
+    
+    # Checkpoints du journal d'audit (par serveur)
+    def get_checkpoints(self):
+        self.c.execute('SELECT guild_id, entry_id FROM audit_checkpoint')
+        return dict(self.c.fetchall())
+    
+    def save_checkpoints(self, points):
+        # Tous les serveurs en une transaction : tout ou rien
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO audit_checkpoint VALUES (?,?)', points.items())
+    
+    def avancer_checkpoint(self, gid, eid):
+        # Derniere entree traitee : le checkpoint ne recule jamais
+        self.c.execute('''INSERT INTO audit_checkpoint VALUES (?,?)
+                          ON CONFLICT(guild_id) DO UPDATE SET entry_id=max(entry_id, excluded.entry_id)''', (gid, eid))
+        self.conn.commit()
+    
+    # Niveaux habituels par serveur et action (seuils adaptatifs)
+    def get_baselines(self):
+        self.c.execute('SELECT guild_id, action, moyenne, variance, n FROM baselines')
+        return {(g, a): [m, v, n] for g,a,m,v,n in self.c.fetchall()}
+    
+    def save_baselines(self, stats):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO baselines VALUES (?,?,?,?,?)',
+                                  [(g, a, m, v, n) for (g, a), (m, v, n) in stats.items()])
+    
+    # Meta (etat interne du bot)
+    def set_meta(self, k, v):
+        self.c.execute('INSERT OR REPLACE INTO meta VALUES (?,?)', (k, v))
+        self.conn.commit()
+    
+    def get_meta(self, k):
+        self.c.execute('SELECT value FROM meta WHERE key=?', (k,))
+        r = self.c.fetchone()
+        return r[0] if r else None
+
+class Protection(commands.Cog):
+    # Un module de protection, declare une seule fois et charge comme Cog
+    # uniquement quand il est actif (aucun listener enregistre sinon)
+    key = None              # cle dans modules/punishments
+    nom = None              # nom affiche dans /secur
+    commande = None         # nom de la commande on/off
+    limite = None           # cle dans action_limits
+    defaut_limite = None    # (nombre, duree)
+    defaut_punition = 'warn'
+    unite = None            # nom des actions comptees (/set)
+    wl = None               # cle de whitelist
+    wl_nom = None           # nom affiche de la whitelist
+    intents = ()            # intents gateway necessaires au module
+    bit = 0                 # bit du module dans les masques (attribue par le registre)
+
+    audit = {}              # action d'audit -> (cle tracker, raison, texte du log) pour le rattrapage
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @classmethod
+    def pertinent(cls, bot, g):
+        # Le module a-t-il quelque chose a faire dans ce serveur
+        return True
+
+    def off(self, g):
+        return not self.bot.masque(g) & self.bit
+
+    def vu(self, e):
+        self.bot.marquer_vu(e.guild.id, e.id)
+
+    def exempt(self, gid, user):
+        return self.bot.db.is_exempt(gid, user, self.wl)
+
+    def compter(self, gid, uid, track, ts=None):
+        # Enregistre l'action, renvoie (nombre, duree) si la limite est atteinte : limite
+        # fixe, niveau habituel du serveur (adaptatif) ou l'un des deux (mixte), voir /seuils
+        self.bot.tracker.add_action(uid, track, ts)
+        n,d = self.bot.db.get_action_limit(self.limite)
+        dur = parse_duration(d)
+        if not dur: return None
+        cnt = self.bot.tracker.get_recent_actions(uid, track, dur.total_seconds(), ts)
+        if RECORD_ACTIONS:
+            self.bot.logs.log('action', track, guild=gid, user=uid, ts=ts or time.time(), nb=cnt, limite=n, duree=d)
+        fixe = bool(n) and cnt >= n
+        cle = (gid, track)
+        appris = self.bot.baselines.pret(cle)
+        anormal = self.bot.baselines.observer(cle, cnt)
+        if self.bot.seuils == 'mixte': hit = fixe or anormal
+        elif self.bot.seuils == 'adaptatif' and appris: hit = anormal
+        else: hit = fixe
+        return (cnt, d) if hit else None
+
+    async def rejouer(self, g, e, m):
+        # Entree manquee pendant une coupure : meme comptage et meme sanction, sans revert
+        track, reason, act = self.audit[e.action]
+        if self.exempt(g.id, m): return
+        r = self.compter(g.id, m.id, track, e.created_at.timestamp())
+        if r:
+            await self.sanctionner(g, m, f"{reason} (rattrapage)", *r, act)
+
+    async def sanctionner(self, guild, user, reason, cnt, d, act, typ="owner_logs", **kw):
+        # L'auteur peut ne pas etre en cache (mode lean) : on le recupere, puis on
+        # reverifie la whitelist par role avec ses vrais roles
+        user = await self.bot.members.resolve(guild, user)
+        if self.exempt(guild.id, user): return
+        s,_ = self.bot.db.get_punishment(self.key)
+        suc = await apply_sanction(user, self.key, reason, cnt, preuve=dict(kw, nb=cnt, tmp=d, action=act))
+        await send_punishment_log(self.bot, guild.id, typ, act, user, s, nb=cnt, tmp=d, suc=suc, module=self.key, **kw)
+
+    async def activation(self, i):
+        # Appele quand le module est active, renvoie un texte a ajouter a la reponse
+        return None
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.guilds = True
-intents.members = True
-intents.moderation = True
+class AntiBan(Protection):
+    key, nom, commande = 'antiban', "Antiban", 'antiban'
+    limite, defaut_limite, defaut_punition, unite = 'antiban', (1,'10s'), 'ban', 'bans'
+    wl, wl_nom = 'ban', "bans"
+    audit = {discord.AuditLogAction.ban: ('ban', "Anti-ban: trop de bans", "banni un membre")}
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, g, u):
+        if self.off(g) or self.bot.echos.echo(g.id, u.id, 'ban'): return
+        async for e in g.audit_logs(limit=1, action=discord.AuditLogAction.ban):
+            self.vu(e)
+            if e.target.id == u.id and not self.exempt(g.id, e.user):
+                r = self.compter(g.id, e.user.id, 'ban')
+                if r:
+                    await self.sanctionner(g, e.user, "Anti-ban: trop de bans", *r, "banni un membre", det=f"Membre: {u.name}")
+            break
+
+class AntiBot(Protection):
+    key, nom, commande = 'antibot', "Antibot", 'antibot'
+    defaut_punition = 'kick'
+    wl, wl_nom = 'bot', "bots"
+    audit = {discord.AuditLogAction.bot_add: None}
+
+    async def punir(self, m, inv):
+        if self.exempt(m.guild.id, inv): return
+        s,_ = self.bot.db.get_punishment(self.key)
+        suc = True
+        roles = anciens_roles(inv)
+        try:
+            if s=='kick':
+                await inv.kick(reason="Anti-bot")
+                await m.kick(reason="Anti-bot")
+            elif s=='ban':
+                with self.bot.echos.ecriture(m.guild.id, inv.id, 'ban'): await inv.ban(reason="Anti-bot")
+                with self.bot.echos.ecriture(m.guild.id, m.id, 'ban'): await m.ban(reason="Anti-bot")
+            elif s=='derank':
+                await inv.edit(roles=[], reason="Anti-bot")
+                await m.kick(reason="Anti-bot")
+        except Exception as ex:
+            suc = False
+            self.bot.logs.erreur('antibot', ex, guild=m.guild.id, sanction=s)
+        if suc: journaliser(inv, self.key, s, roles, "Anti-bot", bot=m.id)
+        await send_punishment_log(self.bot, m.guild.id, "owner_logs", "ajoute un bot", inv, s, suc=suc, det=f"Bot: {m.name}", module=self.key)
+
+    async def rejouer(self, g, e, inv):
+        m = g.get_member(e.target.id)
+        if m: await self.punir(m, inv)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, m):
+        if not m.bot or self.off(m.guild): return
+        await asyncio.sleep(1)
+        async for e in m.guild.audit_logs(limit=5, action=discord.AuditLogAction.bot_add):
+            self.vu(e)
+            if e.target.id == m.id:
+                await self.punir(m, e.user)
+                break
+
+class AntiChannel(Protection):
+    key, nom, commande = 'antichannel', "Antichannel", 'antichannel'
+    limite, defaut_limite, defaut_punition, unite = 'antichannel', (2,'10s'), 'derank', 'salons'
+    wl, wl_nom = 'channel', "salons"
+    audit = {
+        discord.AuditLogAction.channel_create: ('channel_create', "Anti-channel: trop de creations", "cree un salon"),
+        discord.AuditLogAction.channel_delete: ('channel_delete', "Anti-channel: trop de suppressions", "supprime un salon"),
+        discord.AuditLogAction.channel_update: ('channel_update', "Anti-channel: trop de modifications", "modifie un salon"),
+    }
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, c):
+        if self.off(c.guild): return
+        async for e in c.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_create):
+            self.vu(e)
+            if not self.exempt(c.guild.id, e.user):
+                r = self.compter(c.guild.id, e.user.id, 'channel_create')
+                with self.bot.echos.ecriture(c.guild.id, c.id, 'channel_delete'): await c.delete()
+                if r:
+                    await self.sanctionner(c.guild, e.user, "Anti-channel: trop de creations", *r, "cree un salon", det=f"Salon: {c.name}")
+            break
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, c):
+        if self.off(c.guild) or self.bot.echos.echo(c.guild.id, c.id, 'channel_delete'): return
+        async for e in c.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_delete):
+            self.vu(e)
+            if not self.exempt(c.guild.id, e.user):
+                r = self.compter(c.guild.id, e.user.id, 'channel_delete')
+                if r:
+                    await self.sanctionner(c.guild, e.user, "Anti-channel: trop de suppressions", *r, "supprime un salon", det=f"Salon: {c.name}")
+            break
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, b, a):
+        if self.off(a.guild) or self.bot.echos.echo(a.guild.id, a.id, 'channel_update'): return
+        if not (b.name!=a.name or b.category!=a.category or b.overwrites!=a.overwrites): return
+        self.bot.coalescer.add(b.guild.id, 'channel_update', (b, a), self.updates)
+
+    async def updates(self, lot):
+        # Un lot de modifications (ex: deplacement d'une categorie) : une seule lecture
+        # du journal d'audit pour attribuer tous les salons du lot
+        g = lot[0][0].guild
+        salons = {}
+        for b,a in lot:
+            salons[a.id] = (salons[a.id][0] if a.id in salons else b, a)
+        auteurs = {}
+        actions = (discord.AuditLogAction.channel_update, discord.AuditLogAction.overwrite_create,
+                   discord.AuditLogAction.overwrite_update, discord.AuditLogAction.overwrite_delete)
+        try:
+            async for e in g.audit_logs(limit=min(100, 2*len(salons)+5)):
+                if e.action in actions and e.target and e.target.id in salons:
+                    self.vu(e)
+                    auteurs.setdefault(e.target.id, e.user)
+        except Exception as ex:
+            self.bot.logs.erreur('antichannel', ex, guild=g.id)
+            return
+        par_auteur = {}
+        for cid,(b,a) in salons.items():
+            u = auteurs.get(cid)
+            if u and not self.exempt(g.id, u): par_auteur.setdefault(u.id, (u, []))[1].append((b, a))
+        async def revert(b, a):
+            try:
+                with self.bot.echos.ecriture(g.id, a.id, 'channel_update'):
+                    await a.edit(name=b.name, category=b.category, overwrites=b.overwrites)
+            except Exception as ex: self.bot.logs.erreur('antichannel', ex, guild=g.id, salon=a.id)
+        for u, modifs in par_auteur.values():
+            await asyncio.gather(*(revert(b, a) for b,a in modifs))
+            n = 1 if COALESCE_POLICY.get('channel_update') == 'lot' else len(modifs)
+            for _ in range(n): r = self.compter(g.id, u.id, 'channel_update')
+            if r:
+                noms = ", ".join(a.name for _,a in modifs[:10]) + ("..." if len(modifs) > 10 else "")
+                await self.sanctionner(g, u, "Anti-channel: trop de modifications", *r, "modifie un salon", det=f"Salon: {noms}")
+
+class AntiDeco(Protection):
+    key, nom, commande = 'antideco', "Antideco", 'antideco'
+    limite, defaut_limite, unite = 'antideco', (3,'10s'), 'decos'
+    wl, wl_nom = 'deco', "décos"
+    intents = ('voice_states',)
+    audit = {
+        discord.AuditLogAction.member_disconnect: ('deco', "Anti-deco: trop de deconnectes forces", "deconnecte un membre"),
+        discord.AuditLogAction.member_move: ('deco', "Anti-deco: trop de deplaces forces", "deplace un membre"),
+    }
+
+    TYPES = {discord.AuditLogAction.member_disconnect: "deconnecte", discord.AuditLogAction.member_move: "deplace"}
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.compteurs = VoiceAudit()
+        self.verrous = defaultdict(asyncio.Lock)
+        self.lectures = set()              # (guild, type) avec une lecture deja en attente
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, m, b, a):
+        if self.off(m.guild) or not ((b.channel and not a.channel) or (b.channel and a.channel and b.channel != a.channel)): return
+        typ = "deconnecte" if not a.channel else "deplace"
+        v = self.compteurs
+        # En attente d'attribution : par la prochaine entree d'audit, ou par une lecture si
+        # une entree recente peut encore avancer ; sinon le changement etait spontane
+        v.attendre(m.guild.id, m, typ)
+        if v.actif(m.guild.id): await self.lire(m.guild, typ)
+
+    async def lire(self, g, typ):
+        # Une lecture par (serveur, type) a la fois ; elle attribue les occurrences nouvelles
+        # aux changements en attente, ceux qui arrivent pendant la lecture en attendent une autre
+        cle = (g.id, typ)
+        if cle in self.lectures: return
+        self.lectures.add(cle)
+        async with self.verrous[cle]:
+            self.lectures.discard(cle)
+            action = discord.AuditLogAction.member_disconnect if typ == "deconnecte" else discord.AuditLogAction.member_move
+            async for e in g.audit_logs(limit=1, action=action):
+                self.vu(e)
+                v = self.compteurs
+                n = v.avance(g.id, e)
+                ms = v.membres(g.id, typ, n) if n > 0 else []
+                if ms: v.prendre(g.id, e, len(ms))
+                for m in ms: await self.traiter(m, e.user, typ)
+                break
+
+    @commands.Cog.listener()
+    async def on_audit_log_entry_create(self, e):
+        typ = self.TYPES.get(e.action)
+        if not typ or self.off(e.guild) or e.user_id == self.bot.user.id: return
+        self.vu(e)
+        v = self.compteurs
+        ms = v.membres(e.guild.id, typ, v.avance(e.guild.id, e))
+        v.prendre(e.guild.id, e, len(ms))
+        mod = e.user or discord.Object(e.user_id)
+        for m in ms: await self.traiter(m, mod, typ)
+
+    async def traiter(self, m, mod, typ):
+        if not self.exempt(m.guild.id, mod):
+            r = self.compter(m.guild.id, mod.id, 'deco')
+            if r:
+                await self.sanctionner(m.guild, mod, f"Anti-deco: trop de {typ}s forces", *r, f"{typ} un membre", "moderation", det=f"Membre: {m.name}")
+
+class AntiLink(Protection):
+    key, nom, commande = 'antilink', "Antilink", 'antilink'
+    wl, wl_nom = 'link', "liens"
+    intents = ('guild_messages', 'message_content')
+
+    @commands.Cog.listener()
+    async def on_message(self, msg):
+        if msg.author.bot or not msg.guild or self.off(msg.guild): return
+        if not re.search(DISCORD_INVITE_REGEX, msg.content, re.IGNORECASE): return
+        if self.exempt(msg.guild.id, msg.author): return
+        self.bot.purger.queue(msg, "vous n'etes pas autorise a envoyer des liens")
+        s,_ = self.bot.db.get_punishment(self.key)
+        suc = True
+        try:
+            if s=='kick': await msg.author.kick(reason="Anti-link")
+            elif s=='ban':
+                with self.bot.echos.ecriture(msg.guild.id, msg.author.id, 'ban'): await msg.author.ban(reason="Anti-link")
+        except Exception as ex:
+            suc = False
+            self.bot.logs.erreur('antilink', ex, guild=msg.guild.id, sanction=s)
+        if suc and s in ('kick', 'ban'): journaliser(msg.author, self.key, s, anciens_roles(msg.author), "Anti-link", message=msg.content[:500])
+        await send_punishment_log(self.bot, msg.guild.id, "moderation", "envoye un lien", msg.author, s, suc=suc, module=self.key)
+
+class AntiPing(Protection):
+    key, nom, commande = 'antiping', "Antieveryone", 'antiping'
+    limite, defaut_limite, unite = 'antiping', (5,'10s'), 'pings'
+    wl, wl_nom = 'ping', "pings"
+    intents = ('guild_messages',)   # les mentions arrivent sans message_content
+
+    @classmethod
+    def pertinent(cls, bot, g):
+        # Rien a faire si @everyone n'est pas limite et qu'aucun role du serveur ne l'est
+        ids = {rid for rid,_ in bot.db.get_limit_ping_roles()}
+        return "special_everyone" in ids or any(str(r.id) in ids for r in g.roles)
+
+    @commands.Cog.listener()
+    async def on_message(self, msg):
+        if msg.author.bot or not msg.guild or self.off(msg.guild): return
+        if not (msg.mention_everyone or msg.role_mentions): return
+        if self.exempt(msg.guild.id, msg.author): return
+        db = self.bot.db
+        everyone = msg.mention_everyone and db.is_limit_ping_role("special_everyone")
+        role = next((r for r in msg.role_mentions if db.is_limit_ping_role(str(r.id))), None)
+        if not (everyone or role): return
+        # Un seul passage dans la purge par message, meme avec @everyone et un role limite
+        txt = []
+        if everyone: txt.append("utiliser @everyone")
+        if role: txt.append(f"mentionner le role `@{role.name}`")
+        self.bot.purger.queue(msg, "vous n'etes pas autorise a " + " ni a ".join(txt))
+        if everyone:
+            r = self.compter(msg.guild.id, msg.author.id, 'everyone_ping')
+            if r:
+                await self.sanctionner(msg.guild, msg.author, "Anti-ping: @everyone", *r, "mentionne @everyone", "moderation")
+        if role:
+            r = self.compter(msg.guild.id, msg.author.id, 'role_ping')
+            if r:
+                await self.sanctionner(msg.guild, msg.author, "Anti-ping: roles limites", *r, "mentionne un role limite", "moderation", role=role)
+
+class AntiRole(Protection):
+    key, nom, commande = 'antirank', "Antirole", 'antirole'
+    limite, defaut_limite, defaut_punition, unite = 'antirole', (2,'10s'), 'derank', 'roles'
+    wl, wl_nom = 'rank', "rôles"
+    audit = {
+        discord.AuditLogAction.role_create: ('role_create', "Anti-role: trop de creations", "cree un role"),
+        discord.AuditLogAction.role_delete: ('role_delete', "Anti-role: trop de suppressions", "supprime un role"),
+        discord.AuditLogAction.role_update: ('role_update', "Anti-role: trop de modifications", "modifie un role"),
+    }
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        if self.off(role.guild): return
+        async for e in role.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_create):
+            self.vu(e)
+            if not self.exempt(role.guild.id, e.user):
+                r = self.compter(role.guild.id, e.user.id, 'role_create')
+                with self.bot.echos.ecriture(role.guild.id, role.id, 'role_delete'): await role.delete()
+                if r:
+                    await self.sanctionner(role.guild, e.user, "Anti-role: trop de creations", *r, "cree un role", det=f"Role: {role.name}")
+            break
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        if self.off(role.guild) or self.bot.echos.echo(role.guild.id, role.id, 'role_delete'): return
+        async for e in role.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_delete):
+            self.vu(e)
+            if not self.exempt(role.guild.id, e.user):
+                r = self.compter(role.guild.id, e.user.id, 'role_delete')
+                if r:
+                    await self.sanctionner(role.guild, e.user, "Anti-role: trop de suppressions", *r, "supprime un role", det=f"Role: {role.name}")
+            break
+
+    def sanction_directe(self, gid, uid, track, ts=None):
+        # Une escalade est sanctionnee sans attendre la limite ; elle compte quand meme
+        return self.compter(gid, uid, track, ts) or (1, self.bot.db.get_action_limit(self.limite)[1])
+
+    async def rejouer(self, g, e, m):
+        # Comme en direct, une modification de role manquee ne compte que si elle ajoute
+        # des permissions dangereuses (renommage, couleur... ne sont pas rejoues)
+        if e.action != discord.AuditLogAction.role_update: return await super().rejouer(g, e, m)
+        perms = lambda d: getattr(getattr(d, 'permissions', None), 'value', 0)
+        gain, _ = escalade(perms(e.changes.before), perms(e.changes.after))
+        if not gain or self.exempt(g.id, m): return
+        r = self.sanction_directe(g.id, m.id, 'role_update', e.created_at.timestamp())
+        await self.sanctionner(g, m, "Anti-role: permissions dangereuses ajoutees (rattrapage)", *r, "modifie un role",
+                               det=f"Role: {getattr(e.target, 'name', e.target.id)}\nPermissions: {noms_permissions(gain)}")
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, b, a):
+        # Seul l'ajout de permissions dangereuses est traite : les autres modifications
+        # (et les retraits) passent sans lecture de l'audit
+        if self.off(a.guild) or self.bot.echos.echo(a.guild.id, a.id, 'role_update'): return
+        gain, _ = escalade(b.permissions.value, a.permissions.value)
+        if not gain: return
+        async for e in b.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_update):
+            self.vu(e)
+            if not self.exempt(b.guild.id, e.user):
+                r = self.sanction_directe(b.guild.id, e.user.id, 'role_update')
+                # Seuls les bits gagnes sont retires, le reste de la modification est garde
+                try:
+                    with self.bot.echos.ecriture(a.guild.id, a.id, 'role_update'):
+                        await a.edit(permissions=discord.Permissions(a.permissions.value & ~gain))
+                except Exception as ex: self.bot.logs.erreur('antirole', ex, guild=b.guild.id, role=a.id)
+                await self.sanctionner(b.guild, e.user, "Anti-role: permissions dangereuses ajoutees", *r, "modifie un role",
+                                       det=f"Role: {a.name}\nPermissions: {noms_permissions(gain)}")
+            break
+
+    @commands.Cog.listener()
+    async def on_member_update(self, b, a):
+        # Role donne a un membre qui lui apporte des permissions dangereuses, y compris dans
+        # une meme modification qui retire un autre role (nombre de roles inchange)
+        if self.off(a.guild) or not set(a.roles) - set(b.roles): return
+        gain, _ = escalade(b.guild_permissions.value, a.guild_permissions.value)
+        if not gain: return
+        async for e in a.guild.audit_logs(limit=5, action=discord.AuditLogAction.member_role_update):
+            if not e.target or e.target.id != a.id: continue
+            await self.retirer_grant(a, e, [x for x in a.roles if x not in b.roles], gain)
+            break
+
+    @commands.Cog.listener()
+    async def on_member_hors_cache(self, m):
+        # Mode lean : pas d'etat precedent, les roles ajoutes sont lus dans l'audit et
+        # compares aux permissions que donnent les autres roles du membre
+        if self.off(m.guild) or m.id == m.guild.owner_id or not m.guild_permissions.value & DANGER_PERMS: return
+        e, new = await roles_ajoutes(m)
+        if not new: return
+        v = 0
+        for r in m.roles:
+            if r not in new: v |= r.permissions.value
+        if v & discord.Permissions.administrator.flag: v = discord.Permissions.all().value
+        gain, _ = escalade(v, m.guild_permissions.value)
+        if gain: await self.retirer_grant(m, e, new, gain)
+
+    async def retirer_grant(self, a, e, new, gain):
+        # Retire les roles ajoutes qui apportent `gain` et sanctionne celui qui les a donnes
+        self.vu(e)
+        if e.user.id == self.bot.user.id or self.exempt(a.guild.id, e.user): return
+        r = self.sanction_directe(a.guild.id, e.user.id, 'role_grant')
+        rs = [x for x in new if x.permissions.value & gain]
+        try: await a.remove_roles(*rs, reason="Anti-role: permissions dangereuses")
+        except Exception as ex: self.bot.logs.erreur('antirole', ex, guild=a.guild.id, user=a.id)
+        await self.sanctionner(a.guild, e.user, "Anti-role: role dangereux donne", *r, "donne un role",
+                               det=f"Membre: {a.mention}\nRoles: {', '.join(x.name for x in rs)}\nPermissions: {noms_permissions(gain)}")
+
+class AntiModif(Protection):
+    key, nom, commande = 'antimodif', "Antiupdate", 'antimodif'
+    limite, defaut_limite, defaut_punition, unite = 'antimodif', (2,'10s'), 'derank', 'modifs'
+    wl, wl_nom = 'guild', "serveur"
+    audit = {discord.AuditLogAction.guild_update: ('guild_modify', "Anti-modif: serveur modifie", "modifie le serveur")}
+
+    async def activation(self, i):
+        self.bot.db.save_guild_backup(i.guild)
+        await self.bot.asset_manager.backup_guild_assets(i.guild)
+        return "Serveur sauvegarde"
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, b, a):
+        if self.off(a) or self.bot.echos.echo(a.id, a.id, 'guild_update'): return
+        bk = self.bot.db.get_guild_backup(a.id)
+        if not bk:
+            self.bot.db.save_guild_backup(a)
+            return
+
+        async for e in a.audit_logs(limit=1, action=discord.AuditLogAction.guild_update):
+
+            self.vu(e)
+            if not self.exempt(a.id, e.user):
+                mods = []
+                if b.name != a.name:
+                    mods.append("le nom")
+                    try:
+                        with self.bot.echos.ecriture(a.id, a.id, 'guild_update'): await a.edit(name=bk[1])
+                    except Exception as ex: self.bot.logs.erreur('antimodif', ex, guild=a.id)
+                if b.icon != a.icon:
+                    mods.append("la photo")
+                    await self.bot.asset_manager.restore_guild_icon(a)
+                if b.banner != a.banner:
+                    mods.append("la banniere")
+                    await self.bot.asset_manager.restore_guild_banner(a)
+                if hasattr(b,'vanity_url_code') and b.vanity_url_code != a.vanity_url_code:
+                    mods.append("l'url")
+                if b.verification_level != a.verification_level:
+                    mods.append("le niveau de verification")
+                    try:
+                        with self.bot.echos.ecriture(a.id, a.id, 'guild_update'):
+                            await a.edit(verification_level=discord.VerificationLevel(bk[5]))
+                    except Exception as ex: self.bot.logs.erreur('antimodif', ex, guild=a.id)
+
+                if mods:
+                    txt = mods[0] if len(mods)==1 else ", ".join(mods[:-1]) + " et " + mods[-1]
+                    r = self.compter(a.id, e.user.id, 'guild_modify')
+                    if r:
+                        await self.sanctionner(a, e.user, f"Anti-modif: {txt}", *r, "modifie le serveur", mod=txt)
+                    await notify_owners(self.bot, f"@{e.user.name} à modifier {txt} du serveur")
+            break
+
+class AntiWebhook(Protection):
+    key, nom, commande = 'antiwebhook', "Antiwebhook", 'antiwebhook'
+    limite, defaut_limite, defaut_punition, unite = 'antiwebhook', (2,'10s'), 'derank', 'webhooks'
+    wl, wl_nom = 'webhook', "webhooks"
+    intents = ('webhooks',)
+    audit = {discord.AuditLogAction.webhook_create: ('webhook_create', "Anti-webhook: trop de creations", "cree un webhook")}
+
+    async def activation(self, i):
+        try: await self.bot.inventaire.charger(i.guild)
+        except Exception as ex:
+            self.bot.logs.erreur('antiwebhook', ex, guild=i.guild.id)
+            return "Inventaire des webhooks impossible (permission Gerer les webhooks ?)"
+        n = sum(map(len, self.bot.inventaire.salons[i.guild.id].values()))
+        return f"{n} webhooks existants autorises"
+
+    async def cog_unload(self):
+        self.bot.inventaire.salons.clear()
+        self.bot.inventaire.depuis.clear()
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, g):
+        # Inventaire de depart : les webhooks deja presents sont autorises
+        if self.off(g) or g.id in self.bot.inventaire.depuis: return
+        await self.bot.budget_global.take()
+        try: await self.bot.inventaire.charger(g)
+        except Exception as ex: self.bot.logs.erreur('antiwebhook', ex, guild=g.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, g):
+        self.bot.inventaire.oublier(g.id)
+
+    async def supprimer(self, w):
+        await self.bot.budget_global.take()
+        try:
+            with self.bot.echos.ecriture(w.guild_id, w.channel_id, 'webhooks'): await w.delete(reason="Anti-webhook")
+        except discord.NotFound: pass
+        except Exception as ex: self.bot.logs.erreur('antiwebhook', ex, guild=w.guild_id, webhook=w.id)
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, c):
+        if self.off(c.guild) or self.bot.echos.echo(c.guild.id, c.id, 'webhooks'): return
+        try: nouveaux = await self.bot.inventaire.diff(c)
+        except Exception as ex:
+            self.bot.logs.erreur('antiwebhook', ex, guild=c.guild.id, salon=c.id)
+            return
+        par_auteur = {}
+        for w in nouveaux:
+            if not w.user or w.user.id == self.bot.user.id: continue
+            u = c.guild.get_member(w.user.id) or w.user
+            if not self.exempt(c.guild.id, u): par_auteur.setdefault(u.id, (u, []))[1].append(w)
+        for u, hooks in par_auteur.values():
+            # Suppression en bloc (budget global), puis une action comptee par webhook
+            await asyncio.gather(*(self.supprimer(w) for w in hooks))
+            for _ in hooks: r = self.compter(c.guild.id, u.id, 'webhook_create')
+            if r:
+                noms = ", ".join(w.name or str(w.id) for w in hooks[:10]) + ("..." if len(hooks) > 10 else "")
+                await self.sanctionner(c.guild, u, "Anti-webhook: trop de creations", *r, "cree un webhook", det=f"Webhook: {noms} (#{c.name})")
+
+class AntiRaid(Protection):
+    key, nom, commande = 'antiraid', "Antiraid", 'antiraid'
+    limite, defaut_limite, unite = 'antiraid', (10,'10s'), 'arrivees'
+    wl, wl_nom = 'raid', "invitations"
+    intents = ('invites',)
+
+    async def activation(self, i):
+        try: await self.bot.invitations.charger(i.guild)
+        except Exception as ex:
+            self.bot.logs.erreur('antiraid', ex, guild=i.guild.id)
+            return "Invitations illisibles (permission Gerer le serveur ?)"
+        return f"{len(self.bot.invitations.invites[i.guild.id])} invitations suivies"
+
+    async def cog_unload(self):
+        self.bot.invitations.invites.clear()
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, g):
+        if self.off(g) or g.id in self.bot.invitations.invites: return
+        await self.bot.budget_global.take()
+        try: await self.bot.invitations.charger(g)
+        except Exception as ex: self.bot.logs.erreur('antiraid', ex, guild=g.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, g):
+        self.bot.invitations.oublier(g.id)
+
+    @commands.Cog.listener()
+    async def on_invite_create(self, inv):
+        self.bot.invitations.creer(inv)
+
+    @commands.Cog.listener()
+    async def on_invite_delete(self, inv):
+        if inv.guild: self.bot.invitations.supprimer(inv.guild.id, inv.code)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, m):
+        if m.bot or self.off(m.guild): return
+        try: r = await self.bot.invitations.attribuer(m)
+        except Exception as ex:
+            self.bot.logs.erreur('antiraid', ex, guild=m.guild.id)
+            return
+        if not r: return
+        lot, deltas = r
+        for code, n in deltas.items():
+            # Compte par invitation : l'acteur suivi est le code
+            for _ in range(n): hit = self.compter(m.guild.id, code, 'join')
+            if hit: await self.revoquer(m.guild, code, lot if len(deltas) == 1 else [], *hit)
+
+    async def revoquer(self, g, code, membres, cnt, d):
+        # Invitation abusee : revoquee tout de suite, puis sanction des arrivants attribues
+        _, createur = self.bot.invitations.invites.get(g.id, {}).get(code, (0, None))
+        c = g.get_member(createur) if createur else None
+        if c and self.exempt(g.id, c): return
+        self.bot.invitations.supprimer(g.id, code)
+        suc = True
+        try: await self.bot.http.delete_invite(code, reason=f"Anti-raid: {cnt} arrivees en {d}")
+        except discord.NotFound: pass
+        except Exception as ex:
+            suc = False
+            self.bot.logs.erreur('antiraid', ex, guild=g.id, invitation=code)
+        s,_ = self.bot.db.get_punishment(self.key)
+        async def punir(m):
+            await self.bot.budget_global.take()
+            try:
+                if s == 'kick': await m.kick(reason="Anti-raid")
+                else:
+                    with self.bot.echos.ecriture(m.guild.id, m.id, 'ban'): await m.ban(reason="Anti-raid")
+            except Exception as ex:
+                self.bot.logs.erreur('antiraid', ex, guild=g.id, sanction=s)
+                return
+            journaliser(m, self.key, s, anciens_roles(m), "Anti-raid", invitation=code)
+        if s in ('kick', 'ban'): await asyncio.gather(*(punir(m) for m in membres))
+        self.bot.incidents.ajouter(g.id, createur, self.key, f"invitation {code}", cnt, s, suc)
+        self.bot.logs.log('info', 'antiraid', guild=g.id, invitation=code, nb=cnt, duree=d, membres=len(membres))
+        await notify_owners(self.bot, f"Raid : {cnt} arrivees en {d} par l'invitation {code}, "
+                                      + ("revoquee" if suc else "impossible a revoquer"))
+
+# Registre des protections, dans l'ordre d'affichage de /secur
+PROTECTIONS = [AntiBan, AntiBot, AntiChannel, AntiDeco, AntiLink, AntiPing, AntiRole, AntiModif, AntiWebhook, AntiRaid]
+for n,P in enumerate(PROTECTIONS): P.bit = 1 << n
+WL_NOMS = {P.wl: P.wl_nom for P in PROTECTIONS}
+WL_BITS = {P.wl: P.bit for P in PROTECTIONS}
+
+def wl_bits(actions):
+    b = 0
+    for a in actions.split(','):
+        b |= WL_BITS.get(a.strip(), 0)
+    return b
+
+def intents_requis(mods):
+    # Intents de base + ceux des modules actifs au demarrage : sans antilink ni
+    # antiping le bot ne recoit aucun message, sans antideco aucun etat vocal
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.members = True
+    intents.moderation = True
+    for P in PROTECTIONS:
+        if mods.get(P.key):
+            for n in P.intents: setattr(intents, n, True)
+    return intents
 
 class SecurityBot(commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix='!', intents=intents)
         self.db = Database()
+        intents = intents_requis(self.db.get_modules())
+        super().__init__(command_prefix='!', intents=intents, **MemberCache.options(MEMBER_CACHE, intents))
         self.tracker = ActionTracker()
-        self.asset_manager = GuildAssetManager()
-    
+        self.logs = IncidentLogger()
+        self.echos = SelfActionLedger()
+        self.asset_manager = GuildAssetManager(self.logs, self.echos)
+        self.purger = ViolationBatcher(self.logs)
+        self.pages = PageCache()
+        self.budgets = defaultdict(RateBudget)
+        self.coalescer = EventCoalescer(self.logs)
+        self.profiler = SamplingProfiler(self)
+        self.members = MemberCache(self, MEMBER_CACHE)
+        self.baselines = Baseline(self.db.get_baselines())
+        self.scheduler = EventScheduler(self)
+        self.creations = CreationIndex()
+        self.incidents = IncidentStore(self.db, self.logs, INCIDENTS_RETENTION)
+        self.sauvegardes = BackupScheduler(self, BACKUP_INTERVAL)
+        self.minuteurs = TimedSanctions(self)
+        self.inventaire = WebhookInventory()
+        self.invitations = InviteCache()
+        self.budget_global = RateBudget(rate=40, per=1.0)   # sous la limite globale de 50/s
+        self.sanctionnes = OrderedDict()   # (guild, user) sanctionnes recemment
+        self.taches = set()                # taches de fond lancees par lancer()
+        self.seuils = self.db.get_meta('seuils') or 'fixe'
+        self.modules = 0                   # bits des modules actifs
+        self.masques = {}                  # guild id -> bits des modules actifs et pertinents
+        self.masques_v = None
+        self.audit_vus = OrderedDict()     # entrees d'audit deja traitees en direct
+        self.connecte = False
+        self.rattrapage = None
+        self.relancer = False
+
     async def setup_hook(self):
-        await self.tree.sync()
+        await self.load_modules()
+        self.lancer(self.checkpoint_loop(), 'checkpoint_loop')
+        self.lancer(self.logs.run(), 'logs')
+        self.lancer(self.scheduler.run(), 'scheduler')
+        self.lancer(self.incidents.run(), 'incidents')
+        self.lancer(self.sauvegardes.run(), 'sauvegardes')
+        self.lancer(self.minuteurs.run(), 'minuteurs')
+        if self.members.mode == 'lean':
+            p = self._connection.parsers
+            p['GUILD_MEMBER_UPDATE'] = self.members.membre_hors_cache(p['GUILD_MEMBER_UPDATE'])
+            if self.intents.guild_messages: self.add_listener(self.actif, 'on_message')
+            self.lancer(self.members.run(), 'members')
+        await self.sync_tree()
+        self.logs.log('info', 'setup_hook', message=f"Bot pret: {self.user}")
         print(f"Bot pret: {self.user}")
         for g in self.guilds:
             await self.asset_manager.backup_guild_assets(g)
             self.db.save_guild_backup(g)
     
-    async def on_guild_remove(self, g):
-        for o in OWNER_IDS:
+    def tree_hash(self):
+        # Empreinte stable de l'arbre de commandes (noms, options, choix, descriptions) et de
+        # l'application : un autre token/application resynchronise meme a arbre identique
+        cmds = []
+        for c in self.tree.get_commands():
+            try: cmds.append(c.to_dict(self.tree))
+            except TypeError: cmds.append(c.to_dict())
+        cmds.sort(key=lambda c: (c.get('type', 1), c['name']))
+        raw = json.dumps({'app': self.application_id, 'cmds': cmds}, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode()).hexdigest()
+    
+    async def sync_tree(self, force=False):
+        h = self.tree_hash()
+        if not force and self.db.get_meta('tree_hash') == h:
+            return False
+        await self.tree.sync()
+        self.db.set_meta('tree_hash', h)
+        return True
+    
+    def _schedule_event(self, coro, event_name, *args, **kwargs):
+        prio = PRIORITES.get(event_name)
+        if not prio: return super()._schedule_event(coro, event_name, *args, **kwargs)
+        self.scheduler.soumettre(prio, coro, event_name, *args, **kwargs)
+    
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        # Toute exception d'un handler est journalisee avec son serveur et sa latence
+        t0 = time.perf_counter()
+        # Une annulation n'est pas avalee : un worker du scheduler doit pouvoir s'arreter
+        cog = getattr(coro, '__self__', None)
+        jeton = EVENEMENT.set(f"{event_name}:{cog.key}" if isinstance(cog, Protection) else event_name)
+        try:
+            await coro(*args, **kwargs)
+        except Exception as ex:
+            self.logs.erreur(event_name, ex, guild=guild_id(args), latence=time.perf_counter() - t0)
+        finally:
+            EVENEMENT.reset(jeton)
+    
+    async def on_message(self, msg):
+        # Aucune commande prefixee : pas de get_context pour chaque message
+        pass
+    
+    async def actif(self, msg):
+        if msg.guild: self.members.touch(msg.author)
+    
+    async def on_ready(self):
+        self.lancer_rattrapage()
+    
+    async def on_resumed(self):
+        self.lancer_rattrapage()
+    
+    async def on_disconnect(self):
+        if self.connecte: self.marquer_checkpoints()
+        self.connecte = False
+    
+    def marquer_vu(self, gid, eid, rattrapage=False):
+        # Le checkpoint suit la derniere entree traitee : apres un redemarrage, le rattrapage
+        # reprend apres elle et ne sanctionne pas une deuxieme fois. Pendant un rattrapage,
+        # seul celui-ci l'avance (du plus ancien au plus recent), sinon un arret en cours de
+        # route sauterait les entrees pas encore rejouees.
+        self.audit_vus[eid] = None
+        if rattrapage or not (self.rattrapage and not self.rattrapage.done()):
+            self.db.avancer_checkpoint(gid, eid)
+    
+    def marquer_checkpoints(self):
+        # Tout ce qui precede cet instant a ete traite en direct ; jamais pendant un
+        # rattrapage, qui enregistre lui-meme ses checkpoints a la fin
+        if self.rattrapage and not self.rattrapage.done(): return
+        sf = discord.utils.time_snowflake(discord.utils.utcnow())
+        self.db.save_checkpoints({g.id: sf for g in self.guilds})
+    
+    async def close(self):
+        self.incidents.vider()
+        await super().close()
+    
+    async def checkpoint_loop(self):
+        while not self.is_closed():
+            await asyncio.sleep(60)
+            if self.connecte: self.marquer_checkpoints()
+            if self.baselines.modifie:
+                self.baselines.modifie = False
+                self.db.save_baselines(self.baselines.stats)
+    
+    def lancer_rattrapage(self):
+        self.connecte = True
+        if self.rattrapage and not self.rattrapage.done():
+            self.relancer = True
+            return
+        self.rattrapage = self.lancer(self.rattraper_tout(), 'rattrapage')
+    
+    async def rattraper_tout(self, workers=4, max_age=timedelta(hours=24)):
+        # Rejoue les entrees d'audit manquees pendant la coupure, pour tous les serveurs
+        # en parallele (au plus `workers` a la fois), puis avance les checkpoints
+        fin = discord.utils.time_snowflake(discord.utils.utcnow())
+        mini = discord.utils.time_snowflake(discord.utils.utcnow() - max_age)
+        points = self.db.get_checkpoints()
+        sem = asyncio.Semaphore(workers)
+        async def guild(g):
+            async with sem:
+                if g.id in points:
+                    await self.rattraper(g, max(points[g.id], mini), fin)
+                points[g.id] = max(points.get(g.id, 0), fin)
+        await asyncio.gather(*(guild(g) for g in self.guilds))
+        self.db.save_checkpoints(points)
+        while len(self.audit_vus) > 5000: self.audit_vus.popitem(last=False)
+        if self.relancer:
+            self.relancer = False
+            await self.rattraper_tout(workers, max_age)
+    
+    async def rattraper(self, g, apres, avant):
+        specs = {}
+        for cog in self.cogs.values():
+            if isinstance(cog, Protection):
+                for a in cog.audit: specs[a] = cog
+        if not specs: return
+        try:
+            async for e in g.audit_logs(limit=None, after=discord.Object(apres), before=discord.Object(avant), oldest_first=True):
+                if e.action in CREATIONS and e.user and e.target and e.user.id != self.user.id:
+                    self.creations.ajouter(g.id, e.user.id, CREATIONS[e.action], e.target.id, e.created_at.timestamp())
+                cog = specs.get(e.action)
+                if not cog or e.id in self.audit_vus or not e.user or e.user.id == self.user.id: continue
+                self.marquer_vu(g.id, e.id, rattrapage=True)
+                m = g.get_member(e.user.id)
+                if not m:
+                    try: m = await g.fetch_member(e.user.id)
+                    except discord.NotFound: continue
+                    except Exception as ex:
+                        self.logs.erreur('rattrapage', ex, guild=g.id, entree=e.id)
+                        continue
+                await cog.rejouer(g, e, m)
+        except Exception as ex: self.logs.erreur('rattrapage', ex, guild=g.id)
+    
+    async def on_audit_log_entry_create(self, e):
+        typ = CREATIONS.get(e.action)
+        if typ and e.user_id and e.target and e.user_id != self.user.id:
+            self.creations.ajouter(e.guild.id, e.user_id, typ, e.target.id)
+    
+    async def nettoyer(self, g, uid):
+        # Supprime en parallele ce que l'acteur sanctionne a cree dans la fenetre ; le
+        # budget global garde de la marge pour les autres appels sous la limite de 50/s
+        objets = self.creations.prendre(g.id, uid)
+        if not objets: return
+        raison = "Nettoyage: createur sanctionne"
+        async def suppr(typ, oid):
+            if typ == 'salon': obj = g.get_channel(oid)
+            elif typ == 'role': obj = g.get_role(oid)
+            else: obj = None
+            if obj is None and typ != 'webhook': return
+            await self.budget_global.take()
             try:
-                u = await self.fetch_user(o)
-                await u.send("j'ai ete kick")
-            except: pass
+                if obj is not None:
+                    with self.echos.ecriture(g.id, oid, 'channel_delete' if typ == 'salon' else 'role_delete'):
+                        await obj.delete(reason=raison)
+                else: await self.http.request(discord.http.Route('DELETE', '/webhooks/{webhook_id}', webhook_id=oid), reason=raison)
+            except discord.NotFound: pass
+            except Exception as ex: self.logs.erreur('nettoyage', ex, guild=g.id, objet=oid, type=typ)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(suppr(typ, oid) for typ, oid in objets))
+        self.logs.log('info', 'nettoyage', guild=g.id, user=uid, objets=len(objets),
+                      duree_ms=round((time.perf_counter() - t0) * 1000))
+    
+    async def load_modules(self):
+        # Charge les Cogs des modules actifs et retire les autres (aucun listener pour un module off)
+        mods = self.db.get_modules()
+        for P in PROTECTIONS:
+            if mods.get(P.key) and not self.get_cog(P.__name__):
+                await self.add_cog(P(self))
+            elif not mods.get(P.key) and self.get_cog(P.__name__):
+                await self.remove_cog(P.__name__)
+        self.modules = sum(P.bit for P in PROTECTIONS if mods.get(P.key))
+        self.masques.clear()
+    
+    async def set_module(self, P, status):
+        self.db.set_module_status(P.key, status)
+        await self.load_modules()
+    
+    def masque(self, g):
+        # Modules a appliquer dans ce serveur, en cache par serveur. Il depend des modules
+        # actifs (load_modules vide le cache), de la liste des pings limites (version en base)
+        # et des roles du serveur pour antiping (on_guild_role_create/delete l'invalident)
+        v = self.db.versions['limit_ping_roles']
+        if v != self.masques_v:
+            self.masques.clear()
+            self.masques_v = v
+        m = self.masques.get(g.id)
+        if m is None:
+            m = self.masques[g.id] = sum(P.bit for P in PROTECTIONS if self.modules & P.bit and P.pertinent(self, g))
+        return m
+    
+    async def on_guild_role_create(self, r):
+        self.masques.pop(r.guild.id, None)
+    
+    async def on_guild_role_delete(self, r):
+        self.masques.pop(r.guild.id, None)
+    
+    def intents_manquants(self, P):
+        # Intents choisis au demarrage : un module active ensuite peut en demander d'autres
+        return [n for n in P.intents if not getattr(self.intents, n)]
+    
+    async def federate(self, origin, user, reason):
+        # Sanction dans un serveur participant : menace partagee, puis action
+        # preventive dans les autres serveurs participants en parallele
+        if origin.id not in self.db.federation or user.id in OWNER_IDS: return
+        if user.id == self.user.id: return
+        self.db.add_threat(user.id, origin.id, reason)
+        cibles = [g for g in self.guilds if g.id != origin.id and g.id in self.db.federation]
+        await asyncio.gather(*(self.apply_threat(g, user, f"Federation ({origin.name}): {reason}") for g in cibles))
+    
+    async def apply_threat(self, g, user, reason):
+        m = g.get_member(user.id)
+        if self.db.is_exempt(g.id, m or user): return
+        s = 'ban' if self.db.federation.get(g.id) == 'ban' else 'quarantine'
+        if s == 'quarantine' and not m: return
+        roles = anciens_roles(m)
+        await self.budgets[g.id].take()
+        try:
+            if s == 'ban':
+                with self.echos.ecriture(g.id, user.id, 'ban'): await g.ban(discord.Object(user.id), reason=reason)
+            else:
+                await m.edit(roles=[], timed_out_until=discord.utils.utcnow() + TIMEOUT_MAX, reason=reason)
+        except Exception as ex:
+            self.logs.erreur('federation', ex, guild=g.id, user=user.id)
+            return
+        # Journalise comme une sanction : /undo retablit les roles ou leve le ban
+        if m: journaliser(m, 'federation', s, roles, reason)
+        else: self.db.add_sanction(g.id, user.id, 'federation', s, [], reason, {})
+    
+    def lancer(self, coro, op, **ctx):
+        # Tache de fond suivie : reference gardee, exception envoyee aux logs
+        t = asyncio.create_task(coro)
+        self.taches.add(t)
+        def fin(t):
+            self.taches.discard(t)
+            if not t.cancelled() and t.exception():
+                self.logs.erreur(op, t.exception(), **ctx)
+        t.add_done_callback(fin)
+        return t
+    
+    async def on_guild_remove(self, g):
+        await notify_owners(self, "j'ai ete kick")
     
     async def on_guild_join(self, g):
         await self.asset_manager.backup_guild_assets(g)
@@ -363,7 +2446,7 @@ class SecurityBot(commands.Bot):
                 if e.target.id == self.user.id:
                     inviter = e.user
                     break
-        except: pass
+        except Exception as ex: self.logs.erreur('on_guild_join', ex, guild=g.id)
         for o in OWNER_IDS:
             try:
                 u = await self.fetch_user(o)
@@ -371,12 +2454,14 @@ class SecurityBot(commands.Bot):
                     chan = g.system_channel or g.text_channels[0]
                     invite = await chan.create_invite(max_age=3600, max_uses=1)
                     lien = invite.url
-                except: lien = "Impossible de creer un lien"
+                except Exception as ex:
+                    self.logs.erreur('on_guild_join', ex, guild=g.id)
+                    lien = "Impossible de creer un lien"
                 if inviter:
                     await u.send(f"{inviter.mention} ma ajouter dans {g.name}\nLien : {lien}")
                 else:
                     await u.send(f"Quelqu'un ma ajouter dans {g.name}\nLien : {lien}")
-            except: pass
+            except Exception as ex: self.logs.erreur('notify_owners', ex, guild=g.id, owner=o)
 
 bot = SecurityBot()
 
@@ -411,7 +2496,7 @@ def is_sys_or_wl():
     async def p(i):
         if i.user.id in OWNER_IDS: return True
         if not i.guild: return False
-        if bot.db.is_sys(i.guild.id, i.user.id) or bot.db.is_whitelisted(i.guild.id, i.user.id): return True
+        if bot.db.is_exempt(i.guild.id, i.user): return True
         e = discord.Embed(title="Permission refusee", description="Tu n'as pas les permissions necessaires", color=0xFFFFFF)
         await i.response.send_message(embed=e, ephemeral=True)
         return False
@@ -427,6 +2512,14 @@ def is_sys_and_wl():
         return False
     return app_commands.check(p)
 
+async def notify_owners(bt, txt):
+    async def envoyer(o):
+        try:
+            u = bt.get_user(o) or await bt.fetch_user(o)
+            await u.send(txt)
+        except Exception as ex: bt.logs.erreur('notify_owners', ex, owner=o)
+    await asyncio.gather(*(envoyer(o) for o in OWNER_IDS))
+
 def parse_duration(d):
     if not d or d=='0': return None
     u = d[-1]; v = int(d[:-1])
@@ -436,7 +2529,8 @@ def parse_duration(d):
     if u=='d': return timedelta(days=v)
     return None
 
-async def send_punishment_log(bt, gid, typ, act, usr, pun=None, role=None, nb=None, tmp=None, mod=None, suc=True, det=None):
+async def send_punishment_log(bt, gid, typ, act, usr, pun=None, role=None, nb=None, tmp=None, mod=None, suc=True, det=None, module=None):
+    if module: bt.incidents.ajouter(gid, usr.id, module, act, nb, pun, suc)
     cid = bt.db.get_log_channel(gid, typ)
     if not cid: return
     g = bt.get_guild(gid)
@@ -456,58 +2550,236 @@ async def send_punishment_log(bt, gid, typ, act, usr, pun=None, role=None, nb=No
     e = discord.Embed(title=f"**{act.upper()}**", description=desc, color=0xFFFFFF)
     if det and act not in ["mentionné un rôle limité","banni un membre","modifié le serveur"]:
         e.add_field(name="Details", value=det, inline=False)
-    try: await c.send(embed=e)
-    except: pass
+    async def envoyer():
+        try: await c.send(embed=e)
+        except Exception as ex: bt.logs.erreur('send_punishment_log', ex, guild=gid, log_type=typ)
+    # Differe derriere les evenements, jete si la file est profonde
+    bt.scheduler.soumettre(PRIORITES['log_embed'], envoyer, 'log_embed')
 
-async def apply_sanction(m, act, reason, cnt=None):
+def anciens_roles(m):
+    return [r.id for r in getattr(m, 'roles', ()) if not r.is_default()]
+
+def journaliser(m, act, s, roles, reason, **preuve):
+    # Sanction reussie : roles d'avant et preuve du declencheur, pour /undo
+    if getattr(m, 'guild', None):
+        sid = bot.db.add_sanction(m.guild.id, m.id, act, s, roles, reason, preuve)
+        bot.sanctionnes[(m.guild.id, m.id)] = None
+        while len(bot.sanctionnes) > 5000: bot.sanctionnes.popitem(last=False)
+        return sid
+
+async def apply_sanction(m, act, reason, cnt=None, preuve=None):
     s, d = bot.db.get_punishment(act)
-    if s == 'kick':
-        try:
+    dur = parse_duration(d)
+    suc = False
+    roles = anciens_roles(m)
+    t0 = time.perf_counter()
+    try:
+        if s == 'kick':
             await m.kick(reason=reason)
-            for o in OWNER_IDS:
-                try:
-                    u = await bot.fetch_user(o)
-                    await u.send(f"{m.mention} ma kick du serveur")
-                except: pass
-        except: pass
-    elif s == 'ban':
-        try: await m.ban(reason=reason)
-        except: pass
-    elif s == 'derank':
-        try: await m.edit(roles=[], reason=reason)
-        except: pass
-    elif s == 'tempmute' and d != '0':
-        try:
-            dur = parse_duration(d)
-            if dur: await m.timeout(dur, reason=reason)
-        except: pass
+            suc = True
+            await notify_owners(bot, f"{m.mention} ma kick du serveur")
+        elif s in ('tempban', 'tempderank', 'tempmute') and not dur:
+            # Configuration d'avant la verification de /punition : pas de sanction definitive par defaut
+            raise ValueError(f"{s} sans duree ({d})")
+        elif s in ('ban', 'tempban'):
+            with bot.echos.ecriture(m.guild.id, m.id, 'ban'): await m.ban(reason=reason)
+            suc = True
+        elif s in ('derank', 'tempderank'):
+            await m.edit(roles=[], reason=reason)
+            suc = True
+        elif s == 'tempmute':
+            await m.timeout(min(dur, TIMEOUT_MAX), reason=reason)
+            suc = True
+    except Exception as ex:
+        bot.logs.erreur('apply_sanction', ex, guild=guild_id([m]), latence=time.perf_counter() - t0,
+                        module=act, sanction=s, user=m.id)
+    if suc:
+        sid = journaliser(m, act, s, roles, reason, **(preuve or {}))
+        if sid and dur:
+            fin = time.time() + dur.total_seconds()
+            if s in ('tempban', 'tempderank'):
+                bot.minuteurs.planifier(m.guild.id, m.id, sid, 'annuler', fin, fin)
+            elif s == 'tempmute' and dur > TIMEOUT_MAX:
+                bot.minuteurs.planifier(m.guild.id, m.id, sid, 'prolonger', time.time() + TIMEOUT_MAX.total_seconds() - 3600, fin)
+    if suc and getattr(m, 'guild', None):
+        bot.lancer(bot.federate(m.guild, m, reason), 'federation', guild=m.guild.id, user=m.id)
+        bot.lancer(bot.nettoyer(m.guild, m.id), 'nettoyage', guild=m.guild.id, user=m.id)
+    # Un warn reussit toujours : False reste reserve aux echecs REST et au temp sans duree
+    return suc or s not in SANCTIONS_REST
 
-@bot.tree.command(name="secur", description="Configuration securite")
-@is_sys_or_wl()
-async def secur(i):
-    mods = {m:bot.db.get_module_status(m) for m in ['antiban','antibot','antichannel','antideco','antiping','antirank','antimodif']}
-    lims = {a:bot.db.get_action_limit(a) for a in ['antiban','antideco','antiping','antirole','antichannel','antimodif']}
-    puns = {a:bot.db.get_punishment(a) for a in ['antiban','antibot','antichannel','antideco','antiping','antirank','antimodif']}
-    
-    desc = ""
-    for nom,cle,lim,pun in [
-        ("Antiban","antiban","antiban","antiban"),
-        ("Antibot","antibot",None,"antibot"),
-        ("Antichannel","antichannel","antichannel","antichannel"),
-        ("Antideco","antideco","antideco","antideco"),
-        ("Antieveryone","antiping","antiping","antiping"),
-        ("Antirole","antirank","antirole","antirank"),
-        ("Antiupdate","antimodif","antimodif","antimodif")
-    ]:
-        st = "on" if mods.get(cle,0) else "off"
-        if lim:
-            nb,dr = lims.get(lim,(0,"0s"))
-            desc += f"**{nom}**: {st} {nb}/{dr} - {puns.get(pun,('rien','0'))[0]}\n"
+async def annuler(g, row, par, typ='undo'):
+    # Retablit l'etat d'avant la sanction en un seul appel ; un kick ne peut pas etre annule.
+    # Aussi appele a l'echeance d'une sanction temporaire (typ='expiration').
+    sid, uid, module, s, roles = row
+    if s not in ('ban', 'derank', 'tempmute', 'tempban', 'tempderank', 'quarantine'): return False
+    raison = f"Annulation de la sanction #{sid} par {par}" if typ == 'undo' else f"Fin de la sanction #{sid}"
+    await bot.budgets[g.id].take()
+    try:
+        if s in ('ban', 'tempban'):
+            await g.unban(discord.Object(uid), reason=raison)
         else:
-            desc += f"**{nom}**: {st} - {puns.get(pun,('rien','0'))[0]}\n"
-    
-    e = discord.Embed(title="# Securite", description=desc, color=0xFFFFFF)
-    await i.response.send_message(embed=e)
+            m = g.get_member(uid) or await g.fetch_member(uid)
+            if s in ('derank', 'tempderank', 'quarantine'):
+                ids = {int(r) for r in roles.split(",") if r}
+                rs = [r for r in (g.get_role(x) for x in ids) if r and not r.managed]
+                rs += [r for r in m.roles if not r.is_default() and r not in rs]
+                if s == 'quarantine': await m.edit(roles=rs, timed_out_until=None, reason=raison)
+                else: await m.edit(roles=rs, reason=raison)
+            else:
+                await m.timeout(None, reason=raison)
+    except Exception as ex:
+        # A l'echeance, un ban deja leve ou un membre parti : plus rien a retablir
+        if not (typ == 'expiration' and isinstance(ex, discord.NotFound)):
+            bot.logs.erreur(typ, ex, guild=g.id, sanction=sid, user=uid)
+            return False
+    bot.db.add_sanction(g.id, uid, module, typ, [], raison, {'par': par}, ref=sid)
+    if typ == 'undo': bot.db.del_minuteurs_sanction(sid)
+    return True
+
+class Liste:
+    # Une liste paginee par curseur : la requete d'une page et le rendu d'une ligne
+    def __init__(self, titre, table, vide, total, fetch, count, ligne, taille=15, filtre=()):
+        self.titre, self.table, self.vide, self.total = titre, table, vide, total
+        self.fetch, self.count, self.ligne, self.taille = fetch, count, ligne, taille
+        self.filtre = filtre   # parametres de la requete, dans la cle du cache de pages
+    
+    def render(self, guild, cur, page):
+        rows = self.fetch(guild, cur, self.taille + 1)
+        suivant = rows[self.taille - 1][0] if len(rows) > self.taille else None
+        rows = rows[:self.taille]
+        if not rows: return self.vide, None
+        desc = "".join(self.ligne(guild, n, row) for n,row in enumerate(rows, page * self.taille + 1))
+        return desc, suivant
+
+class PageView(discord.ui.View):
+    # Boutons precedent/suivant : une seule page chargee et rendue a la fois
+    def __init__(self, liste, guild, uid):
+        super().__init__(timeout=180)
+        self.liste, self.guild, self.uid = liste, guild, uid
+        self.cursors = [None]
+        self.suivant = None
+    
+    def render(self):
+        l = self.liste
+        v = bot.db.versions[l.table]
+        page = len(self.cursors) - 1
+        desc, self.suivant = bot.pages.get((l.table, l.filtre, self.guild.id, self.cursors[-1], v),
+                                           lambda: l.render(self.guild, self.cursors[-1], page))
+        total = bot.pages.get((l.table, l.filtre, self.guild.id, 'total', v), lambda: l.count(self.guild))
+        e = discord.Embed(title=l.titre, description=desc, color=0xFFFFFF)
+        if total:
+            e.set_footer(text=l.total.format(total) + (f" - page {page+1}" if total > l.taille else ""))
+        self.precedent.disabled = page == 0
+        self.page_suivante.disabled = self.suivant is None
+        return e
+    
+    async def interaction_check(self, i):
+        return i.user.id == self.uid
+    
+    @discord.ui.button(label="<", style=discord.ButtonStyle.secondary)
+    async def precedent(self, i, b):
+        if len(self.cursors) > 1: self.cursors.pop()
+        await i.response.edit_message(embed=self.render(), view=self)
+    
+    @discord.ui.button(label=">", style=discord.ButtonStyle.secondary)
+    async def page_suivante(self, i, b):
+        if self.suivant is not None: self.cursors.append(self.suivant)
+        await i.response.edit_message(embed=self.render(), view=self)
+
+async def send_liste(i, liste):
+    if not i.guild:
+        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    v = PageView(liste, i.guild, i.user.id)
+    e = v.render()
+    if v.suivant is None: await i.response.send_message(embed=e)
+    else: await i.response.send_message(embed=e, view=v)
+
+def format_wl(actions):
+    action_names = [WL_NOMS[a] for a in actions.split(",") if a in WL_NOMS]
+    if len(action_names) == 1:
+        return f"**{action_names[0]}**"
+    dernier = action_names.pop()
+    return f"**{', '.join(action_names)} et {dernier}**"
+
+def ligne_wl(g, n, row):
+    uid, actions = row
+    user = bot.get_user(uid)
+    mention = user.mention if user else f"`{uid}`"
+    return f"{mention} → {format_wl(actions)}\n"
+
+def ligne_wlrole(g, n, row):
+    rid, actions = row
+    r = g.get_role(rid)
+    return f"{r.mention if r else f'`{rid}`'} → {format_wl(actions)}\n"
+
+def ligne_threat(g, n, row):
+    uid, gid, reason = row
+    src = bot.get_guild(gid)
+    return f"`{uid}` - {src.name if src else gid} : {reason}\n"
+
+def ligne_sanction(g, n, row):
+    sid, uid, module, s, reason, ref = row
+    if ref: return f"`#{sid}` {'fin' if s == 'expiration' else 'annulation'} de `#{ref}` - <@{uid}>\n"
+    return f"`#{sid}` <@{uid}> - {module} : {s} ({reason})\n"
+
+def ligne_incident(g, n, row):
+    ts, uid, module, act, nb, s, suc = row
+    txt = f"<t:{int(ts)}:f> <@{uid}> - {module} : {act}"
+    if nb: txt += f" x{nb}"
+    return txt + f" → {s or 'rien'}" + ("" if suc else " (echec)") + "\n"
+
+def ligne_sys(g, n, row):
+    uid = row[0]
+    u = bot.get_user(uid) or f"Inconnu({uid})"
+    return f"``{n}` {u}`\n`{uid}`\n---\n"
+
+def ligne_limit_role(g, n, row):
+    rid, name = row
+    r = g.get_role(rid)
+    return f"{r.mention if r else '@'+name}\n"
+
+def ligne_limit_ping(g, n, row):
+    rid, name = row
+    if rid.startswith("special_"): return f"@{name}\n"
+    r = g.get_role(int(rid))
+    return f"{r.mention if r else '@'+name}\n"
+
+LISTES = {
+    'wl': Liste("Liste Whitelist", 'whitelist', "Aucun utilisateur whitelist.", "Total: {} utilisateur(s)",
+                lambda g,cur,n: bot.db.get_whitelist_page(g.id, cur, n), lambda g: bot.db.count_whitelist(g.id), ligne_wl),
+    'wlrole': Liste("Roles whitelist", 'role_whitelist', "Aucun role whitelist.", "Total: {} role(s)",
+                    lambda g,cur,n: bot.db.get_role_whitelist_page(g.id, cur, n), lambda g: bot.db.count_role_whitelist(g.id), ligne_wlrole),
+    'threats': Liste("Menaces federees", 'threats', "Aucune menace", "Total: {} menace(s)",
+                     lambda g,cur,n: bot.db.get_threats_page(cur, n), lambda g: bot.db.count_threats(), ligne_threat),
+    'sanctions': Liste("Journal des sanctions", 'sanctions', "Aucune sanction", "Total: {} sanction(s)",
+                       lambda g,cur,n: bot.db.get_sanctions_page(g.id, cur, n), lambda g: bot.db.count_sanctions(g.id), ligne_sanction),
+    'sys': Liste("**Liste sys**", 'sys_users', "Aucun utilisateur sur ce serveur", "Total: {} sur ce serveur",
+                 lambda g,cur,n: bot.db.get_sys_page(g.id, cur, n), lambda g: bot.db.count_sys(g.id), ligne_sys),
+    'limit': Liste("**Liste roles limites**", 'limit_roles', "Aucun role", "roles : {}",
+                   lambda g,cur,n: bot.db.get_limit_roles_page(cur, n), lambda g: bot.db.count_limit_roles(), ligne_limit_role),
+    'limit_ping': Liste("**Liste pings limites**", 'limit_ping_roles', "Aucune configuration", "elements : {}",
+                        lambda g,cur,n: bot.db.get_limit_ping_roles_page(cur, n), lambda g: bot.db.count_limit_ping_roles(), ligne_limit_ping),
+}
+
+@bot.tree.command(name="secur", description="Configuration securite")
+@is_sys_or_wl()
+async def secur(i):
+    mods, lims, puns = bot.db.get_security_overview()
+    
+    desc = ""
+    for P in PROTECTIONS:
+        st = "on" if mods.get(P.key,0) else "off"
+        pun = puns.get(P.key,('rien','0'))[0]
+        if P.limite:
+            nb,dr = lims.get(P.limite,(0,"0s"))
+            desc += f"**{P.nom}**: {st} {nb}/{dr} - {pun}\n"
+        else:
+            desc += f"**{P.nom}**: {st} - {pun}\n"
+    
+    e = discord.Embed(title="# Securite", description=desc, color=0xFFFFFF)
+    await i.response.send_message(embed=e)
 
 @bot.tree.command(name="savedb", description="Sauvegarder DB")
 @is_sys_and_wl()
@@ -533,209 +2805,238 @@ async def setdb(i, fichier: discord.Attachment):
             await i.followup.send(embed=e); return
         d = json.loads(await fichier.read())
         bot.db.import_db(d)
+        await bot.load_modules()
         e = discord.Embed(title="Restoration", description="DB restauree", color=0xFFFFFF)
         await i.followup.send(embed=e)
     except Exception as ex:
         e = discord.Embed(title="Erreur", description=f"Erreur: {str(ex)}", color=0xFFFFFF)
         await i.followup.send(embed=e)
 
+@bot.tree.command(name="sync", description="Forcer la synchronisation des commandes")
+@is_owner()
+async def sync_cmds(i):
+    await i.response.defer(ephemeral=True)
+    try:
+        await bot.sync_tree(force=True)
+        e = discord.Embed(title="Commandes", description="Commandes synchronisees", color=0xFFFFFF)
+    except Exception as ex:
+        e = discord.Embed(title="Erreur", description=f"Erreur: {str(ex)}", color=0xFFFFFF)
+    await i.followup.send(embed=e, ephemeral=True)
+
+@bot.tree.command(name="federation", description="Participer a la federation de sanctions")
+@app_commands.describe(mode="Action preventive contre les menaces des autres serveurs")
+@app_commands.choices(mode=[
+    app_commands.Choice(name="ban", value="ban"),
+    app_commands.Choice(name="quarantaine", value="quarantine"),
+    app_commands.Choice(name="off", value="off")
+])
+@is_owner()
+async def federation(i, mode: str):
+    if not i.guild:
+        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    bot.db.set_federation(i.guild.id, None if mode == "off" else mode)
+    desc = "Federation desactivee" if mode == "off" else f"Federation activee : {mode}"
+    e = discord.Embed(title="Federation", description=desc, color=0xFFFFFF)
+    await i.response.send_message(embed=e)
+
+@bot.tree.command(name="threats", description="Liste des menaces federees")
+@is_owner()
+async def threats(i):
+    await send_liste(i, LISTES['threats'])
+
+@bot.tree.command(name="unthreat", description="Retirer une menace federee")
+@app_commands.describe(user="Utilisateur")
+@is_owner()
+async def unthreat(i, user: discord.User):
+    bot.db.remove_threat(user.id)
+    e = discord.Embed(title="Federation", description=f"{user.mention} n'est plus une menace", color=0xFFFFFF)
+    await i.response.send_message(embed=e)
+
+@bot.tree.command(name="sanctions", description="Journal des sanctions du serveur")
+@is_owner()
+async def sanctions(i):
+    await send_liste(i, LISTES['sanctions'])
+
+@bot.tree.command(name="incidents", description="Historique des incidents du serveur")
+@app_commands.describe(membre="Auteur des actions", module="Module declenche", jours="Sur les N derniers jours")
+@app_commands.choices(module=[app_commands.Choice(name=P.commande, value=P.key) for P in PROTECTIONS])
+@is_owner()
+async def incidents(i, membre: Optional[discord.User] = None, module: Optional[str] = None,
+                    jours: Optional[app_commands.Range[int, 1, 3650]] = None):
+    # Les incidents encore en memoire sont ecrits avant la lecture
+    bot.incidents.vider()
+    uid = membre.id if membre else None
+    depuis = time.time() - jours * 86400 if jours else None
+    titre = "Historique des incidents" + (f" - {membre.name}" if membre else "") + (f" - {module}" if module else "")
+    await send_liste(i, Liste(titre, 'incidents', "Aucun incident", "Total: {} incident(s)",
+                              lambda g,cur,n: bot.db.get_incidents_page(g.id, cur, n, uid, module, depuis),
+                              lambda g: bot.db.count_incidents(g.id, uid, module, depuis), ligne_incident,
+                              filtre=(uid, module, jours)))
+
+@bot.tree.command(name="undo", description="Annuler une sanction, ou toutes celles d'un module")
+@app_commands.describe(sanction="Numero de la sanction (/sanctions)", module="Module dont annuler les sanctions",
+                       minutes="Fenetre pour le module (defaut 60)")
+@app_commands.choices(module=[app_commands.Choice(name=P.commande, value=P.key) for P in PROTECTIONS])
+@is_owner()
+async def undo(i, sanction: Optional[int] = None, module: Optional[str] = None,
+               minutes: app_commands.Range[int, 1, 1440] = 60):
+    if not i.guild:
+        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    if sanction is not None:
+        rows = [r for r in [bot.db.get_sanction(i.guild.id, sanction)] if r]
+    elif module:
+        rows = bot.db.get_sanctions_since(i.guild.id, module, datetime.now() - timedelta(minutes=minutes))
+    else: rows = []
+    if not rows:
+        e = discord.Embed(title="Erreur", description="Aucune sanction a annuler", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    await i.response.defer()
+    res = await asyncio.gather(*(annuler(i.guild, r, i.user.name) for r in rows))
+    ok = sum(res)
+    desc = f"{ok}/{len(rows)} sanction(s) annulee(s)"
+    if ok < len(rows): desc += "\nLes kicks ne peuvent pas etre annules, les echecs sont dans le journal"
+    e = discord.Embed(title="Annulation", description=desc, color=0xFFFFFF)
+    await i.followup.send(embed=e)
+
+@bot.tree.command(name="profile", description="Profiler les handlers en production")
+@app_commands.describe(duree="Duree en secondes (max 300)")
+@is_owner()
+async def profile(i, duree: app_commands.Range[int, 1, 300]):
+    if bot.profiler.actif:
+        e = discord.Embed(title="Erreur", description="Un profil est deja en cours", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    await i.response.defer(ephemeral=True)
+    path, resume = await bot.profiler.run(duree)
+    e = discord.Embed(title="Profil", description=f"```\n{resume[:4000]}\n```", color=0xFFFFFF)
+    await i.followup.send(embed=e, file=discord.File(path), ephemeral=True)
+
+@bot.tree.command(name="stats", description="Etat interne du bot")
+@is_owner()
+async def stats(i):
+    echecs = "\n".join(f"{h}: {n}" for h,n in bot.logs.echecs.most_common(15)) or "Aucun"
+    e = discord.Embed(title="Stats", color=0xFFFFFF)
+    e.add_field(name="Echecs par handler", value=echecs, inline=False)
+    e.add_field(name="Journal", value=f"En attente: {bot.logs.queue.qsize()}\nPerdus: {bot.logs.perdus}", inline=False)
+    sv = bot.sauvegardes
+    e.add_field(name="Minuteurs", value=f"En attente: {len(bot.minuteurs.tas)}\nExecutes: {bot.minuteurs.executes}", inline=False)
+    e.add_field(name="Echos", value=f"Ignores: {bot.echos.ignores}\nAttendus: {len(bot.echos.attendus)}", inline=False)
+    e.add_field(name="Sauvegardes", value=f"Ecrites: {sv.ecrites}\nInchangees: {sv.inchangees}\nA confirmer: {len(sv.vues)}", inline=False)
+    sc = bot.scheduler
+    jetes = ", ".join(f"{n}: {c}" for n,c in sc.jetes.most_common(5)) or "aucun"
+    e.add_field(name="File d'evenements", value=f"Profondeur: {sc.n}/{sc.taille} (max {sc.max})\nEn cours: {sc.en_cours}\nJetes: {jetes}", inline=False)
+    await i.response.send_message(embed=e, ephemeral=True)
+
 @bot.tree.command(name="set", description="Configurer limites")
 @app_commands.describe(action="Action", nombre="Nombre", duree="Duree (10s,5m,1h)")
-@app_commands.choices(action=[
-    app_commands.Choice(name="antideco", value="antideco"),
-    app_commands.Choice(name="antiban", value="antiban"),
-    app_commands.Choice(name="antirole", value="antirole"),
-    app_commands.Choice(name="antichannel", value="antichannel"),
-    app_commands.Choice(name="antiping", value="antiping"),
-    app_commands.Choice(name="antimodif", value="antimodif")
-])
+@app_commands.choices(action=[app_commands.Choice(name=P.limite, value=P.limite) for P in PROTECTIONS if P.limite])
 @is_owner()
 async def set_limit(i, action: str, nombre: int, duree: str):
     bot.db.set_action_limit(action, nombre, duree)
-    noms = {'antideco':'decos','antiban':'bans','antirole':'roles','antichannel':'salons','antiping':'pings','antimodif':'modifs'}
+    noms = {P.limite:P.unite for P in PROTECTIONS if P.limite}
     e = discord.Embed(title="Configuration limites", description=f"**{noms.get(action,action)}**\nNombre: {nombre}\nDuree: {duree}", color=0xFFFFFF)
     await i.response.send_message(embed=e)
 
+@bot.tree.command(name="seuils", description="Limites fixes, adaptatives ou les deux")
+@app_commands.describe(mode="fixe : limites de /set, adaptatif : niveau habituel du serveur, mixte : l'un ou l'autre")
+@app_commands.choices(mode=[app_commands.Choice(name=m, value=m) for m in ('fixe', 'adaptatif', 'mixte')])
+@is_owner()
+async def seuils(i, mode: str):
+    bot.seuils = mode
+    bot.db.set_meta('seuils', mode)
+    gid = i.guild.id if i.guild else None
+    appris = [a for (g, a) in bot.baselines.stats if g == gid and bot.baselines.pret((g, a))]
+    desc = f"Mode : **{mode}**\nActions apprises sur ce serveur : {', '.join(sorted(appris)) or 'aucune'}"
+    if mode == 'adaptatif': desc += "\nLes limites fixes restent appliquees tant qu'une action n'est pas apprise"
+    e = discord.Embed(title="Configuration seuils", description=desc, color=0xFFFFFF)
+    await i.response.send_message(embed=e)
+
 @bot.tree.command(name="punition", description="Configurer punitions")
-@app_commands.describe(action="Action", sanction="Sanction", duree="Duree pour tempmute")
-@app_commands.choices(action=[
-    app_commands.Choice(name="antibot", value="antibot"),
-    app_commands.Choice(name="antilink", value="antilink"),
-    app_commands.Choice(name="antiping", value="antiping"),
-    app_commands.Choice(name="antideco", value="antideco"),
-    app_commands.Choice(name="antichannel", value="antichannel"),
-    app_commands.Choice(name="antirole", value="antirank"),
-    app_commands.Choice(name="antiban", value="antiban"),
-    app_commands.Choice(name="antimodif", value="antimodif")
-])
+@app_commands.describe(action="Action", sanction="Sanction", duree="Duree pour tempmute, tempban, tempderank (10m, 12h, 60d)")
+@app_commands.choices(action=[app_commands.Choice(name=P.commande, value=P.key) for P in PROTECTIONS])
 @app_commands.choices(sanction=[
     app_commands.Choice(name="derank", value="derank"),
     app_commands.Choice(name="tempmute", value="tempmute"),
+    app_commands.Choice(name="tempderank", value="tempderank"),
+    app_commands.Choice(name="tempban", value="tempban"),
     app_commands.Choice(name="kick", value="kick"),
     app_commands.Choice(name="ban", value="ban")
 ])
 @is_owner()
 async def punition(i, action: str, sanction: str, duree: str = "0"):
+    try: dur = parse_duration(duree)
+    except ValueError: dur = None
+    if sanction in ('tempmute', 'tempban', 'tempderank') and not dur:
+        e = discord.Embed(title="Erreur", description=f"{sanction} demande une duree (ex: 10m, 12h, 60d)", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
     bot.db.set_punishment(action, sanction, duree)
     txt = f"{action} : {sanction}" + (f" ({duree})" if duree!="0" else "")
     e = discord.Embed(title="Configuration punitions", description=txt, color=0xFFFFFF)
     await i.response.send_message(embed=e)
 
-@bot.tree.command(name="antilink", description="Activer/desactiver antilink")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antilink(i, status: int):
-    bot.db.set_module_status('antilink', status)
-    e = discord.Embed(title="Configuration", description=f"Antilink : {'active' if status else 'desactive'}", color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antilink a ete change")
-        except: pass
-    if not status:
-        await asyncio.sleep(1)
-        bot.db.set_module_status('antilink', 1)
-
-@bot.tree.command(name="antibot", description="Activer/desactiver antibot")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antibot(i, status: int):
-    bot.db.set_module_status('antibot', status)
-    e = discord.Embed(title="Configuration", description=f"Antibot : {'active' if status else 'desactive'}", color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antibot a ete change")
-        except: pass
-    if not status:
-        await asyncio.sleep(1)
-        bot.db.set_module_status('antibot', 1)
-
-@bot.tree.command(name="antiban", description="Activer/desactiver antiban")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antiban(i, status: int):
-    bot.db.set_module_status('antiban', status)
-    e = discord.Embed(title="Configuration", description=f"Antiban : {'active' if status else 'desactive'}", color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antiban a ete change")
-        except: pass
-    if not status:
-        await asyncio.sleep(1)
-        bot.db.set_module_status('antiban', 1)
+def module_command(P):
+    # Commande on/off generee depuis le registre pour chaque protection
+    @app_commands.describe(status="On/Off")
+    @app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
+    @is_owner()
+    async def toggle(i, status: int):
+        # Chargement du module et activation (sauvegarde, inventaires) : REST possible au-dela de 3s
+        await i.response.defer()
+        try: await bot.set_module(P, status)
+        except Exception as ex: bot.logs.erreur('module', ex, module=P.key, status=status)
+        cog = bot.get_cog(P.__name__)
+        if status and cog is None:
+            e = discord.Embed(title="Erreur", description=f"{P.commande.capitalize()} : echec du chargement du module", color=0xFFFFFF)
+            await i.followup.send(embed=e)
+            return
+        desc = f"{P.commande.capitalize()} : {'active' if status else 'desactive'}"
+        if status:
+            extra = await cog.activation(i)
+            if extra: desc += f" - {extra}"
+            manque = bot.intents_manquants(P)
+            if manque: desc += f" - Redemarrage necessaire pour recevoir les evenements ({', '.join(manque)})"
+        e = discord.Embed(title="Configuration", description=desc, color=0xFFFFFF)
+        await i.followup.send(embed=e)
+        await notify_owners(bot, f"{P.commande} a ete change")
+    bot.tree.command(name=P.commande, description=f"Activer/desactiver {P.commande}")(toggle)
 
-@bot.tree.command(name="antiping", description="Activer/desactiver antiping")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antiping(i, status: int):
-    bot.db.set_module_status('antiping', status)
-    e = discord.Embed(title="Configuration", description=f"Antiping : {'active' if status else 'desactive'}", color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antiping a ete change")
-        except: pass
-    if not status:
-        await asyncio.sleep(1)
-        bot.db.set_module_status('antiping', 1)
+for P in PROTECTIONS:
+    module_command(P)
 
-@bot.tree.command(name="antideco", description="Activer/desactiver antideco")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antideco(i, status: int):
-    bot.db.set_module_status('antideco', status)
-    e = discord.Embed(title="Configuration", description=f"Antideco : {'active' if status else 'desactive'}", color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antideco a ete change")
-        except: pass
-    if not status:
-        await asyncio.sleep(1)
-        bot.db.set_module_status('antideco', 1)
-
-@bot.tree.command(name="antichannel", description="Activer/desactiver antichannel")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antichannel(i, status: int):
-    bot.db.set_module_status('antichannel', status)
-    e = discord.Embed(title="Configuration", description=f"Antichannel : {'active' if status else 'desactive'}", color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antichannel a ete change")
-        except: pass
-    if not status:
-        await asyncio.sleep(1)
-        bot.db.set_module_status('antichannel', 1)
+WL_CHOICES = [app_commands.Choice(name=f"{P.commande} - {P.wl_nom.capitalize()}", value=P.wl) for P in PROTECTIONS] + [
+    app_commands.Choice(name="all - Toutes les actions", value="all")
+]
 
-@bot.tree.command(name="antirole", description="Activer/desactiver antirole")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antirole(i, status: int):
-    bot.db.set_module_status('antirank', status)
-    e = discord.Embed(title="Configuration", description=f"Antirole : {'active' if status else 'desactive'}", color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antirole a ete change")
-        except: pass
-    if not status:
-        await asyncio.sleep(1)
-        bot.db.set_module_status('antirank', 1)
+def parse_wl_actions(action):
+    # Renvoie (cles, texte affiche), ou (None, None) si aucune action valide
+    if action == "all":
+        return list(WL_NOMS), "**toutes les actions**"
+    acts = [a.strip() for a in action.split(",") if a.strip() in WL_NOMS]
+    if not acts: return None, None
+    aff = [WL_NOMS[a] for a in acts]
+    if len(aff) == 1: return acts, f"**{aff[0]}**"
+    return acts, f"**{', '.join(aff[:-1])} et {aff[-1]}**"
 
-@bot.tree.command(name="antimodif", description="Activer/desactiver antimodif")
-@app_commands.describe(status="On/Off")
-@app_commands.choices(status=[app_commands.Choice(name="on", value=1), app_commands.Choice(name="off", value=0)])
-@is_owner()
-async def antimodif(i, status: int):
-    bot.db.set_module_status('antimodif', status)
-    if status:
-        bot.db.save_guild_backup(i.guild)
-        await bot.asset_manager.backup_guild_assets(i.guild)
-        desc = "Antimodif active - Serveur sauvegarde"
-    else:
-        desc = "Antimodif desactive"
-    e = discord.Embed(title="Configuration", description=desc, color=0xFFFFFF)
-    await i.response.send_message(embed=e)
-    for o in OWNER_IDS:
-        try:
-            u = await bot.fetch_user(o)
-            await u.send("antimodif a ete change")
-        except: pass
+async def wl_actions_invalides(i):
+    e = discord.Embed(
+        title="Erreur", 
+        description=f"Actions invalides. Utilise: {','.join(WL_NOMS)} ou all", 
+        color=0xFFFFFF
+    )
+    await i.response.send_message(embed=e, ephemeral=True)
 
 @bot.tree.command(name="add-wl", description="Ajouter whitelist")
 @app_commands.describe(
     user="Utilisateur à whitelist",
     action="Actions à autoriser (séparées par des virgules)"
 )
-@app_commands.choices(action=[
-    app_commands.Choice(name="antilink - Liens", value="link"),
-    app_commands.Choice(name="antiping - Pings", value="ping"),
-    app_commands.Choice(name="antideco - Décos", value="deco"),
-    app_commands.Choice(name="antichannel - Salons", value="channel"),
-    app_commands.Choice(name="antirole - Rôles", value="rank"),
-    app_commands.Choice(name="antibot - Bots", value="bot"),
-    app_commands.Choice(name="antiban - Bans", value="ban"),
-    app_commands.Choice(name="antimodif - Serveur", value="guild"),
-    app_commands.Choice(name="all - Toutes les actions", value="all")
-])
+@app_commands.choices(action=WL_CHOICES)
 @is_sys_or_owner()
 async def add_wl(i, user: discord.User, action: str):
     if not i.guild:
@@ -743,42 +3044,10 @@ async def add_wl(i, user: discord.User, action: str):
         await i.response.send_message(embed=e, ephemeral=True)
         return
     
-    # Mapping des actions
-    action_map = {
-        "link": "liens",
-        "ping": "pings",
-        "deco": "décos",
-        "channel": "salons",
-        "rank": "rôles",
-        "bot": "bots",
-        "ban": "bans",
-        "guild": "serveur"
-    }
-    
-    # Traitement des actions
-    if action == "all":
-        acts = ["link", "ping", "deco", "channel", "rank", "bot", "ban", "guild"]
-        aff = list(action_map.values())
-        desc_actions = "**toutes les actions**"
-    else:
-        # Split par virgules et nettoie
-        acts = [a.strip() for a in action.split(",") if a.strip() in action_map]
-        
-        if not acts:
-            e = discord.Embed(
-                title="Erreur", 
-                description="Actions invalides. Utilise: link,ping,deco,channel,rank,bot,ban,guild ou all", 
-                color=0xFFFFFF
-            )
-            await i.response.send_message(embed=e, ephemeral=True)
-            return
-        
-        aff = [action_map[a] for a in acts]
-        if len(aff) == 1:
-            desc_actions = f"**{aff[0]}**"
-        else:
-            dernier = aff.pop()
-            desc_actions = f"**{', '.join(aff)} et {dernier}**"
+    acts, desc_actions = parse_wl_actions(action)
+    if not acts:
+        await wl_actions_invalides(i)
+        return
     
     # Sauvegarde
     bot.db.add_whitelist(i.guild.id, user.id, ",".join(acts))
@@ -791,7 +3060,83 @@ async def add_wl(i, user: discord.User, action: str):
     )
     
     await i.response.send_message(embed=e)
-    
+
+@bot.tree.command(name="add-wlrole", description="Whitelist un role")
+@app_commands.describe(role="Role à whitelist", action="Actions à autoriser")
+@app_commands.choices(action=WL_CHOICES)
+@is_sys_or_owner()
+async def add_wlrole(i, role: discord.Role, action: str):
+    if not i.guild:
+        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    acts, desc_actions = parse_wl_actions(action)
+    if not acts:
+        await wl_actions_invalides(i)
+        return
+    bot.db.add_role_whitelist(i.guild.id, role.id, ",".join(acts))
+    e = discord.Embed(title="Whitelist", description=f"Les membres de {role.mention} sont whitelist pour : {desc_actions}", color=0xFFFFFF)
+    await i.response.send_message(embed=e)
+
+@bot.tree.command(name="del-wlrole", description="Retirer un role de la whitelist")
+@app_commands.describe(role="Role à retirer de la whitelist")
+@is_sys_or_owner()
+async def del_wlrole(i, role: discord.Role):
+    if not i.guild:
+        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    bot.db.remove_role_whitelist(i.guild.id, role.id)
+    e = discord.Embed(title="Whitelist", description=f"{role.mention} a été retiré de la whitelist.", color=0xFFFFFF)
+    await i.response.send_message(embed=e)
+
+@bot.tree.command(name="list-wlrole", description="Liste des roles whitelist")
+@is_sys_or_owner()
+async def list_wlrole(i):
+    await send_liste(i, LISTES['wlrole'])
+
+@bot.tree.command(name="wl-export", description="Exporter la whitelist en CSV")
+@is_sys_or_owner()
+async def wl_export(i):
+    if not i.guild:
+        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["type", "id", "actions"])
+    w.writerows(bot.db.export_whitelist(i.guild.id))
+    f = discord.File(io.BytesIO(buf.getvalue().encode()), filename=f"whitelist_{i.guild.id}.csv")
+    e = discord.Embed(title="Whitelist", description="Export effectue", color=0xFFFFFF)
+    await i.response.send_message(embed=e, file=f)
+
+@bot.tree.command(name="wl-import", description="Importer une whitelist CSV")
+@app_commands.describe(fichier="CSV type,id,actions (type user/role, actions vide = retrait)")
+@is_sys_or_owner()
+async def wl_import(i, fichier: discord.Attachment):
+    if not i.guild:
+        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
+        await i.response.send_message(embed=e, ephemeral=True)
+        return
+    await i.response.defer()
+    try:
+        rows = []
+        for n,row in enumerate(csv.reader(io.StringIO((await fichier.read()).decode('utf-8-sig'))), 1):
+            if not row or row[0].strip().lower() == "type": continue
+            typ, cid = row[0].strip().lower(), int(row[1])
+            actions = row[2].strip() if len(row) > 2 else ""
+            if typ not in ("user", "role"): raise ValueError(f"ligne {n}: type invalide")
+            acts = []
+            if actions:
+                acts, _ = parse_wl_actions(actions.replace(" ", ""))
+                if not acts: raise ValueError(f"ligne {n}: actions invalides")
+            rows.append((typ, cid, ",".join(acts)))
+        bot.db.import_whitelist(i.guild.id, rows)
+        e = discord.Embed(title="Whitelist", description=f"{len(rows)} ligne(s) importee(s)", color=0xFFFFFF)
+    except Exception as ex:
+        e = discord.Embed(title="Erreur", description=f"Erreur: {str(ex)}", color=0xFFFFFF)
+    await i.followup.send(embed=e)
+
 @bot.tree.command(name="del-wl", description="Retirer un utilisateur de la whitelist")
 @app_commands.describe(
     user="Utilisateur à retirer de la whitelist"
@@ -828,57 +3173,7 @@ async def del_wl(i, user: discord.User):
 @bot.tree.command(name="list-wl", description="Liste des utilisateurs whitelist")
 @is_sys_or_owner()
 async def list_wl(i):
-    if not i.guild:
-        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
-        await i.response.send_message(embed=e, ephemeral=True)
-        return
-    
-    wl = bot.db.get_whitelist(i.guild.id)
-    
-    if not wl:
-        e = discord.Embed(
-            title="Liste Whitelist",
-            description="Aucun utilisateur whitelist.",
-            color=0xFFFFFF
-        )
-        await i.response.send_message(embed=e)
-        return
-    
-    # Construction de la liste
-    description = ""
-    for uid, actions in wl:
-        user = bot.get_user(uid)
-        mention = user.mention if user else f"`{uid}`"
-        
-        # Formate les actions
-        action_list = actions.split(",")
-        action_names = []
-        for a in action_list:
-            if a == "link": action_names.append("liens")
-            elif a == "ping": action_names.append("pings")
-            elif a == "deco": action_names.append("décos")
-            elif a == "channel": action_names.append("salons")
-            elif a == "rank": action_names.append("rôles")
-            elif a == "bot": action_names.append("bots")
-            elif a == "ban": action_names.append("bans")
-            elif a == "guild": action_names.append("serveur")
-        
-        if len(action_names) == 1:
-            actions_str = f"**{action_names[0]}**"
-        else:
-            dernier = action_names.pop()
-            actions_str = f"**{', '.join(action_names)} et {dernier}**"
-        
-        description += f"{mention} → {actions_str}\n"
-    
-    e = discord.Embed(
-        title="Liste Whitelist",
-        description=description,
-        color=0xFFFFFF
-    )
-    e.set_footer(text=f"Total: {len(wl)} utilisateur(s)")
-    
-    await i.response.send_message(embed=e)
+    await send_liste(i, LISTES['wl'])
 
 @bot.tree.command(name="sys", description="Ajouter sys")
 @app_commands.describe(user="Utilisateur")
@@ -909,22 +3204,7 @@ async def sys_remove(i, user: discord.User):
 @bot.tree.command(name="list-sys", description="Liste sys")
 @is_sys_or_owner()
 async def list_sys(i):
-    if not i.guild:
-        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
-        await i.response.send_message(embed=e, ephemeral=True)
-        return
-    
-    sys = bot.db.get_sys(i.guild.id)
-    if not sys:
-        e = discord.Embed(title="**Liste sys**", description="Aucun utilisateur sur ce serveur", color=0xFFFFFF)
-    else:
-        desc = ""
-        for n,(uid,) in enumerate(sys,1):
-            u = bot.get_user(uid) or f"Inconnu({uid})"
-            desc += f"``{n}` {u}`\n`{uid}`\n---\n"
-        e = discord.Embed(title="**Liste sys**", description=desc, color=0xFFFFFF)
-        e.set_footer(text=f"Total: {len(sys)} sur ce serveur")
-    await i.response.send_message(embed=e)
+    await send_liste(i, LISTES['sys'])
 
 @bot.tree.command(name="add-limitrole", description="Ajouter role limite")
 @app_commands.describe(role="Role")
@@ -945,22 +3225,7 @@ async def del_limitrole(i, role: discord.Role):
 @bot.tree.command(name="limit-list", description="Liste roles limites")
 @is_sys_or_wl()
 async def limit_list(i):
-    if not i.guild:
-        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
-        await i.response.send_message(embed=e, ephemeral=True)
-        return
-    
-    roles = bot.db.get_limit_roles()
-    if not roles:
-        e = discord.Embed(title="**Liste roles limites**", description="Aucun role", color=0xFFFFFF)
-    else:
-        desc = ""
-        for rid,name in roles:
-            r = i.guild.get_role(rid)
-            desc += f"{r.mention if r else '@'+name}\n"
-        e = discord.Embed(title="**Liste roles limites**", description=desc, color=0xFFFFFF)
-        e.set_footer(text=f"roles : {len(roles)}")
-    await i.response.send_message(embed=e)
+    await send_liste(i, LISTES['limit'])
 
 @bot.tree.command(name="limit-ping", description="Configurer pings limites")
 @app_commands.describe(action="Add/Remove", cible="@role/@everyone/@here")
@@ -989,32 +3254,17 @@ async def limit_ping(i, action: str, cible: str):
                 bot.db.remove_limit_ping_role(str(role.id))
                 desc = f"{role.mention} n'est plus un role a ping limite"
             e = discord.Embed(title="Configuration pings", description=desc, color=0xFFFFFF)
-        except:
+        except commands.BadArgument:
             e = discord.Embed(title="Erreur", description="Cible invalide", color=0xFFFFFF)
+        except Exception as ex:
+            bot.logs.erreur('limit_ping', ex, guild=i.guild_id)
+            e = discord.Embed(title="Erreur", description="Configuration impossible", color=0xFFFFFF)
     await i.response.send_message(embed=e)
 
 @bot.tree.command(name="list-limit-ping", description="Liste pings limites")
 @is_sys_or_wl()
 async def list_limit_ping(i):
-    if not i.guild:
-        e = discord.Embed(title="Erreur", description="Cette commande doit être utilisée dans un serveur", color=0xFFFFFF)
-        await i.response.send_message(embed=e, ephemeral=True)
-        return
-    
-    roles = bot.db.get_limit_ping_roles()
-    if not roles:
-        e = discord.Embed(title="**Liste pings limites**", description="Aucune configuration", color=0xFFFFFF)
-    else:
-        desc = ""
-        for rid,name in roles:
-            if rid.startswith("special_"):
-                desc += f"@{name}\n"
-            else:
-                r = i.guild.get_role(int(rid))
-                desc += f"{r.mention if r else '@'+name}\n"
-        e = discord.Embed(title="**Liste pings limites**", description=desc, color=0xFFFFFF)
-        e.set_footer(text=f"elements : {len(roles)}")
-    await i.response.send_message(embed=e)
+    await send_liste(i, LISTES['limit_ping'])
 
 @bot.tree.command(name="setlogs", description="Configurer logs publics")
 @app_commands.describe(salon="Salon (vide pour desactiver)")
@@ -1084,312 +3334,49 @@ async def logsown_status(i):
         e = discord.Embed(title="Logs prives", description=f"Salon : {c.mention if c else 'introuvable'}", color=0xFFFFFF)
     await i.response.send_message(embed=e)
 
-@bot.event
-async def on_message(msg):
-    if msg.author.bot or not msg.guild: return
-    
-    if bot.db.get_module_status('antilink'):
-        if re.search(DISCORD_INVITE_REGEX, msg.content, re.IGNORECASE):
-            if not (bot.db.is_sys(msg.guild.id, msg.author.id) or bot.db.is_whitelisted(msg.guild.id, msg.author.id, 'link')):
-                await msg.delete()
-                await msg.channel.send(f"{msg.author.mention} vous n'etes pas autorise a envoyer des liens")
-                s,_ = bot.db.get_punishment('antilink')
-                suc = True
-                try:
-                    if s=='kick': await msg.author.kick(reason="Anti-link")
-                    elif s=='ban': await msg.author.ban(reason="Anti-link")
-                except: suc = False
-                await send_punishment_log(bot, msg.guild.id, "moderation", "envoye un lien", msg.author, s, suc=suc)
-    
-    if bot.db.get_module_status('antiping'):
-        can = bot.db.is_sys(msg.guild.id, msg.author.id) or bot.db.is_whitelisted(msg.guild.id, msg.author.id, 'ping')
-        if msg.mention_everyone:
-            if bot.db.is_limit_ping_role("special_everyone") and not can:
-                await msg.delete()
-                await msg.channel.send(f"{msg.author.mention} vous n'etes pas autorise a utiliser @everyone")
-                bot.tracker.add_action(msg.author.id, 'everyone_ping')
-                n,d = bot.db.get_action_limit('antiping')
-                if n and d:
-                    sec = int(d[:-1])
-                    if bot.tracker.get_recent_actions(msg.author.id, 'everyone_ping', sec) >= n:
-                        s,_ = bot.db.get_punishment('antiping')
-                        await apply_sanction(msg.author, 'antiping', "Anti-ping: @everyone", n)
-                        await send_punishment_log(bot, msg.guild.id, "moderation", "mentionne @everyone", msg.author, s, nb=n, tmp=d)
-        if msg.role_mentions:
-            for r in msg.role_mentions:
-                if bot.db.is_limit_ping_role(str(r.id)) and not can:
-                    await msg.delete()
-                    await msg.channel.send(f"{msg.author.mention} vous n'etes pas autorise a mentionner le role `@{r.name}`")
-                    bot.tracker.add_action(msg.author.id, 'role_ping')
-                    n,d = bot.db.get_action_limit('antiping')
-                    if n and d:
-                        sec = int(d[:-1])
-                        if bot.tracker.get_recent_actions(msg.author.id, 'role_ping', sec) >= n:
-                            s,_ = bot.db.get_punishment('antiping')
-                            await apply_sanction(msg.author, 'antiping', "Anti-ping: roles limites", n)
-                            await send_punishment_log(bot, msg.guild.id, "moderation", "mentionne un role limite", msg.author, s, role=r, nb=n, tmp=d)
-                    break
-    
-    await bot.process_commands(msg)
-
 @bot.event
 async def on_member_join(m):
-    if not m.guild: return
-    
+    if m.id in bot.db.threats and m.guild.id in bot.db.federation:
+        await bot.apply_threat(m.guild, m, "Federation: menace connue")
     if m.bot:
-        for o in OWNER_IDS:
-            try:
-                u = await bot.fetch_user(o)
-                await u.send(f"{m.name} a ete ajoute au serveur {m.guild.name}")
-            except: pass
-        
-        if bot.db.get_module_status('antibot'):
-            await asyncio.sleep(1)
-            async for e in m.guild.audit_logs(limit=5, action=discord.AuditLogAction.bot_add):
-                if e.target.id == m.id:
-                    inv = e.user
-                    if not (bot.db.is_sys(m.guild.id, inv.id) or bot.db.is_whitelisted(m.guild.id, inv.id, 'bot')):
-                        s,_ = bot.db.get_punishment('antibot')
-                        suc = True
-                        try:
-                            if s=='kick':
-                                await inv.kick(reason="Anti-bot")
-                                await m.kick(reason="Anti-bot")
-                            elif s=='ban':
-                                await inv.ban(reason="Anti-bot")
-                                await m.ban(reason="Anti-bot")
-                            elif s=='derank':
-                                await inv.edit(roles=[], reason="Anti-bot")
-                                await m.kick(reason="Anti-bot")
-                        except: suc = False
-                        await send_punishment_log(bot, m.guild.id, "owner_logs", "ajoute un bot", inv, s, suc=suc, det=f"Bot: {m.name}")
-                    break
+        await notify_owners(bot, f"{m.name} a ete ajoute au serveur {m.guild.name}")
 
 @bot.event
-async def on_member_ban(g, u):
-    if not g: return
-    
-    if bot.db.get_module_status('antiban'):
-        async for e in g.audit_logs(limit=1, action=discord.AuditLogAction.ban):
-            if e.target.id == u.id:
-                if not (bot.db.is_sys(g.id, e.user.id) or bot.db.is_whitelisted(g.id, e.user.id, 'ban')):
-                    bot.tracker.add_action(e.user.id, 'ban')
-                    n,d = bot.db.get_action_limit('antiban')
-                    if n and d:
-                        sec = int(d[:-1])
-                        cnt = bot.tracker.get_recent_actions(e.user.id, 'ban', sec)
-                        if cnt >= n:
-                            s,_ = bot.db.get_punishment('antiban')
-                            await apply_sanction(e.user, 'antiban', "Anti-ban: trop de bans", cnt)
-                            await send_punishment_log(bot, g.id, "owner_logs", "banni un membre", e.user, s, nb=cnt, tmp=d, det=f"Membre: {u.name}")
-                break
-
-@bot.event
-async def on_voice_state_update(m, b, a):
-    if not m.guild: return
-    
-    if bot.db.get_module_status('antideco'):
-        if (b.channel and not a.channel) or (b.channel and a.channel and b.channel != a.channel):
-            async for e in m.guild.audit_logs(limit=1, action=discord.AuditLogAction.member_disconnect):
-                if e.target.id == m.id:
-                    mod = e.user
-                    typ = "deconnecte"
-                    break
-            else:
-                async for e in m.guild.audit_logs(limit=1, action=discord.AuditLogAction.member_move):
-                    if e.target.id == m.id:
-                        mod = e.user
-                        typ = "deplace"
-                        break
-                else: return
-            
-            if not (bot.db.is_sys(m.guild.id, mod.id) or bot.db.is_whitelisted(m.guild.id, mod.id, 'deco')):
-                bot.tracker.add_action(mod.id, 'deco')
-                n,d = bot.db.get_action_limit('antideco')
-                if n and d:
-                    sec = int(d[:-1])
-                    cnt = bot.tracker.get_recent_actions(mod.id, 'deco', sec)
-                    if cnt >= n:
-                        s,_ = bot.db.get_punishment('antideco')
-                        await apply_sanction(mod, 'antideco', f"Anti-deco: trop de {typ}s forces", cnt)
-                        await send_punishment_log(bot, m.guild.id, "moderation", f"{typ} un membre", mod, s, nb=cnt, tmp=d, det=f"Membre: {m.name}")
-
-@bot.event
-async def on_guild_channel_create(c):
-    if not c.guild: return
-    
-    if bot.db.get_module_status('antichannel'):
-        async for e in c.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_create):
-            if not (bot.db.is_sys(c.guild.id, e.user.id) or bot.db.is_whitelisted(c.guild.id, e.user.id, 'channel')):
-                bot.tracker.add_action(e.user.id, 'channel_create')
-                n,d = bot.db.get_action_limit('antichannel')
-                if n and d:
-                    sec = int(d[:-1])
-                    cnt = bot.tracker.get_recent_actions(e.user.id, 'channel_create', sec)
-                    if cnt >= n:
-                        await c.delete()
-                        s,_ = bot.db.get_punishment('antichannel')
-                        await apply_sanction(e.user, 'antichannel', "Anti-channel: trop de creations", cnt)
-                        await send_punishment_log(bot, c.guild.id, "owner_logs", "cree un salon", e.user, s, nb=cnt, tmp=d, det=f"Salon: {c.name}")
-                    else: await c.delete()
-                break
-
-@bot.event
-async def on_guild_channel_delete(c):
-    if not c.guild: return
+async def on_member_update(b,a):
+    if not a.guild: return
     
-    if bot.db.get_module_status('antichannel'):
-        async for e in c.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_delete):
-            if not (bot.db.is_sys(c.guild.id, e.user.id) or bot.db.is_whitelisted(c.guild.id, e.user.id, 'channel')):
-                bot.tracker.add_action(e.user.id, 'channel_delete')
-                n,d = bot.db.get_action_limit('antichannel')
-                if n and d:
-                    sec = int(d[:-1])
-                    cnt = bot.tracker.get_recent_actions(e.user.id, 'channel_delete', sec)
-                    if cnt >= n:
-                        s,_ = bot.db.get_punishment('antichannel')
-                        await apply_sanction(e.user, 'antichannel', "Anti-channel: trop de suppressions", cnt)
-                        await send_punishment_log(bot, c.guild.id, "owner_logs", "supprime un salon", e.user, s, nb=cnt, tmp=d, det=f"Salon: {c.name}")
-                break
-
-@bot.event
-async def on_guild_channel_update(b,a):
-    if not b.guild: return
-    
-    if bot.db.get_module_status('antichannel'):
-        if b.name!=a.name or b.category!=a.category or b.overwrites!=a.overwrites:
-            async for e in b.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_update):
-                if not (bot.db.is_sys(b.guild.id, e.user.id) or bot.db.is_whitelisted(b.guild.id, e.user.id, 'channel')):
-                    bot.tracker.add_action(e.user.id, 'channel_update')
-                    n,d = bot.db.get_action_limit('antichannel')
-                    if n and d:
-                        sec = int(d[:-1])
-                        cnt = bot.tracker.get_recent_actions(e.user.id, 'channel_update', sec)
-                        try: await a.edit(name=b.name, category=b.category, overwrites=b.overwrites)
-                        except: pass
-                        if cnt >= n:
-                            s,_ = bot.db.get_punishment('antichannel')
-                            await apply_sanction(e.user, 'antichannel', "Anti-channel: trop de modifications", cnt)
-                            await send_punishment_log(bot, b.guild.id, "owner_logs", "modifie un salon", e.user, s, nb=cnt, tmp=d, det=f"Salon: {a.name}")
-                    break
-
-@bot.event
-async def on_guild_role_create(r):
-    if not r.guild: return
-    
-    if bot.db.get_module_status('antirank'):
-        async for e in r.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_create):
-            if not (bot.db.is_sys(r.guild.id, e.user.id) or bot.db.is_whitelisted(r.guild.id, e.user.id, 'rank')):
-                bot.tracker.add_action(e.user.id, 'role_create')
-                n,d = bot.db.get_action_limit('antirole')
-                if n and d:
-                    sec = int(d[:-1])
-                    cnt = bot.tracker.get_recent_actions(e.user.id, 'role_create', sec)
-                    if cnt >= n:
-                        await r.delete()
-                        s,_ = bot.db.get_punishment('antirank')
-                        await apply_sanction(e.user, 'antirank', "Anti-role: trop de creations", cnt)
-                        await send_punishment_log(bot, r.guild.id, "owner_logs", "cree un role", e.user, s, nb=cnt, tmp=d, det=f"Role: {r.name}")
-                    else: await r.delete()
-                break
+    if len(b.roles) < len(a.roles):
+        await verifier_roles(a, [r for r in a.roles if r not in b.roles])
 
 @bot.event
-async def on_guild_role_delete(r):
-    if not r.guild: return
-    
-    if bot.db.get_module_status('antirank'):
-        async for e in r.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_delete):
-            if not (bot.db.is_sys(r.guild.id, e.user.id) or bot.db.is_whitelisted(r.guild.id, e.user.id, 'rank')):
-                bot.tracker.add_action(e.user.id, 'role_delete')
-                n,d = bot.db.get_action_limit('antirole')
-                if n and d:
-                    sec = int(d[:-1])
-                    cnt = bot.tracker.get_recent_actions(e.user.id, 'role_delete', sec)
-                    if cnt >= n:
-                        s,_ = bot.db.get_punishment('antirank')
-                        await apply_sanction(e.user, 'antirank', "Anti-role: trop de suppressions", cnt)
-                        await send_punishment_log(bot, r.guild.id, "owner_logs", "supprime un role", e.user, s, nb=cnt, tmp=d, det=f"Role: {r.name}")
-                break
+async def on_member_hors_cache(m):
+    # Mode lean : etat precedent inconnu. Un pseudo ou un avatar change aussi passe ici,
+    # seuls les roles limites que l'audit montre ajoutes a l'instant sont donc verifies
+    if not any(bot.db.is_limit_role(r.id) for r in m.roles): return
+    _, new = await roles_ajoutes(m)
+    await verifier_roles(m, new)
 
-@bot.event
-async def on_guild_role_update(b,a):
-    if not b.guild: return
-    
-    if bot.db.get_module_status('antirank') and b.permissions != a.permissions:
-        async for e in b.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_update):
-            if not (bot.db.is_sys(b.guild.id, e.user.id) or bot.db.is_whitelisted(b.guild.id, e.user.id, 'rank')):
-                bot.tracker.add_action(e.user.id, 'role_update')
-                n,d = bot.db.get_action_limit('antirole')
-                if n and d:
-                    sec = int(d[:-1])
-                    cnt = bot.tracker.get_recent_actions(e.user.id, 'role_update', sec)
-                    try: await a.edit(permissions=b.permissions)
-                    except: pass
-                    if cnt >= n:
-                        s,_ = bot.db.get_punishment('antirank')
-                        await apply_sanction(e.user, 'antirank', "Anti-role: trop de modifications", cnt)
-                        await send_punishment_log(bot, b.guild.id, "owner_logs", "modifie un role", e.user, s, nb=cnt, tmp=d, det=f"Role: {a.name}")
-                break
-
-@bot.event
-async def on_guild_update(b,a):
-    if not a.guild: return
-    
-    if bot.db.get_module_status('antimodif'):
-        bk = bot.db.get_guild_backup(a.id)
-        if not bk:
-            bot.db.save_guild_backup(a)
-            return
-        
-        async for e in a.audit_logs(limit=1, action=discord.AuditLogAction.guild_update):
-            if not (bot.db.is_sys(a.id, e.user.id) or bot.db.is_whitelisted(a.id, e.user.id, 'guild')):
-                mods = []
-                if b.name != a.name:
-                    mods.append("le nom")
-                    try: await a.edit(name=bk[1])
-                    except: pass
-                if b.icon != a.icon:
-                    mods.append("la photo")
-                    await bot.asset_manager.restore_guild_icon(a)
-                if b.banner != a.banner:
-                    mods.append("la banniere")
-                    await bot.asset_manager.restore_guild_banner(a)
-                if hasattr(b,'vanity_url_code') and b.vanity_url_code != a.vanity_url_code:
-                    mods.append("l'url")
-                if b.verification_level != a.verification_level:
-                    mods.append("le niveau de verification")
-                    try: await a.edit(verification_level=bk[5])
-                    except: pass
-                
-                if mods:
-                    bot.tracker.add_action(e.user.id, 'guild_modify')
-                    txt = mods[0] if len(mods)==1 else ", ".join(mods[:-1]) + " et " + mods[-1]
-                    n,d = bot.db.get_action_limit('antimodif')
-                    if n and d:
-                        sec = int(d[:-1])
-                        cnt = bot.tracker.get_recent_actions(e.user.id, 'guild_modify', sec)
-                        if cnt >= n:
-                            s,_ = bot.db.get_punishment('antimodif')
-                            await apply_sanction(e.user, 'antimodif', f"Anti-modif: {txt}", cnt)
-                            await send_punishment_log(bot, a.id, "owner_logs", "modifie le serveur", e.user, s, mod=txt, nb=cnt, tmp=d)
-                    
-                    for o in OWNER_IDS:
-                        try:
-                            u = await bot.fetch_user(o)
-                            await u.send(f"@{e.user.name} à modifier {txt} du serveur")
-                        except: pass
-                break
+async def roles_ajoutes(m, fenetre=10):
+    # Entree d'audit recente qui a ajoute des roles au membre, et ces roles ;
+    # (None, []) si aucun ajout de role n'explique la mise a jour
+    try:
+        async for e in m.guild.audit_logs(limit=5, action=discord.AuditLogAction.member_role_update):
+            if not e.target or e.target.id != m.id: continue
+            if discord.utils.utcnow() - e.created_at > timedelta(seconds=fenetre): break
+            ids = {r.id for r in getattr(e.changes.after, 'roles', None) or []}
+            return e, [r for r in m.roles if r.id in ids]
+    except discord.HTTPException as ex: bot.logs.erreur('roles_ajoutes', ex, guild=m.guild.id, user=m.id)
+    return None, []
 
-@bot.event
-async def on_member_update(b,a):
-    if not a.guild: return
-    
-    if len(b.roles) < len(a.roles):
-        new = [r for r in a.roles if r not in b.roles]
-        for r in new:
-            if bot.db.is_limit_role(r.id):
-                if not (bot.db.is_sys(a.guild.id, a.id) or bot.db.is_whitelisted(a.guild.id, a.id)):
-                    await a.remove_roles(r, reason="Role limite")
+async def verifier_roles(a, new):
+    # La whitelist par role se juge sur les roles d'avant l'ajout : un role limite qui est
+    # aussi whitelist ne doit pas exempter le membre qui vient de le recevoir
+    avant = [r for r in a.roles if r not in new]
+    for r in new:
+        if bot.db.is_limit_role(r.id):
+            if not (bot.db.is_sys(a.guild.id, a.id) or bot.db.is_whitelisted(a.guild.id, a.id)
+                    or bot.db.is_role_whitelisted(a.guild.id, avant)):
+                await a.remove_roles(r, reason="Role limite")
 
 if __name__ == "__main__":
     bot.run(BOT_TOKEN)
\ No newline at end of file